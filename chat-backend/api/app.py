@@ -1,3 +1,4 @@
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 print("this worked too")
@@ -43,6 +44,19 @@ def create_app():
     app.include_router(chat_router)
     app.include_router(graph_router)
     app.include_router(http_stream_router)
+
+    @app.on_event("startup")
+    def warm_embedding_model():
+        # Load the embedding model off the startup path so serving isn't gated on torch
+        if os.getenv("EMBEDDING_WARMUP", "true").lower() in ("true", "1", "t"):
+            from embeddings import model_manager
+            model_manager.warmup_in_background()
+
+    @app.on_event("shutdown")
+    def close_embedding_pool():
+        # Bulk-encode workers would otherwise outlive the server
+        from embeddings import close_pool
+        close_pool()
     
     return app
 
@@ -6,12 +6,16 @@ from models import ChatRequest
 print("hello")
 from db import (
     store_message, get_recent_messages, get_by_ids,
-    get_account, get_chat, update_message  # Added update_message
+    get_account, get_chat, update_message,  # Added update_message
+    register_vector_hooks,
+    aget_account, aget_chat, aget_recent_messages, astore_message, aupdate_message,
+    asearch_messages, aget_messages, register_text_hooks, messages_col
 )
 print("beans")
 #from embeddings import get_embedding, rerank, trim_relevant_rags
 print("hi again")
-from vectorstore import VectorStore
+from vectorstore import VectorStore, ShardCoordinator
+from retrieval import HybridRetriever, BM25Index, SelectionStage, RetrievalCache
 from summarizer import summarize_history, summarize_5_word, summarize_3_bullet
 from llm import run_llm, chat_stream, get_model_path, get_model_type, MODEL_CONFIGS, get_model
 from auth import verify_api_key
@@ -21,6 +25,7 @@ import uuid
 import logging
 import json
 import asyncio
+import os
 print("these worked")
 
 
@@ -29,6 +34,79 @@ logger.setLevel(logging.INFO)
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 vs = VectorStore(dim=768)
+# With $FAISS_SHARD_URLS set, dense retrieval scatter-gathers over shard servers instead of vs
+shards = ShardCoordinator.from_env()
+
+
+def _vector_store_for(account_id):
+    """The store holding an account's vectors: its shard server, or vs"""
+    return shards.store_for(account_id) if shards is not None else vs
+
+
+def _remove_chat_vectors(chat_id, faiss_ids, account_id=None):
+    """db.delete_chat hook: drop the chat's vectors from the store"""
+    store = _vector_store_for(account_id)
+    store.remove(faiss_ids)
+    store.remove_conversation(chat_id)
+
+
+def _reembed_message(faiss_id, text, account_id=None):
+    """db.update_message hook: store the edited text's vector, returns its new faiss_id"""
+    from embeddings import get_embedding
+    return _vector_store_for(account_id).update(faiss_id, get_embedding(text), message=text)
+
+
+register_vector_hooks(on_chat_deleted=_remove_chat_vectors, on_message_edited=_reembed_message)
+
+
+# In-process BM25 over message text/response; snapshots in $BM25_INDEX_PATH, kept current by db hooks
+text_index = BM25Index(os.getenv("BM25_INDEX_PATH", "bm25_index") or None)
+register_text_hooks(on_stored=text_index.add, on_removed=text_index.remove)
+text_index.start_sync(messages_col)
+
+
+async def _lexical_leg(query, account_id, limit):
+    """Keyword hits from the account's messages"""
+    if not text_index.ready:
+        # Still building the index on first start: Mongo's $text index covers meanwhile
+        return await asearch_messages(account_id, query, limit)
+    hits = text_index.search(account_id, query, limit)
+    if not hits:
+        return []
+    docs = {str(doc["_id"]): doc for doc in await aget_messages([message_id for message_id, _ in hits])}
+    # Ids Mongo no longer has were deleted by another worker
+    stale = [message_id for message_id, _ in hits if message_id not in docs]
+    if stale:
+        text_index.remove(stale)
+    return [{**docs[message_id], "text_score": score} for message_id, score in hits if message_id in docs]
+
+
+async def _dense_leg(query, account_id, limit):
+    """Nearest vectors to the query within the account"""
+    from embeddings import get_embedding_async
+    embedding = await get_embedding_async(query)
+    return await (shards or vs).asearch(embedding, k=limit, account_id=account_id,
+                                        fields=("faiss_id", "message", "conversation_id", "account_id", "timestamp"))
+
+
+async def _embed_texts(texts):
+    """Embedding matrix for reference selection (cache hits are free; misses encode in one batch)"""
+    from embeddings import get_embeddings
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, get_embeddings, texts)
+
+
+def _index_generation(account_id):
+    """Changes to either index invalidate the account's cached retrievals"""
+    return ((shards or vs).generation(account_id), text_index.generation(account_id))
+
+
+# Shared by /messages/search and chat context; context references are
+# recency-weighted and MMR-diversified before they reach the prompt. Selection
+# reuses vs's stored vectors; shard servers don't return theirs, so those hits are encoded
+retriever = HybridRetriever({"lexical": _lexical_leg, "dense": _dense_leg},
+                            selector=SelectionStage(_embed_texts, vectors=vs.avectors if shards is None else None),
+                            cache=RetrievalCache(), generation=_index_generation)
 
 
 def chat_logic(req: ChatRequest):
@@ -134,30 +212,36 @@ def chat_route(req: ChatRequest):
 async def stream_chat(req: ChatRequest):
     """Stream chat response using HTTP streaming"""
     try:
-        # Verify account and chat
-        account = get_account(req.account_id)
+        # Verify account and chat, fetching the recent messages and retrieved context alongside
+        account, chat, recent, retrieved = await asyncio.gather(
+            aget_account(req.account_id),
+            aget_chat(req.conversation_id),
+            aget_recent_messages(req.conversation_id, as_dict=True),
+            retriever.context(req.message, req.account_id)
+        )
         if not account:
             return JSONResponse(
                 content={"error": "Invalid account ID"}, 
                 status_code=400
             )
             
-        chat = get_chat(req.conversation_id)
         if not chat:
             return JSONResponse(
                 content={"error": "Invalid chat ID"}, 
                 status_code=400
             )
         # Build prompt with context
-        recent = get_recent_messages(req.conversation_id, as_dict=True)
         model_profile = req.model or "default"
         model_path = get_model_path(model_profile)
         model_type = get_model_type(model_profile)
         
+        # Already in the prompt as recent history
+        recent_texts = {msg["content"] for msg in recent}
+        retrieved = [text for text in retrieved if text not in recent_texts]
         prompt = build_model_specific_prompt(
             message=req.message,
             recent=recent,
-            retrieved=[],
+            retrieved=retrieved,
             system_prompt=account.get("system_prompt"),
             model_path=model_path
         )
@@ -171,7 +255,7 @@ async def stream_chat(req: ChatRequest):
             prompt,
             model_profile,
             0,
-            ""
+            retrieved
         )
 
         # Debug check: log the type to be sure it's an async generator
@@ -234,7 +318,7 @@ async def stream_chat_response(
             from summarizer import get_tracker, check_and_summarize, summarize_5_word, summarize_3_bullet
             
             # Generate summaries
-            recent_msgs = get_recent_messages(conversation_id, limit=50, as_dict=True)
+            recent_msgs = await aget_recent_messages(conversation_id, limit=50, as_dict=True)
             recent_msgs.insert(0, {"role": "user", "content": user_message})
             recent_msgs.insert(0, {"role": "assistant", "content": full_response})
             
@@ -254,13 +338,13 @@ async def stream_chat_response(
                 update_data_cleaned = {k: v for k, v in update_data.items() if v is not None}
                 if update_data_cleaned:
                     try:
-                        update_message(message_id=original_message_id, **update_data_cleaned)
+                        await aupdate_message(original_message_id, **update_data_cleaned)
                     except Exception as e:
                         logger.exception(f"Error updating message {original_message_id} in stream_chat_response: {e}")
             else:
                 # This case should ideally not happen if client follows protocol (POST /messages first)
                 logger.warning("original_message_id not provided to stream_chat_response. Storing as new message (potential duplicate).")
-                store_message(
+                await astore_message(
                     account_id, conversation_id, user_message,
                     full_response, faiss_id, bullets, title
                 )
@@ -326,6 +410,31 @@ def get_available_models():
         })
     return {"models": models}
 
+@router.get("/embeddings/status")
+def embedding_status():
+    """Readiness of the embedding model plus batching/cache counters"""
+    from embeddings import model_manager, batcher, get_cache
+    return {
+        "model": model_manager.status(),
+        "batcher": batcher.stats(),
+        "cache": get_cache().stats()
+    }
+
+@router.get("/retrieval/status")
+def retrieval_status():
+    """Hybrid retrieval settings, per-leg timeout/error counters and the BM25 index"""
+    status = {**retriever.stats(), "bm25": text_index.stats()}
+    if shards is not None:
+        status["shards"] = shards.stats()
+    return status
+
+@router.get("/vectors/consistency")
+def vector_consistency(check: bool = False, repair: bool = False):
+    """Last FAISS/Mongo consistency report; check=true runs a fresh one (repair=true also fixes it)"""
+    if check:
+        return vs.check_consistency(repair=repair)
+    return vs.consistency.last_report or {"status": "pending"}
+
 @router.post("/models/{model_id}/preload")
 def preload_model(model_id: str):
     """Preload a specific model"""
@@ -342,7 +451,12 @@ def preload_model(model_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to preload model: {str(e)}")
 
 @router.post("/rag/trim")
-def trim_rag(query: str = Body(...), chunks: list[str] = Body(...), sim_threshold: float = Body(0.5), rag_auto_trim: bool = Body(True)):
+def trim_rag(query: str = Body(...), chunks: list[str] = Body(...), sim_threshold: float = Body(0.5), rag_auto_trim: bool = Body(True), top_k: Optional[int] = Body(None)):
     """Trim RAG chunks based on relevance"""
-    return {"useful_chunks": chunks}
+    if not rag_auto_trim or not chunks:
+        return {"useful_chunks": chunks}
+
+    # Imported here so the route module doesn't load the embedding model at import time
+    from embeddings import trim_relevant_rags
+    return {"useful_chunks": trim_relevant_rags(query, chunks, sim_threshold, top_k)}
 
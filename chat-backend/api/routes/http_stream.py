@@ -9,10 +9,10 @@ import json
 import logging
 from typing import AsyncGenerator, Optional
 
-from api.routes.chat import chat_stream, get_recent_messages, get_account, get_chat
+from api.routes.chat import chat_stream, retriever
 from prompt_builders import build_model_specific_prompt
 from llm import get_model_path
-from db import update_message  # For updating the original message
+from db import aget_account, aget_chat, aget_recent_messages, astore_message, aupdate_message
 
 router = APIRouter(prefix="/http", tags=["HTTP Streaming"])
 logger = logging.getLogger(__name__)
@@ -33,8 +33,13 @@ async def http_stream_chat(request: StreamRequest):
     print(f"Original Message ID: '{request.original_message_id}'")
     
     try:
-        # Verify account and chat
-        account = get_account(request.account_id)
+        # Verify account and chat, fetching the recent messages and retrieved context alongside
+        account, chat, recent, retrieved = await asyncio.gather(
+            aget_account(request.account_id),
+            aget_chat(request.conversation_id),
+            aget_recent_messages(request.conversation_id, as_dict=True),
+            retriever.context(request.message, request.account_id)
+        )
         if not account:
             return Response(
                 content=json.dumps({"error": "Invalid account ID"}), 
@@ -42,7 +47,6 @@ async def http_stream_chat(request: StreamRequest):
                 media_type="application/json"
             )
             
-        chat = get_chat(request.conversation_id)
         if not chat:
             return Response(
                 content=json.dumps({"error": "Invalid chat ID"}), 
@@ -55,8 +59,7 @@ async def http_stream_chat(request: StreamRequest):
         if request.original_message_id.startswith('temp-'):
             print(f"⚠️  Frontend sent temp ID, creating message in database first...")
             try:
-                from db import store_message
-                result = store_message(
+                result = await astore_message(
                     request.account_id,
                     request.conversation_id,
                     request.message,
@@ -76,15 +79,15 @@ async def http_stream_chat(request: StreamRequest):
                 # Continue with temp ID, update will handle gracefully
         
         # Build prompt with context
-        recent = get_recent_messages(request.conversation_id, as_dict=True)
         model_profile = chat.get("model_profile", "default")
         model_path = get_model_path(model_profile)
         
         # Build model-specific prompt (all models now return strings)
+        recent_texts = {msg["content"] for msg in recent}
         prompt = build_model_specific_prompt(
             message=request.message,
             recent=recent,
-            retrieved=[],  # Simplified for now
+            retrieved=[text for text in retrieved if text not in recent_texts],
             system_prompt=account.get("system_prompt"),
             model_path=model_path
         )
@@ -199,8 +202,8 @@ async def stream_llm_response(
             
             if update_data_cleaned:
                 try:
-                    result = update_message(
-                        message_id=original_message_id,
+                    result = await aupdate_message(
+                        original_message_id,
                         **update_data_cleaned
                     )
                     logger.info(f"Update message result: {result}")
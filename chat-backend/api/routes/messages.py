@@ -6,9 +6,12 @@ from db import (
     update_message,
     search_messages, 
     get_account, 
-    get_chat
+    get_chat,
+    aget_account,
+    aget_account_messages
 )
 from api.utils import object_id_to_str
+from api.routes.chat import retriever
 
 router = APIRouter(prefix="/messages", tags=["messages"])
 
@@ -117,14 +120,41 @@ def update_existing_message(message_id: str, updates: Dict[str, Any] = Body(...)
 # Chat-specific message routes have been moved to chats.py
 
 @router.post("/search", response_model=List[dict])
-def search_account_messages(search: SearchQuery):
+async def search_account_messages(search: SearchQuery):
     # Verify account exists
-    account = get_account(search.account_id)
+    account = await aget_account(search.account_id)
     if not account:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Account not found"
         )
     
-    results = search_messages(search.account_id, search.query, search.limit)
-    return object_id_to_str(results)
+    # Keyword + semantic hits fused by rank; weights default to the retriever's
+    weights = {leg: weight for leg, weight in (("lexical", search.lexical_weight), ("dense", search.dense_weight))
+               if weight is not None}
+    hits = await retriever.search(search.query, search.account_id, search.limit, weights=weights)
+    return object_id_to_str(await _hit_messages(search.account_id, hits))
+
+
+async def _hit_messages(account_id, hits):
+    """The message document behind each fused hit, in fused order
+    
+    Lexical hits carry the message _id and dense hits its faiss_id; both are
+    looked up in one query. Hits whose message no longer exists are dropped.
+    """
+    message_ids = [str(hit["_id"]) for hit in hits if hit.get("_id") is not None]
+    faiss_ids = [int(hit["faiss_id"]) for hit in hits if hit.get("faiss_id")]
+    if not message_ids and not faiss_ids:
+        return []
+    docs = await aget_account_messages(account_id, message_ids, faiss_ids)
+    by_id = {str(doc["_id"]): doc for doc in docs}
+    by_faiss_id = {doc["faiss_id"]: doc for doc in docs if doc.get("faiss_id")}
+    
+    messages, seen = [], set()
+    for hit in hits:
+        doc = by_id.get(str(hit.get("_id"))) or (by_faiss_id.get(int(hit["faiss_id"])) if hit.get("faiss_id") else None)
+        if doc is None or doc["_id"] in seen:
+            continue
+        seen.add(doc["_id"])
+        messages.append({**doc, "score": hit.get("score"), "sources": hit.get("sources", [])})
+    return messages
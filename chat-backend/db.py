@@ -1,6 +1,9 @@
 #db.py
 from pymongo import MongoClient
 import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from bson import ObjectId
 from typing import Optional, List
@@ -13,6 +16,43 @@ accounts_col = db.accounts
 chats_col = db.chats
 messages_col = db.messages
 
+# Vector store sync
+# Whoever owns the VectorStore registers these so chat deletes and message
+# edits reach the index without db.py importing it
+_vector_hooks = {"chat_deleted": None, "message_edited": None}
+
+def register_vector_hooks(on_chat_deleted=None, on_message_edited=None):
+    """Register vector store callbacks
+
+    Args:
+        on_chat_deleted: Called as on_chat_deleted(chat_id, faiss_ids, account_id) after a chat is deleted
+        on_message_edited: Called as on_message_edited(faiss_id, text, account_id) when a message's
+                           text changes; returns the message's new faiss_id
+    """
+    _vector_hooks["chat_deleted"] = on_chat_deleted
+    _vector_hooks["message_edited"] = on_message_edited
+
+# Text index sync (same idea, for the in-process lexical index)
+_text_hooks = {"stored": None, "removed": None}
+
+def register_text_hooks(on_stored=None, on_removed=None):
+    """Register text index callbacks
+
+    Args:
+        on_stored: Called as on_stored(account_id, message_id, text, response) after a message
+                   is stored or its text/response changes
+        on_removed: Called as on_removed(message_ids) after messages are deleted
+    """
+    _text_hooks["stored"] = on_stored
+    _text_hooks["removed"] = on_removed
+
+def _notify_text_stored(account_id, message_id, text, response):
+    if _text_hooks["stored"]:
+        try:
+            _text_hooks["stored"](str(account_id), str(message_id), text, response)
+        except Exception as e:
+            print(f"Error indexing message {message_id}: {e}")
+
 # Account functions
 def create_account(username, email, password_hash):
     """Create a new account"""
@@ -91,6 +131,9 @@ def delete_chat(chat_id):
     """Delete chat and all its messages"""
     chat = get_chat(chat_id)
     if chat:
+        # Remember which messages (and vectors) belong to the chat before they go
+        messages = list(messages_col.find({"chat_id": ObjectId(chat_id)}, {"faiss_id": 1}))
+        faiss_ids = [msg["faiss_id"] for msg in messages if msg.get("faiss_id")]
         # Delete all messages in the chat
         messages_col.delete_many({"chat_id": ObjectId(chat_id)})
         # Delete the chat
@@ -102,6 +145,17 @@ def delete_chat(chat_id):
                 {"_id": chat["account_id"]},
                 {"$inc": {"statistics.total_chats": -1}}
             )
+
+        if _vector_hooks["chat_deleted"]:
+            try:
+                _vector_hooks["chat_deleted"](str(chat_id), faiss_ids, str(chat["account_id"]))
+            except Exception as e:
+                print(f"Error removing vectors for chat {chat_id}: {e}")
+        if _text_hooks["removed"]:
+            try:
+                _text_hooks["removed"]([str(msg["_id"]) for msg in messages])
+            except Exception as e:
+                print(f"Error unindexing messages for chat {chat_id}: {e}")
         
         return result
     return None
@@ -124,7 +178,7 @@ def store_message(account_id, chat_id, text, response, faiss_id=None, summary=No
         }
     )
     
-    return messages_col.insert_one({
+    result = messages_col.insert_one({
         "account_id": ObjectId(account_id),
         "chat_id": ObjectId(chat_id),
         "text": text,
@@ -134,16 +188,19 @@ def store_message(account_id, chat_id, text, response, faiss_id=None, summary=No
         "title": title,
         "timestamp": datetime.now()
     })
+    _notify_text_stored(account_id, result.inserted_id, text, response)
+    return result
 
-def update_message(message_id, response=None, text=None, summary=None, title=None):
+def update_message(message_id, response=None, text=None, summary=None, title=None, faiss_id=None):
     """Update an existing message
     
     Args:
         message_id: The ID of the message to update
         response: New response text (optional)
-        text: New user message text (optional)
+        text: New user message text (optional, re-embedded in the vector store)
         summary: New summary (optional)
         title: New title (optional)
+        faiss_id: Vector store id of the message (optional, 0/None leave it unchanged)
         
     Returns:
         The update result from MongoDB
@@ -170,6 +227,18 @@ def update_message(message_id, response=None, text=None, summary=None, title=Non
         update_fields["summary"] = summary
     if title is not None:
         update_fields["title"] = title
+    if faiss_id:
+        update_fields["faiss_id"] = faiss_id
+
+    # Edited text needs a new vector; the hook returns the id it was stored under
+    if text is not None and _vector_hooks["message_edited"] and not faiss_id:
+        current = messages_col.find_one({"_id": ObjectId(message_id)}, {"text": 1, "faiss_id": 1, "account_id": 1})
+        if current and current.get("faiss_id") and current.get("text") != text:
+            try:
+                update_fields["faiss_id"] = _vector_hooks["message_edited"](
+                    current["faiss_id"], text, str(current["account_id"]) if current.get("account_id") else None)
+            except Exception as e:
+                print(f"Error re-embedding message {message_id}: {e}")
         
     # Only update if we have fields to update
     if update_fields:
@@ -185,6 +254,10 @@ def update_message(message_id, response=None, text=None, summary=None, title=Non
                 print(f"No message found with ID {message_id}")
             else:
                 print(f"Successfully updated message {message_id}")
+                if text is not None or response is not None:
+                    doc = messages_col.find_one({"_id": ObjectId(message_id)}, {"account_id": 1, "text": 1, "response": 1})
+                    if doc:
+                        _notify_text_stored(doc["account_id"], message_id, doc.get("text"), doc.get("response"))
             return result
         except Exception as e:
             print(f"Error updating message {message_id}: {e}")
@@ -228,30 +301,143 @@ def get_recent_messages(chat_id, limit=5, as_dict=False):
     
     # Convert to dictionaries if requested
     if as_dict:
-        result = []
-        for msg in messages:
-            msg_dict = {
-                "role": "assistant" if "response" in msg else "user",
-                "content": msg.get("response", msg.get("text", ""))
-            }
-            result.append(msg_dict)
-        return result
+        return _messages_as_dicts(messages)
     
     return messages
 
+def _messages_as_dicts(messages):
+    """Role/content dicts for prompt building"""
+    result = []
+    for msg in messages:
+        msg_dict = {
+            "role": "assistant" if "response" in msg else "user",
+            "content": msg.get("response", msg.get("text", ""))
+        }
+        result.append(msg_dict)
+    return result
+
 def get_by_ids(ids):
     """Get messages by their faiss_ids"""
     return list(messages_col.find({"faiss_id": {"$in": ids}}))
 
-def search_messages(account_id, query, limit=10):
-    """Search for messages containing the query text within an account"""
-    return list(messages_col.find({
+def get_messages(message_ids):
+    """Get messages by _id, in no particular order (unknown ids are skipped)"""
+    return list(messages_col.find({"_id": {"$in": [ObjectId(message_id) for message_id in message_ids]}}))
+
+def get_account_messages(account_id, message_ids=(), faiss_ids=()):
+    """Get an account's messages matching any of the _ids or faiss_ids in one query (unknown ids are skipped)"""
+    return list(messages_col.find(_account_messages_query(account_id, message_ids, faiss_ids)))
+
+def _account_messages_query(account_id, message_ids, faiss_ids):
+    return {
         "account_id": ObjectId(account_id),
-        "$text": {"$search": query}
-    }).limit(limit))
+        "$or": [
+            {"_id": {"$in": [ObjectId(message_id) for message_id in message_ids if ObjectId.is_valid(message_id)]}},
+            {"faiss_id": {"$in": [int(faiss_id) for faiss_id in faiss_ids]}},
+        ],
+    }
+
+def search_messages(account_id, query, limit=10):
+    """Search for messages containing the query text within an account, best match first"""
+    return list(messages_col.find(
+        {"account_id": ObjectId(account_id), "$text": {"$search": query}},
+        {"text_score": {"$meta": "textScore"}}
+    ).sort([("text_score", {"$meta": "textScore"})]).limit(limit))
+
+# Async access
+# Coroutine versions of the functions the async routes call, so a slow Mongo
+# query suspends only the request waiting on it instead of the event loop.
+# Reads use Motor when it's installed; without it (and for writes, which carry
+# statistics/hook logic) the sync functions run on a bounded thread pool.
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:
+    AsyncIOMotorClient = None
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("MONGO_EXECUTOR_WORKERS", 16)), thread_name_prefix="mongo")
+_async_db = None
+
+def _motor_db():
+    """Motor database handle, created on first use (None without Motor)"""
+    global _async_db
+    if _async_db is None and AsyncIOMotorClient is not None:
+        _async_db = AsyncIOMotorClient(os.getenv("MONGO_URI", "mongodb://localhost:27017")).chatbot_db
+    return _async_db
+
+async def _offload(fn, *args, **kwargs):
+    """Run a blocking db function on the Mongo thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+async def aget_account(account_id):
+    """Async get_account"""
+    adb = _motor_db()
+    if adb is None:
+        return await _offload(get_account, account_id)
+    return await adb.accounts.find_one({"_id": ObjectId(account_id)})
+
+async def aget_chat(chat_id):
+    """Async get_chat"""
+    adb = _motor_db()
+    if adb is None:
+        return await _offload(get_chat, chat_id)
+    return await adb.chats.find_one({"_id": ObjectId(chat_id)})
+
+async def aget_recent_messages(chat_id, limit=5, as_dict=False):
+    """Async get_recent_messages"""
+    adb = _motor_db()
+    if adb is None:
+        return await _offload(get_recent_messages, chat_id, limit, as_dict)
+    cursor = adb.messages.find({"chat_id": ObjectId(chat_id)}).sort("timestamp", -1).limit(limit)
+    messages = await cursor.to_list(length=limit)
+    return _messages_as_dicts(messages) if as_dict else messages
+
+async def aget_by_ids(ids):
+    """Async get_by_ids"""
+    adb = _motor_db()
+    if adb is None:
+        return await _offload(get_by_ids, ids)
+    return await adb.messages.find({"faiss_id": {"$in": ids}}).to_list(length=None)
+
+async def aget_messages(message_ids):
+    """Async get_messages"""
+    adb = _motor_db()
+    if adb is None:
+        return await _offload(get_messages, message_ids)
+    ids = [ObjectId(message_id) for message_id in message_ids]
+    return await adb.messages.find({"_id": {"$in": ids}}).to_list(length=len(ids))
+
+async def aget_account_messages(account_id, message_ids=(), faiss_ids=()):
+    """Async get_account_messages"""
+    adb = _motor_db()
+    if adb is None:
+        return await _offload(get_account_messages, account_id, message_ids, faiss_ids)
+    return await adb.messages.find(_account_messages_query(account_id, message_ids, faiss_ids)).to_list(length=None)
+
+async def asearch_messages(account_id, query, limit=10):
+    """Async search_messages"""
+    adb = _motor_db()
+    if adb is None:
+        return await _offload(search_messages, account_id, query, limit)
+    cursor = adb.messages.find(
+        {"account_id": ObjectId(account_id), "$text": {"$search": query}},
+        {"text_score": {"$meta": "textScore"}}
+    ).sort([("text_score", {"$meta": "textScore"})]).limit(limit)
+    return await cursor.to_list(length=limit)
+
+async def astore_message(account_id, chat_id, text, response, faiss_id=None, summary=None, title=None):
+    """Async store_message"""
+    return await _offload(store_message, account_id, chat_id, text, response, faiss_id, summary, title)
+
+async def aupdate_message(message_id, **fields):
+    """Async update_message"""
+    return await _offload(update_message, message_id, **fields)
 
 # Ensure text indexes for search functionality
 messages_col.create_index([("text", "text"), ("response", "text")])
+# BM25 catch-up queries timestamp OR updated_at past its watermark; each $or branch needs its own index
+messages_col.create_index("timestamp")
+messages_col.create_index("updated_at")
 
 # Create summary collection
 summaries_col = db.summaries
@@ -0,0 +1,285 @@
+# embeddings/__init__.py
+import os
+import threading
+import numpy as np
+import faiss
+from .batcher import EmbeddingBatcher
+from .cache import EmbeddingCache
+from .model import EmbeddingModelManager
+
+# Model is loaded lazily (or warmed in the background at app startup)
+model_manager = EmbeddingModelManager()
+MODEL_NAME = model_manager.model_name
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", 768))  # bge-base-en-v1.5 is 768 dim
+
+def __getattr__(name):
+    # Backwards compatible `embeddings.model` - loads on first access
+    if name == "model":
+        return model_manager.get()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+INSTRUCTION = "Represent this sentence for retrieval: "
+
+# Content-addressed vectors shared by every caller (embeddings + vectorstore).
+# Memory-only unless $EMBEDDING_CACHE_PATH names where the .f32/.idx files go.
+# Opened on first use, not at import: pool workers import this package before
+# their initializer switches them to a memory-only cache.
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> EmbeddingCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(
+                    os.getenv("EMBEDDING_CACHE_PATH") or None,
+                    dim=EMBEDDING_DIM,
+                    model_name=model_manager.cache_identity,
+                    max_memory_items=int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", 10000)),
+                )
+    return _cache
+
+ENCODE_BATCH_SIZE = int(os.getenv("EMBEDDING_ENCODE_BATCH_SIZE", 32))
+# Padded token budget per forward pass, so buckets of long texts get fewer rows
+ENCODE_BATCH_TOKENS = int(os.getenv("EMBEDDING_ENCODE_BATCH_TOKENS", ENCODE_BATCH_SIZE * 128))
+
+def _token_lengths(model, texts):
+    """Token count per text after truncation to the model's max length"""
+    tokenizer = getattr(model, "tokenizer", None)
+    max_length = getattr(model, "max_seq_length", None) or 512
+    if tokenizer is None:
+        # Rough estimate (~4 chars per token) when the backend has no tokenizer
+        return np.array([min(len(t) // 4 + 2, max_length) for t in texts])
+    ids = tokenizer(texts, truncation=True, max_length=max_length)["input_ids"]
+    return np.array([len(i) for i in ids])
+
+def length_buckets(lengths, batch_size=ENCODE_BATCH_SIZE, max_batch_tokens=ENCODE_BATCH_TOKENS):
+    """Group indices of similar token length into batches, shortest first.
+
+    A batch closes when it has batch_size rows or padding everything to its
+    longest member would exceed max_batch_tokens.
+    """
+    order = np.argsort(lengths, kind="stable")
+    batches, current = [], []
+    for i in order:
+        # Sorted ascending, so the newcomer is the longest and sets the padded width
+        if current and (len(current) >= batch_size or (len(current) + 1) * lengths[i] > max_batch_tokens):
+            batches.append(current)
+            current = []
+        current.append(int(i))
+    if current:
+        batches.append(current)
+    return batches
+
+def encode_many(texts: list[str], instruction: str = INSTRUCTION, batch_size: int = ENCODE_BATCH_SIZE) -> np.ndarray:
+    """Bulk encode with length bucketing so short texts aren't padded to the longest one.
+
+    Inputs are sorted by token length, encoded in same-length buckets (truncated
+    to the model's max length) and returned in the original order.
+    """
+    if not texts:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+    model = model_manager.get()
+    prefixed = [instruction + text for text in texts]
+    if len(prefixed) == 1:
+        return model.encode(prefixed, batch_size=1, normalize_embeddings=True,
+                            show_progress_bar=False).astype('float32')
+
+    out = np.empty((len(prefixed), EMBEDDING_DIM), dtype=np.float32)
+    for bucket in length_buckets(_token_lengths(model, prefixed), batch_size):
+        out[bucket] = model.encode([prefixed[i] for i in bucket], batch_size=len(bucket),
+                                   normalize_embeddings=True, show_progress_bar=False)
+    return out  # FAISS needs float32
+
+def _encode_batch(texts):
+    """Encode a micro-batch of already-prefixed texts"""
+    return encode_many(texts, instruction="")
+
+# Concurrent get_embedding callers share one encode per micro-batch
+batcher = EmbeddingBatcher(
+    _encode_batch,
+    max_batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", 32)),
+    max_wait_ms=float(os.getenv("EMBEDDING_BATCH_WAIT_MS", 5)),
+)
+
+# Prepend instruction as per model design
+def get_embedding(text: str):
+    embedding = get_cache().get(text, INSTRUCTION)
+    if embedding is None:
+        embedding = batcher.embed(INSTRUCTION + text)
+        get_cache().put(text, embedding, INSTRUCTION)
+    return embedding
+
+async def get_embedding_async(text: str):
+    """Asyncio variant of get_embedding - awaits the batch without blocking the loop"""
+    embedding = get_cache().get(text, INSTRUCTION)
+    if embedding is None:
+        embedding = await batcher.embed_async(INSTRUCTION + text)
+        get_cache().put(text, embedding, INSTRUCTION)
+    return embedding
+
+# Bulk jobs with at least this many uncached texts are sharded across processes
+POOL_MIN_TEXTS = int(os.getenv("EMBEDDING_POOL_MIN_TEXTS", 2048))
+_pool = None
+
+def get_pool():
+    """Shared multi-process pool for bulk encodes (started on first use)"""
+    global _pool
+    if _pool is None:
+        from .pool import EmbeddingPool
+        _pool = EmbeddingPool()
+    return _pool
+
+def close_pool():
+    """Stop the bulk-encode pool's workers, if it was started"""
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+def get_embeddings(texts: list[str], bulk: bool = False) -> np.ndarray:
+    """Embed several texts, encoding only the cache misses in one bucketed bulk encode.
+
+    With bulk=True (index rebuilds, imports) large miss sets go to the
+    multi-process pool instead of this process.
+    """
+    if not texts:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+    cached = get_cache().get_many(texts, INSTRUCTION)
+    missing = [i for i, emb in enumerate(cached) if emb is None]
+    if missing:
+        # Duplicate texts in one call only need a single encode
+        unique = list(dict.fromkeys(texts[i] for i in missing))
+        if bulk and len(unique) >= POOL_MIN_TEXTS:
+            encoded = get_pool().encode(unique, INSTRUCTION)
+        else:
+            encoded = encode_many(unique)
+        get_cache().put_many(unique, encoded, INSTRUCTION)
+        by_text = dict(zip(unique, encoded))
+        for i in missing:
+            cached[i] = by_text[texts[i]]
+
+    return np.vstack(cached).astype('float32')
+
+# Cosine similarity
+def cosine_similarity(vec1, vec2):
+    return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
+
+# Rerank top results with the configured reranker (batched cross-encoder by default)
+def rerank(query, candidates, candidate_embeddings=None, top_k=5, similarity_threshold=0.65,
+           first_stage=None, query_text=None, decisive_margin=None):
+    """
+    Rerank candidates with a second-stage reranker, skipping it when first-stage scores are decisive.
+    
+    Args:
+        query: Either a query string or a pre-computed query embedding
+        candidates: List of text candidates to rerank
+        candidate_embeddings: Pre-computed embeddings for candidates (optional, reused as-is)
+        top_k: Number of top results to return
+        similarity_threshold: Minimum first-stage (cosine) similarity for inclusion in results,
+                             whichever scorer orders them (0.65 default)
+        first_stage: First-stage (FAISS inner product) scores aligned with candidates (optional)
+        query_text: Query string when `query` is an embedding (needed by the cross-encoder)
+        decisive_margin: Score gap at the top_k cut above which reranking is skipped
+                         (defaults to $RERANK_DECISIVE_MARGIN, 0.15)
+        
+    Returns:
+        List of reranked candidates that meet the similarity threshold (top_k only)
+    """
+    from rerankers import get_reranker, first_stage_scores, is_decisive
+
+    # Handle empty candidates
+    if not candidates or not isinstance(candidates, list):
+        return []
+    
+    # Filter out non-string candidates, keeping embeddings/scores aligned
+    keep = [i for i, c in enumerate(candidates) if isinstance(c, str)]
+    if not keep:
+        return []
+    valid_candidates = [candidates[i] for i in keep]
+    if candidate_embeddings is not None and len(candidate_embeddings) == len(candidates):
+        candidate_embeddings = np.asarray([candidate_embeddings[i] for i in keep], dtype=np.float32)
+    else:
+        candidate_embeddings = None
+    if first_stage is not None and len(first_stage) == len(candidates):
+        first_stage = np.asarray([first_stage[i] for i in keep], dtype=np.float32)
+    else:
+        first_stage = None
+
+    # Split the query into its text and embedding forms
+    if isinstance(query, np.ndarray):
+        query_embedding = query
+    else:
+        query_text = query
+        query_embedding = None
+
+    # The threshold is on the first-stage scale, so recover those scores when the caller
+    # didn't pass them (from its embeddings, or by embedding the candidates)
+    if first_stage is None:
+        if candidate_embeddings is None:
+            candidate_embeddings = get_embeddings(valid_candidates)
+        if query_embedding is None:
+            query_embedding = get_embedding(query_text)
+        first_stage = first_stage_scores(query_embedding, candidate_embeddings)
+
+    if decisive_margin is None:
+        decisive_margin = float(os.getenv("RERANK_DECISIVE_MARGIN", 0.15))
+
+    if is_decisive(first_stage, top_k, decisive_margin):
+        # FAISS already separated the winners; a rerank could only reorder them
+        scores = first_stage
+    elif query_text:
+        scores = get_reranker().score(query_text, valid_candidates, candidate_embeddings, query_embedding)
+    else:
+        # Without query text a cross-encoder can't run; fall back to embedding similarity
+        scores = get_reranker("bi-encoder").score(None, valid_candidates, candidate_embeddings, query_embedding)
+
+    # Rerank scores only order the results: a cross-encoder's aren't on the cosine scale the
+    # threshold is, so it filters on the first-stage scores on every path
+    order = np.argsort(-np.asarray(scores, dtype=np.float32), kind="stable")
+    return [valid_candidates[i] for i in order if first_stage[i] >= similarity_threshold][:top_k]
+
+def top_k_indices(scores: np.ndarray, k=None, threshold=None) -> np.ndarray:
+    """Indices of the k best scores (>= threshold), best first, via a partial sort instead of a full one"""
+    scores = np.asarray(scores)
+    idx = np.flatnonzero(scores >= threshold) if threshold is not None else np.arange(len(scores))
+    if k is not None and 0 < k < len(idx):
+        kth = -np.partition(-scores[idx], k - 1)[k - 1]
+        # argpartition picks arbitrarily among scores tied at the cut; keep the earliest like a stable sort
+        above = idx[scores[idx] > kth]
+        idx = np.concatenate([above, idx[scores[idx] == kth][:k - len(above)]])
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+# Filter most useful RAGs
+def trim_relevant_rags(query: str, rag_chunks: list[str], sim_threshold: float = 0.5, top_k: int = None):
+    """Keep chunks whose similarity to the query passes sim_threshold (best first, at most top_k)"""
+    if not rag_chunks:
+        return []
+
+    query_embedding = get_embedding(query)
+    chunk_embeddings = get_embeddings(rag_chunks)
+
+    # Embeddings are normalized, so one matrix-vector product gives every cosine similarity
+    sims = chunk_embeddings @ query_embedding
+    return [rag_chunks[i] for i in top_k_indices(sims, top_k, sim_threshold)]
+
+
+# Test wrapper for local usage (optional)
+def run_test(query, corpus_texts, top_k=5):
+    dim = 768
+    index = faiss.IndexFlatIP(dim)
+    embeddings = get_embeddings(corpus_texts)
+    index.add(np.array(embeddings))
+
+    query_embedding = get_embedding(query).reshape(1, -1)
+    D, I = index.search(query_embedding, top_k * 2)
+
+    candidate_texts = [corpus_texts[i] for i in I[0]]
+    candidate_embeddings = embeddings[I[0]]
+    best_matches = rerank(query_embedding[0], candidate_texts, candidate_embeddings, top_k=top_k,
+                          first_stage=D[0], query_text=query)
+
+    return best_matches
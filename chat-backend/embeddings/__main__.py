@@ -0,0 +1,39 @@
+# python -m embeddings
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from embeddings import run_test, get_embedding, batcher
+
+# 🧪 Test data
+if __name__ == '__main__':
+    # Simulated past messages and stuff
+    past_messages = [
+        "How do I connect my MongoDB to my Python backend?",
+        "What's the best way to optimize cosine similarity for FAISS?",
+        "What is vector quantization?",
+        "Can I run BGE embeddings on CPU?",
+        "How do I load DeepSeek LLM locally?",
+        "What's the best embedding model for English-only projects?",
+        "How do I extract embeddings from a text file for retrieval?",
+        "Why is summarization worse than precision memory retrieval?",
+        "I'm using Qwen but want something faster on CPU.",
+        "How do I improve long-term context in my chatbot?"
+    ]
+
+    query = "What embedding model should I use if I'm just doing English on CPU?"
+    results = run_test(query, past_messages, top_k=5)
+
+    print("\nQuery:", query)
+    print("\nTop Matches:")
+    print("hi :)")
+    for i, r in enumerate(results, 1):
+        print(f"{i}. {r}")
+
+    # Concurrent single-text callers should coalesce into a few batches
+    texts = past_messages * 10
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        list(pool.map(get_embedding, texts))
+    elapsed = time.time() - start
+    print(f"\n{len(texts)} concurrent embeddings in {elapsed:.2f}s ({len(texts) / elapsed:.1f}/s)")
+    print("Batcher stats:", batcher.stats())
@@ -0,0 +1,150 @@
+"""
+Dynamic micro-batching for single-text embedding requests.
+
+Concurrent callers each submit one text; a background worker gathers whatever
+arrives within a short window (bounded by ``max_batch_size`` and
+``max_wait_ms``) and runs a single ``encode`` over the whole batch. Every caller
+gets its own future back, so the sync and asyncio APIs share one worker.
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Sentinel used to stop the worker thread
+_STOP = object()
+
+
+class EmbeddingBatcher:
+    """Collects concurrent single-text encode requests into micro-batches."""
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray],
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        """
+        Args:
+            encode_fn: Function that encodes a list of texts into a (n, dim) array
+            max_batch_size: Maximum number of texts encoded in one forward pass
+            max_wait_ms: How long the worker waits for more requests after the
+                         first one arrives before running the batch
+        """
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+        # Counters for tuning batch size / wait time
+        self.batches = 0
+        self.items = 0
+
+    # ─────────────────────────────────────────────────────────────────────
+    #  Public API
+    # ─────────────────────────────────────────────────────────────────────
+    def submit(self, text: str) -> Future:
+        """Queue a text for encoding and return a future for its vector."""
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed(self, text: str, timeout: Optional[float] = None) -> np.ndarray:
+        """Blocking API: encode one text as part of the next micro-batch."""
+        return self.submit(text).result(timeout=timeout)
+
+    async def embed_async(self, text: str) -> np.ndarray:
+        """Asyncio API: await one text's vector without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(text))
+
+    def stats(self) -> dict:
+        """Return batching counters (average batch size shows how well requests coalesce)."""
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": (self.items / self.batches) if self.batches else 0.0,
+            "pending": self._queue.qsize(),
+        }
+
+    def close(self):
+        """Stop the worker thread once the queued requests have been served."""
+        with self._lock:
+            worker = self._worker
+            self._worker = None
+        if worker is not None:
+            self._queue.put(_STOP)
+            worker.join()
+
+    # ─────────────────────────────────────────────────────────────────────
+    #  Worker
+    # ─────────────────────────────────────────────────────────────────────
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="embedding-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def _collect(self, first) -> tuple:
+        """Gather up to max_batch_size requests, waiting at most max_wait after the first."""
+        batch = [first]
+        stop = False
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+
+            batch, stop = self._collect(item)
+            # Drop requests whose callers already gave up
+            batch = [(text, fut) for text, fut in batch if fut.set_running_or_notify_cancel()]
+
+            if batch:
+                self._encode_batch(batch)
+            if stop:
+                return
+
+    def _encode_batch(self, batch):
+        texts = [text for text, _ in batch]
+        try:
+            vectors = np.asarray(self.encode_fn(texts), dtype=np.float32)
+            # zip() below would silently leave the extra callers waiting forever
+            if vectors.ndim != 2 or len(vectors) != len(batch):
+                raise ValueError(f"encode_fn returned {vectors.shape[0] if vectors.ndim else 0} rows "
+                                 f"for {len(batch)} texts")
+        except Exception as e:
+            logger.exception(f"Embedding batch of {len(texts)} failed: {e}")
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+
+        self.batches += 1
+        self.items += len(batch)
+        for (_, fut), vector in zip(batch, vectors):
+            fut.set_result(vector)
@@ -0,0 +1,233 @@
+"""
+Persistent content-addressed embedding cache.
+
+Vectors are keyed by a hash of (model name, instruction prefix, normalized text).
+Lookups go through an in-memory LRU first and then an on-disk store made of:
+
+* ``<path>.f32`` - memory-mapped float32 slab, one row per cached vector
+* ``<path>.idx`` - append-only index file, one 16-byte key per slab row
+
+so embeddings survive restarts without re-running the model. With no path the
+cache is memory-only (the default, and what embedding pool workers use since
+they must not write to the shared files).
+
+Cached vectors are shared by every caller, so they're handed out read-only:
+a caller that wants to modify one in place has to copy it first.
+"""
+import hashlib
+import logging
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+KEY_SIZE = 16  # bytes per key record in the index file
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so trivially different copies share one cache entry"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class EmbeddingCache:
+    """In-memory LRU in front of a memory-mapped on-disk embedding store."""
+
+    def __init__(self, path: Optional[str], dim: int, model_name: str,
+                 max_memory_items: int = 10000, initial_capacity: int = 1024):
+        """
+        Args:
+            path: Base path for the slab (.f32) and index (.idx) files, None for memory-only
+            dim: Embedding dimension
+            model_name: Name of the model producing the vectors (part of the key)
+            max_memory_items: Number of vectors kept in the in-memory LRU
+            initial_capacity: Rows pre-allocated in a new slab file
+        """
+        self.dim = dim
+        self.model_name = model_name
+        self.max_memory_items = max_memory_items
+        self.slab_path = path + ".f32" if path else None
+        self.index_path = path + ".idx" if path else None
+
+        self._lock = threading.RLock()
+        self._lru: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._rows: Dict[bytes, int] = {}
+        self._count = 0
+        self._slab = None
+        self._index_fh = None
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if path:
+            self._open(initial_capacity)
+
+    # ─────────────────────────────────────────────────────────────────────
+    #  Disk store
+    # ─────────────────────────────────────────────────────────────────────
+    def _open(self, initial_capacity: int):
+        directory = os.path.dirname(self.slab_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        row_bytes = self.dim * 4
+        slab_rows = os.path.getsize(self.slab_path) // row_bytes if os.path.exists(self.slab_path) else 0
+        capacity = max(slab_rows, initial_capacity, 1)
+        if slab_rows < capacity:
+            with open(self.slab_path, "ab") as fh:
+                fh.truncate(capacity * row_bytes)
+        self._capacity = capacity
+        self._slab = np.memmap(self.slab_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+        # Load keys; a trailing partial record or rows beyond the slab mean a torn write
+        keys = b""
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as fh:
+                keys = fh.read()
+        count = min(len(keys) // KEY_SIZE, capacity)
+        if count * KEY_SIZE != len(keys):
+            logger.warning(f"Embedding cache index has a torn tail, keeping {count} entries")
+            with open(self.index_path, "r+b") as fh:
+                fh.truncate(count * KEY_SIZE)
+        for row in range(count):
+            self._rows[keys[row * KEY_SIZE:(row + 1) * KEY_SIZE]] = row
+        self._count = count
+        self._index_fh = open(self.index_path, "ab")
+        logger.info(f"Embedding cache opened with {count} vectors ({self.slab_path})")
+
+    def _grow(self, needed: int):
+        """Double the slab until it holds `needed` rows"""
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        self._slab.flush()
+        del self._slab
+        with open(self.slab_path, "r+b") as fh:
+            fh.truncate(capacity * self.dim * 4)
+        self._capacity = capacity
+        self._slab = np.memmap(self.slab_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    # ─────────────────────────────────────────────────────────────────────
+    #  Keys and LRU
+    # ─────────────────────────────────────────────────────────────────────
+    def key(self, text: str, instruction: str = "") -> bytes:
+        """Content address for (model name, instruction prefix, normalized text)"""
+        h = hashlib.blake2b(digest_size=KEY_SIZE)
+        for part in (self.model_name, instruction, normalize_text(text)):
+            data = part.encode("utf-8")
+            h.update(len(data).to_bytes(8, "little"))
+            h.update(data)
+        return h.digest()
+
+    @staticmethod
+    def _frozen(vector: np.ndarray) -> np.ndarray:
+        """A private read-only copy (the caller's array may be a view it keeps changing)"""
+        vector = np.array(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        return vector
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_memory_items:
+            self._lru.popitem(last=False)
+
+    def _lookup(self, key: bytes) -> Optional[np.ndarray]:
+        vector = self._lru.get(key)
+        if vector is not None:
+            self._lru.move_to_end(key)
+            self.memory_hits += 1
+            return vector
+
+        row = self._rows.get(key)
+        if row is not None:
+            vector = self._frozen(self._slab[row])
+            self._remember(key, vector)
+            self.disk_hits += 1
+            return vector
+
+        self.misses += 1
+        return None
+
+    def _flush_index(self):
+        if self._index_fh is not None:
+            self._index_fh.flush()
+
+    def _store(self, key: bytes, vector: np.ndarray):
+        vector = self._frozen(vector)
+        if self._slab is not None and key not in self._rows:
+            if self._count >= self._capacity:
+                self._grow(self._count + 1)
+            row = self._count
+            # Vector goes into the slab before its key is made visible in the index
+            self._slab[row] = vector
+            self._index_fh.write(key)
+            self._rows[key] = row
+            self._count += 1
+        self._remember(key, vector)
+
+    # ─────────────────────────────────────────────────────────────────────
+    #  Public API
+    # ─────────────────────────────────────────────────────────────────────
+    def get(self, text: str, instruction: str = "") -> Optional[np.ndarray]:
+        """Return the cached vector for text, or None on a miss"""
+        key = self.key(text, instruction)
+        with self._lock:
+            return self._lookup(key)
+
+    def put(self, text: str, vector: np.ndarray, instruction: str = ""):
+        """Cache the vector for text"""
+        key = self.key(text, instruction)
+        vector = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            self._store(key, vector)
+            self._flush_index()
+
+    def get_many(self, texts: Sequence[str], instruction: str = "") -> List[Optional[np.ndarray]]:
+        """Look up several texts at once; misses come back as None"""
+        keys = [self.key(text, instruction) for text in texts]
+        with self._lock:
+            return [self._lookup(key) for key in keys]
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray, instruction: str = ""):
+        """Cache a batch of vectors with a single index flush"""
+        keys = [self.key(text, instruction) for text in texts]
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(keys), self.dim)
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._store(key, vector)
+            self._flush_index()
+
+    def stats(self) -> dict:
+        """Hit/miss counters and sizes"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": ((self.memory_hits + self.disk_hits) / lookups) if lookups else 0.0,
+                "memory_items": len(self._lru),
+                "disk_items": self._count,
+            }
+
+    def flush(self):
+        """Force the slab and index to disk"""
+        with self._lock:
+            if self._slab is None:
+                return
+            self._slab.flush()
+            self._index_fh.flush()
+            os.fsync(self._index_fh.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._index_fh is None or self._index_fh.closed:
+                return
+            self.flush()
+            self._index_fh.close()
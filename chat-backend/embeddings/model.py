@@ -0,0 +1,126 @@
+"""
+Lazy, optionally background-warmed loading of the embedding model.
+
+Nothing heavy (torch, weights) is imported until the model is first needed or
+`warmup_in_background()` is called at app startup. Configuration comes from the
+environment:
+
+* EMBEDDING_MODEL   - model name (default BAAI/bge-base-en-v1.5)
+* EMBEDDING_DEVICE  - torch device (default cpu)
+* EMBEDDING_THREADS - torch / onnxruntime intra-op threads (default: library's own choice)
+* EMBEDDING_BACKEND - "torch" (fp32 sentence-transformers, default) or "onnx" (int8 ONNX Runtime)
+"""
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODEL = "BAAI/bge-base-en-v1.5"
+
+BACKENDS = ("torch", "onnx")
+
+# Readiness states
+UNLOADED = "unloaded"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class EmbeddingModelManager:
+    """Owns the embedding model (SentenceTransformer or int8 ONNX) and loads it on first use."""
+
+    def __init__(self, model_name: Optional[str] = None, device: Optional[str] = None,
+                 num_threads: Optional[int] = None, backend: Optional[str] = None):
+        self.model_name = model_name or os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+        self.device = device or os.getenv("EMBEDDING_DEVICE", "cpu")
+        threads = num_threads if num_threads is not None else os.getenv("EMBEDDING_THREADS")
+        self.num_threads = int(threads) if threads else None
+        self.backend = (backend or os.getenv("EMBEDDING_BACKEND", "torch")).lower()
+        if self.backend not in BACKENDS:
+            logger.error(f"Unknown embedding backend '{self.backend}', using torch")
+            self.backend = "torch"
+
+        self.state = UNLOADED
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self._model = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def _load(self):
+        """Import torch / sentence-transformers and load the weights (caller holds the lock)"""
+        self.state = LOADING
+        start = time.time()
+        try:
+            if self.backend == "onnx":
+                from .onnx_backend import OnnxEmbeddingModel
+                logger.info(f"Loading int8 ONNX embedding model '{self.model_name}' …")
+                self._model = OnnxEmbeddingModel(self.model_name, num_threads=self.num_threads)
+            else:
+                if self.num_threads:
+                    import torch
+                    torch.set_num_threads(self.num_threads)
+                from sentence_transformers import SentenceTransformer
+                logger.info(f"Loading embedding model '{self.model_name}' on {self.device} …")
+                self._model = SentenceTransformer(self.model_name, device=self.device)
+        except Exception as e:
+            self.state = FAILED
+            self.error = str(e)
+            logger.exception(f"Failed to load embedding model '{self.model_name}': {e}")
+            raise
+        self.load_seconds = time.time() - start
+        self.state = READY
+        self.error = None
+        self._ready.set()
+        logger.info(f"Embedding model ready in {self.load_seconds:.1f}s")
+
+    @property
+    def cache_identity(self) -> str:
+        """Name used in embedding cache keys - int8 vectors must not be mixed with fp32 ones"""
+        return self.model_name if self.backend == "torch" else f"{self.model_name}#{self.backend}-int8"
+
+    def get(self):
+        """Return the model, loading it first if needed (blocks until loaded)"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._load()
+        return self._model
+
+    def encode(self, texts, **kwargs):
+        return self.get().encode(texts, **kwargs)
+
+    def warmup(self):
+        """Load the model and run a dummy encode so the first real request is fast"""
+        try:
+            self.encode(["warmup"], normalize_embeddings=True)
+        except Exception:
+            # Already logged by _load; a later real request will retry the load
+            pass
+
+    def warmup_in_background(self) -> threading.Thread:
+        """Start warmup() on a daemon thread and return immediately"""
+        thread = threading.Thread(target=self.warmup, name="embedding-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def status(self) -> dict:
+        return {
+            "model": self.model_name,
+            "backend": self.backend,
+            "device": self.device,
+            "threads": self.num_threads,
+            "state": self.state,
+            "ready": self.is_ready(),
+            "load_seconds": self.load_seconds,
+            "error": self.error,
+        }
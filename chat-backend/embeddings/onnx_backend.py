@@ -0,0 +1,176 @@
+"""
+ONNX Runtime backend with dynamic int8 quantization for CPU-only deployments.
+
+Selected with EMBEDDING_BACKEND=onnx. On first use the Hugging Face model is
+exported to ONNX, dynamically quantized to int8 and cached under
+ONNX_EXPORT_DIR, then served through onnxruntime. The pooling and
+normalization match the sentence-transformers BGE model, so vectors stay
+compatible with the 768-dim IndexFlatIP.
+
+Run `python -m embeddings.onnx_backend [corpus.txt]` to export the model and
+report cosine drift against the fp32 model on a sample corpus.
+"""
+import logging
+import os
+import re
+import sys
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+
+
+def default_export_dir(model_name: str) -> str:
+    safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+    return os.path.join(os.getenv("ONNX_EXPORT_DIR", "onnx_models"), safe_name)
+
+
+def export_onnx(model_name: str, export_dir: str, max_seq_length: int = 512) -> str:
+    """Export model_name to ONNX and quantize it to int8. Returns the int8 model path."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(export_dir, exist_ok=True)
+    fp32_path = os.path.join(export_dir, FP32_FILE)
+    int8_path = os.path.join(export_dir, INT8_FILE)
+
+    logger.info(f"Exporting '{model_name}' to ONNX in {export_dir} …")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(export_dir)
+
+    sample = tokenizer(["export sample"], return_tensors="pt", truncation=True, max_length=max_seq_length)
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+
+    logger.info("Quantizing ONNX graph to int8 …")
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return int8_path
+
+
+class OnnxEmbeddingModel:
+    """Minimal SentenceTransformer-compatible encoder backed by an int8 ONNX graph."""
+
+    def __init__(self, model_name: str, export_dir: Optional[str] = None,
+                 num_threads: Optional[int] = None, max_seq_length: int = 512,
+                 pooling: Optional[str] = None):
+        """
+        Args:
+            model_name: Hugging Face model to export/serve
+            export_dir: Where the exported graph and tokenizer live
+            num_threads: onnxruntime intra-op threads
+            max_seq_length: Inputs are truncated to this many tokens
+            pooling: "cls" (BGE) or "mean"; defaults to $EMBEDDING_POOLING or cls
+        """
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.export_dir = export_dir or default_export_dir(model_name)
+        self.max_seq_length = max_seq_length
+        self.pooling = pooling or os.getenv("EMBEDDING_POOLING", "cls")
+
+        model_path = os.path.join(self.export_dir, INT8_FILE)
+        if not os.path.exists(model_path):
+            model_path = export_onnx(model_name, self.export_dir, max_seq_length)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(self.export_dir)
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        tokens = self.tokenizer(texts, padding=True, truncation=True,
+                                max_length=self.max_seq_length, return_tensors="np")
+        feed = {name: tokens[name].astype(np.int64) for name in self.input_names if name in tokens}
+        hidden = self.session.run(["last_hidden_state"], feed)[0]
+
+        if self.pooling == "mean":
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return hidden[:, 0]
+
+    def encode(self, sentences, batch_size: int = 32, normalize_embeddings: bool = False,
+               **kwargs) -> np.ndarray:
+        """Same call shape as SentenceTransformer.encode (extra kwargs are ignored)"""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        batch_size = max(1, batch_size)
+        out = np.vstack([self._encode_batch(texts[i:i + batch_size])
+                         for i in range(0, len(texts), batch_size)]).astype(np.float32)
+        if normalize_embeddings:
+            out /= np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+        return out[0] if single else out
+
+
+def parity_check(texts: List[str], model_name: str, export_dir: Optional[str] = None,
+                 instruction: str = "") -> dict:
+    """Compare int8 ONNX vectors against the fp32 sentence-transformers model.
+
+    Returns cosine drift statistics (1 - cosine between the two backends' vectors).
+    """
+    from sentence_transformers import SentenceTransformer
+
+    texts = [instruction + text for text in texts]
+    reference = SentenceTransformer(model_name, device="cpu").encode(texts, normalize_embeddings=True)
+    quantized = OnnxEmbeddingModel(model_name, export_dir).encode(texts, normalize_embeddings=True)
+
+    cosine = np.sum(np.asarray(reference, dtype=np.float32) * quantized, axis=1)
+    drift = 1.0 - cosine
+    return {
+        "samples": len(texts),
+        "dim": int(quantized.shape[1]),
+        "mean_cosine": float(cosine.mean()),
+        "min_cosine": float(cosine.min()),
+        "mean_drift": float(drift.mean()),
+        "p95_drift": float(np.percentile(drift, 95)),
+        "max_drift": float(drift.max()),
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    from embeddings import MODEL_NAME, INSTRUCTION
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "r", encoding="utf-8") as fh:
+            corpus = [line.strip() for line in fh if line.strip()]
+    else:
+        corpus = [
+            "How do I connect my MongoDB to my Python backend?",
+            "What's the best way to optimize cosine similarity for FAISS?",
+            "What is vector quantization?",
+            "Can I run BGE embeddings on CPU?",
+            "How do I load DeepSeek LLM locally?",
+            "Why is summarization worse than precision memory retrieval?",
+            "I'm using Qwen but want something faster on CPU.",
+            "How do I improve long-term context in my chatbot?",
+        ]
+
+    report = parity_check(corpus, MODEL_NAME, instruction=INSTRUCTION)
+    for key, value in report.items():
+        print(f"{key:>12}: {value}")
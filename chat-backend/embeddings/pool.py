@@ -0,0 +1,116 @@
+"""
+Multi-process embedding pool for bulk jobs (index rebuilds, bulk imports).
+
+A single process leaves cores idle during large encodes, so this shards the
+texts into chunks and fans them out to worker processes (in the spirit of
+sentence-transformers' multi-process pool). Each worker pins its torch
+intra-op threads so workers x threads never exceeds the physical cores, and
+results stream back in input order.
+"""
+import logging
+import multiprocessing as mp
+import os
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def physical_cores() -> int:
+    """Best-effort count of physical cores available to this process"""
+    try:
+        # CPUs this process may run on (taskset / cpuset limits included)
+        available = len(os.sched_getaffinity(0))
+    except AttributeError:
+        available = None
+    try:
+        import psutil
+        cores = psutil.cpu_count(logical=False)
+        if cores:
+            return min(cores, available) if available else cores
+    except ImportError:
+        pass
+    if available:
+        return available
+    # Neither is available: assume two hardware threads per core
+    logical = os.cpu_count() or 1
+    return max(1, logical // 2)
+
+
+def _init_worker(threads: int):
+    """Runs once in each worker before the model is loaded.
+
+    Unpickling this function already imported the embeddings package, so
+    settings it read at import (the model manager's thread count) are set on
+    the objects directly. The cache and the model are only created on first
+    use, after this.
+    """
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    os.environ["EMBEDDING_THREADS"] = str(threads)
+    # Workers keep a memory-only cache; the parent owns the on-disk store
+    os.environ["EMBEDDING_CACHE_PATH"] = ""
+    os.environ["EMBEDDING_WARMUP"] = "false"
+    import embeddings
+    embeddings.model_manager.num_threads = threads
+
+
+def _encode_chunk(args: Tuple[List[str], str]) -> np.ndarray:
+    texts, instruction = args
+    from embeddings import encode_many
+    return encode_many(texts, instruction=instruction)
+
+
+class EmbeddingPool:
+    """Pool of embedding worker processes sized to the physical cores."""
+
+    def __init__(self, processes: Optional[int] = None, threads_per_worker: Optional[int] = None,
+                 chunk_size: int = 256):
+        """
+        Args:
+            processes: Worker count (defaults to $EMBEDDING_POOL_PROCESSES or the physical cores)
+            threads_per_worker: torch threads per worker (defaults to cores // processes)
+            chunk_size: Texts sent to a worker per task
+        """
+        cores = physical_cores()
+        self.processes = processes or int(os.getenv("EMBEDDING_POOL_PROCESSES", 0)) or cores
+        self.threads_per_worker = threads_per_worker or max(1, cores // self.processes)
+        self.chunk_size = chunk_size
+        self._pool = None
+
+    def start(self):
+        if self._pool is None:
+            logger.info(f"Starting embedding pool: {self.processes} workers x "
+                        f"{self.threads_per_worker} threads")
+            # spawn: forking a process that already holds torch threads is unsafe
+            ctx = mp.get_context("spawn")
+            self._pool = ctx.Pool(self.processes, initializer=_init_worker,
+                                  initargs=(self.threads_per_worker,))
+        return self
+
+    def encode_iter(self, texts: List[str], instruction: str = "") -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield (start_offset, vectors) per chunk, in input order, as workers finish"""
+        self.start()
+        chunks = [(texts[i:i + self.chunk_size], instruction)
+                  for i in range(0, len(texts), self.chunk_size)]
+        for n, vectors in enumerate(self._pool.imap(_encode_chunk, chunks)):
+            yield n * self.chunk_size, vectors
+
+    def encode(self, texts: List[str], instruction: str = "") -> np.ndarray:
+        """Encode all texts across the pool and return one (n, dim) matrix"""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack([vectors for _, vectors in self.encode_iter(texts, instruction)])
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
@@ -80,3 +80,5 @@ class SearchQuery(BaseModel):
     account_id: str
     query: str
     limit: int = 10
+    lexical_weight: Optional[float] = None  # Rank fusion weights (None = server default)
+    dense_weight: Optional[float] = None
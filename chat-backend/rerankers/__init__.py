@@ -0,0 +1,48 @@
+"""
+Pluggable rerankers for second-stage retrieval scoring.
+
+The backend is picked per deployment with the RERANKER environment variable
+("cross-encoder" by default, or "bi-encoder").
+"""
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+from .base import Reranker, first_stage_scores, is_decisive
+from .bi_encoder import BiEncoderReranker
+from .cross_encoder import CrossEncoderReranker
+
+logger = logging.getLogger(__name__)
+
+RERANKERS = {
+    CrossEncoderReranker.name: CrossEncoderReranker,
+    BiEncoderReranker.name: BiEncoderReranker,
+}
+
+_instances: Dict[str, Reranker] = {}
+_lock = threading.Lock()
+
+
+def get_reranker(name: Optional[str] = None) -> Reranker:
+    """Return the (shared) reranker instance for name, defaulting to $RERANKER"""
+    name = name or os.getenv("RERANKER", CrossEncoderReranker.name)
+    if name not in RERANKERS:
+        logger.error(f"Unknown reranker '{name}', falling back to {BiEncoderReranker.name}")
+        name = BiEncoderReranker.name
+
+    with _lock:
+        if name not in _instances:
+            _instances[name] = RERANKERS[name]()
+        return _instances[name]
+
+
+__all__ = [
+    'Reranker',
+    'CrossEncoderReranker',
+    'BiEncoderReranker',
+    'get_reranker',
+    'first_stage_scores',
+    'is_decisive',
+    'RERANKERS'
+]
@@ -0,0 +1,64 @@
+"""
+Base interface and shared helpers for rerankers.
+"""
+import logging
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class Reranker:
+    """Scores (query, candidate) pairs. Subclasses score the whole list in one batch."""
+
+    name = "base"
+
+    def score(self, query_text: Optional[str], candidates: List[str],
+              candidate_embeddings: Optional[np.ndarray] = None,
+              query_embedding: Optional[np.ndarray] = None) -> np.ndarray:
+        """Return one relevance score per candidate (higher is better, roughly 0-1).
+
+        Args:
+            query_text: Query string (may be None if only the embedding is known)
+            candidates: Candidate texts
+            candidate_embeddings: Pre-computed candidate embeddings aligned with candidates
+            query_embedding: Pre-computed query embedding
+        """
+        raise NotImplementedError
+
+
+def as_matrix(embeddings) -> Optional[np.ndarray]:
+    """Stack a list of vectors (or pass through a matrix) as float32, None if unusable"""
+    if embeddings is None:
+        return None
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if matrix.ndim != 2 or matrix.shape[0] == 0:
+        return None
+    return matrix
+
+
+def first_stage_scores(query_embedding, candidate_embeddings) -> Optional[np.ndarray]:
+    """Inner-product scores the FAISS IndexFlatIP would have produced"""
+    matrix = as_matrix(candidate_embeddings)
+    if matrix is None or query_embedding is None:
+        return None
+    return matrix @ np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+
+
+def is_decisive(scores: np.ndarray, top_k: int, margin: float) -> bool:
+    """True when first-stage scores already settle which candidates make the top_k.
+
+    The ranking is decisive when the k-th best score beats the (k+1)-th by at
+    least `margin`, so a reranker could only reorder results we keep anyway.
+    """
+    if scores is None or margin is None or len(scores) == 0:
+        return False
+    if len(scores) == 1:
+        return True
+    if len(scores) <= top_k:
+        return False
+    # Partial sort is enough to find the scores around the cut
+    top = -np.partition(-scores, top_k)[:top_k + 1]
+    top.sort()
+    return bool(top[-top_k] - top[0] >= margin)
@@ -0,0 +1,30 @@
+"""
+Bi-encoder reranker: scores candidates by cosine similarity of BGE embeddings.
+
+Cheap fallback when no cross-encoder is wanted - reuses the candidate
+embeddings callers already hold and only embeds what is missing.
+"""
+from typing import List, Optional
+
+import numpy as np
+
+from .base import Reranker, as_matrix
+
+
+class BiEncoderReranker(Reranker):
+    name = "bi-encoder"
+
+    def score(self, query_text: Optional[str], candidates: List[str],
+              candidate_embeddings: Optional[np.ndarray] = None,
+              query_embedding: Optional[np.ndarray] = None) -> np.ndarray:
+        # Imported lazily to avoid a circular import with the embeddings package
+        from embeddings import get_embedding, get_embeddings
+
+        matrix = as_matrix(candidate_embeddings)
+        if matrix is None or matrix.shape[0] != len(candidates):
+            matrix = get_embeddings(candidates)
+        if query_embedding is None:
+            query_embedding = get_embedding(query_text)
+
+        # Embeddings are normalized, so the dot product is the cosine similarity
+        return matrix @ np.asarray(query_embedding, dtype=np.float32).reshape(-1)
@@ -0,0 +1,51 @@
+"""
+Cross-encoder reranker (BGE reranker by default).
+
+All (query, candidate) pairs are scored in a single padded batch, so a rerank
+costs one forward pass instead of two encodes per candidate.
+"""
+import logging
+import os
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+from .base import Reranker
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CROSS_ENCODER = "BAAI/bge-reranker-base"
+
+
+class CrossEncoderReranker(Reranker):
+    name = "cross-encoder"
+
+    def __init__(self, model_name: Optional[str] = None, max_length: int = 512):
+        self.model_name = model_name or os.getenv("RERANKER_MODEL", DEFAULT_CROSS_ENCODER)
+        self.max_length = max_length
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        """Load the cross-encoder on first use"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    logger.info(f"Loading cross-encoder '{self.model_name}' …")
+                    self._model = CrossEncoder(self.model_name, max_length=self.max_length)
+        return self._model
+
+    def score(self, query_text: Optional[str], candidates: List[str],
+              candidate_embeddings: Optional[np.ndarray] = None,
+              query_embedding: Optional[np.ndarray] = None) -> np.ndarray:
+        if not query_text:
+            raise ValueError("Cross-encoder reranking needs the query text")
+
+        pairs = [(query_text, candidate) for candidate in candidates]
+        # One padded batch for every pair; single-logit BGE rerankers come back sigmoid-scaled (0-1)
+        scores = self.model.predict(pairs, batch_size=len(pairs), convert_to_numpy=True,
+                                    show_progress_bar=False)
+        return np.asarray(scores, dtype=np.float32).reshape(-1)
@@ -0,0 +1,20 @@
+"""
+Retrieval over an account's message history (lexical + dense, fused).
+"""
+from .hybrid import HybridRetriever, reciprocal_rank_fusion, hit_key, hit_text
+from .bm25 import BM25Index, tokenize
+from .selection import SelectionStage, mmr_select, recency_decay
+from .cache import RetrievalCache
+
+__all__ = [
+    'HybridRetriever',
+    'reciprocal_rank_fusion',
+    'hit_key',
+    'hit_text',
+    'BM25Index',
+    'tokenize',
+    'SelectionStage',
+    'mmr_select',
+    'recency_decay',
+    'RetrievalCache'
+]
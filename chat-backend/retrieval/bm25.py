@@ -0,0 +1,444 @@
+"""
+In-process BM25 index over chat messages, partitioned per account.
+
+Each account has its own partition. A search only scores that account's
+documents, and its statistics (document count, average length, document
+frequencies) are the account's own. A message's ``text`` and ``response``
+form one document, keyed by the message _id.
+
+Postings are append-only. Documents get increasing ordinals within their
+partition, so a term's posting list is stored as delta-encoded doc ordinals
+in ``array('I')`` with a parallel ``array('I')`` of term frequencies (8
+bytes per posting). Scoring decodes a query term's list with one
+``np.cumsum`` and accumulates BM25 for every matching document in a few
+vector operations.
+
+Edits and deletes mark the old ordinal dead. Once a partition is mostly
+dead, compaction renumbers the live documents and rewrites their postings.
+
+Snapshots go to ``<dir>/<account>.npz``, one per partition, and
+``<dir>/manifest.json`` records the Mongo watermark they cover. At startup
+the index catches up on messages written or updated since then (also on an
+interval, which picks up other workers' writes). The watermark is inclusive,
+so each poll sees the newest messages again. Each document keeps a crc32 of
+its tokens, and a re-read whose tokens are unchanged is skipped. Without it,
+every poll would bump the account's generation and leave a dead slot.
+"""
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercased word tokens"""
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def _fingerprint(tokens: List[str]) -> int:
+    return zlib.crc32(" ".join(tokens).encode("utf-8"))
+
+
+def _partition_file(account_id: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(account_id)) + ".npz"
+
+
+class _Postings:
+    """One term's postings: delta-encoded doc ordinals + term frequencies"""
+    __slots__ = ("docs", "tfs", "last")
+
+    def __init__(self):
+        self.docs = array("I")
+        self.tfs = array("I")
+        self.last = 0
+
+    def append(self, doc: int, tf: int):
+        self.docs.append(doc - self.last)
+        self.tfs.append(tf)
+        self.last = doc
+
+    def decode(self) -> Tuple[np.ndarray, np.ndarray]:
+        # Copies, so no NumPy view pins the arrays' buffers (they couldn't grow while exported)
+        docs = np.cumsum(np.frombuffer(self.docs, dtype=np.uint32), dtype=np.int64)
+        tfs = np.frombuffer(self.tfs, dtype=np.uint32).astype(np.float32)
+        return docs, tfs
+
+    @classmethod
+    def encode(cls, docs: np.ndarray, tfs: np.ndarray) -> "_Postings":
+        postings = cls()
+        postings.docs.frombytes(np.diff(docs, prepend=0).astype(np.uint32).tobytes())
+        postings.tfs.frombytes(tfs.astype(np.uint32).tobytes())
+        postings.last = int(docs[-1]) if len(docs) else 0
+        return postings
+
+
+class _Partition:
+    """One account's documents and postings"""
+
+    def __init__(self):
+        self.keys: List[str] = []      # ordinal -> message id
+        self.lengths = array("I")      # ordinal -> token count
+        self.fingerprints = array("I") # ordinal -> crc32 of the tokens
+        self.alive = bytearray()       # ordinal -> 1 while live
+        self.doc_of: Dict[str, int] = {}
+        self.postings: Dict[str, _Postings] = {}
+        self.total_length = 0          # over live documents
+
+    @property
+    def live(self) -> int:
+        return len(self.doc_of)
+
+    def add(self, key: str, tokens: List[str]) -> bool:
+        """Index key's tokens; False (and nothing written) when they're already indexed as-is"""
+        fingerprint = _fingerprint(tokens)
+        doc = self.doc_of.get(key)
+        if doc is not None and self.fingerprints[doc] == fingerprint and self.lengths[doc] == len(tokens):
+            return False
+        self.remove(key)
+        doc = len(self.keys)
+        self.keys.append(key)
+        self.lengths.append(len(tokens))
+        self.fingerprints.append(fingerprint)
+        self.alive.append(1)
+        self.doc_of[key] = doc
+        self.total_length += len(tokens)
+        for term, tf in Counter(tokens).items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = _Postings()
+            postings.append(doc, tf)
+        return True
+
+    def remove(self, key: str) -> bool:
+        doc = self.doc_of.pop(key, None)
+        if doc is None:
+            return False
+        self.alive[doc] = 0
+        self.total_length -= self.lengths[doc]
+        return True
+
+    def search(self, terms: List[str], k: int, k1: float, b: float) -> List[Tuple[str, float]]:
+        if not self.live:
+            return []
+        alive = np.frombuffer(self.alive, dtype=np.uint8).astype(bool)
+        lengths = np.frombuffer(self.lengths, dtype=np.uint32).astype(np.float32)
+        norm = k1 * (1 - b + b * lengths / (self.total_length / self.live or 1.0))
+        scores = np.zeros(len(self.keys), dtype=np.float32)
+        for term in set(terms):
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            docs, tfs = postings.decode()
+            df = int(alive[docs].sum())
+            if df == 0:
+                continue
+            idf = math.log(1 + (self.live - df + 0.5) / (df + 0.5))
+            scores[docs] += idf * tfs * (k1 + 1) / (tfs + norm[docs])
+        scores[~alive] = 0
+        hits = np.flatnonzero(scores > 0)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(self.keys[doc], float(scores[doc])) for doc in hits]
+
+    @property
+    def dead(self) -> int:
+        return len(self.keys) - self.live
+
+    def compact(self):
+        """Renumber live documents densely and drop dead postings"""
+        alive = np.frombuffer(self.alive, dtype=np.uint8).astype(bool)
+        remap = np.cumsum(alive) - 1
+        postings = {}
+        for term, old in self.postings.items():
+            docs, tfs = old.decode()
+            keep = alive[docs]
+            if keep.any():
+                postings[term] = _Postings.encode(remap[docs[keep]], tfs[keep])
+        live = np.flatnonzero(alive)
+        self.keys = [self.keys[doc] for doc in live.tolist()]
+        self.lengths = array("I", np.frombuffer(self.lengths, dtype=np.uint32)[live].tobytes())
+        self.fingerprints = array("I", np.frombuffer(self.fingerprints, dtype=np.uint32)[live].tobytes())
+        self.alive = bytearray(b"\x01" * len(live))
+        self.doc_of = {key: doc for doc, key in enumerate(self.keys)}
+        self.postings = postings
+
+    def to_arrays(self) -> dict:
+        terms = list(self.postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(self.postings[term].docs) for term in terms])
+        docs, tfs = array("I"), array("I")
+        for term in terms:
+            docs.extend(self.postings[term].docs)
+            tfs.extend(self.postings[term].tfs)
+        header = json.dumps({"keys": self.keys, "terms": terms}).encode("utf-8")
+        return {
+            "header": np.frombuffer(header, dtype=np.uint8),
+            "lengths": np.frombuffer(self.lengths, dtype=np.uint32).copy(),
+            "fingerprints": np.frombuffer(self.fingerprints, dtype=np.uint32).copy(),
+            "offsets": offsets,
+            "docs": np.frombuffer(docs, dtype=np.uint32).copy(),
+            "tfs": np.frombuffer(tfs, dtype=np.uint32).copy(),
+        }
+
+    @classmethod
+    def from_arrays(cls, data) -> "_Partition":
+        partition = cls()
+        header = json.loads(bytes(data["header"]).decode("utf-8"))
+        partition.keys = header["keys"]
+        partition.lengths.frombytes(data["lengths"].astype(np.uint32).tobytes())
+        # Older snapshots have none: zeros just mean each document is re-indexed once
+        fingerprints = data["fingerprints"] if "fingerprints" in data.files else np.zeros(len(partition.keys))
+        partition.fingerprints.frombytes(fingerprints.astype(np.uint32).tobytes())
+        partition.alive = bytearray(b"\x01" * len(partition.keys))
+        partition.doc_of = {key: doc for doc, key in enumerate(partition.keys)}
+        partition.total_length = int(data["lengths"].sum())
+        offsets, docs, tfs = data["offsets"], data["docs"], data["tfs"]
+        for i, term in enumerate(header["terms"]):
+            postings = _Postings()
+            postings.docs.frombytes(docs[offsets[i]:offsets[i + 1]].tobytes())
+            postings.tfs.frombytes(tfs[offsets[i]:offsets[i + 1]].tobytes())
+            postings.last = int(docs[offsets[i]:offsets[i + 1]].sum(dtype=np.int64))
+            partition.postings[term] = postings
+        return partition
+
+
+class BM25Index:
+    """Per-account BM25 over message text + response, kept current through db hooks."""
+
+    def __init__(self, path: Optional[str] = None, k1: Optional[float] = None, b: Optional[float] = None,
+                 compact_ratio: Optional[float] = None):
+        """
+        Args:
+            path: Snapshot directory (None = memory only)
+            k1: Term-frequency saturation ($BM25_K1, default 1.2)
+            b: Length normalization ($BM25_B, default 0.75)
+            compact_ratio: Dead fraction of a partition that triggers compaction ($BM25_COMPACT_RATIO, default 0.5)
+        """
+        self.path = path
+        self.k1 = k1 or float(os.getenv("BM25_K1", 1.2))
+        self.b = b if b is not None else float(os.getenv("BM25_B", 0.75))
+        self.compact_ratio = compact_ratio or float(os.getenv("BM25_COMPACT_RATIO", 0.5))
+        self._lock = threading.RLock()
+        self._partitions: Dict[str, _Partition] = {}
+        self._account_of: Dict[str, str] = {}
+        self._dirty = set()
+        # Per-account change counters (see RetrievalCache)
+        self._generations: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._syncer = None
+        # Newest message timestamp/updated_at covered; catch_up resumes from here
+        self.synced_at: Optional[datetime] = None
+        # False until the first catch-up, so callers can fall back to Mongo $text
+        self.ready = False
+        self.searches = 0
+        self.search_seconds = 0.0
+        if path:
+            self._load()
+
+    def __len__(self):
+        return len(self._account_of)
+
+    def generation(self, account_id) -> int:
+        """Change counter for one account's partition"""
+        return self._generations.get(str(account_id), 0)
+
+    def _touch(self, account_id: str):
+        # Caller holds the lock
+        self._dirty.add(account_id)
+        self._generations[account_id] = self._generations.get(account_id, 0) + 1
+
+    # ─────────────────────────────────────────────────────────────────────
+    #  Updates
+    # ─────────────────────────────────────────────────────────────────────
+    def add(self, account_id, message_id, text: Optional[str] = None, response: Optional[str] = None) -> bool:
+        """Index (or re-index) one message; False when it's already indexed unchanged"""
+        account_id, message_id = str(account_id), str(message_id)
+        tokens = tokenize(text) + tokenize(response)
+        with self._lock:
+            previous = self._account_of.get(message_id)
+            if previous is not None and previous != account_id:
+                self._partitions[previous].remove(message_id)
+                self._touch(previous)
+            partition = self._partitions.get(account_id)
+            if partition is None:
+                partition = self._partitions[account_id] = _Partition()
+            if not partition.add(message_id, tokens):
+                return False
+            self._account_of[message_id] = account_id
+            self._touch(account_id)
+            self._maybe_compact(account_id)
+            return True
+
+    def add_docs(self, docs: Iterable[dict]) -> int:
+        """Index Mongo message documents (account_id, text, response); returns how many changed"""
+        count = 0
+        for doc in docs:
+            if doc.get("account_id") is None:
+                continue
+            count += self.add(doc["account_id"], doc["_id"], doc.get("text"), doc.get("response"))
+        return count
+
+    def remove(self, message_ids: Iterable) -> int:
+        removed = 0
+        with self._lock:
+            for message_id in message_ids:
+                message_id = str(message_id)
+                account_id = self._account_of.pop(message_id, None)
+                if account_id is None:
+                    continue
+                self._partitions[account_id].remove(message_id)
+                self._touch(account_id)
+                self._maybe_compact(account_id)
+                removed += 1
+        return removed
+
+    def _maybe_compact(self, account_id: str):
+        partition = self._partitions[account_id]
+        if partition.dead > 64 and partition.dead >= self.compact_ratio * len(partition.keys):
+            partition.compact()
+
+    # ─────────────────────────────────────────────────────────────────────
+    #  Search
+    # ─────────────────────────────────────────────────────────────────────
+    def search(self, account_id, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """(message_id, score) best first within the account"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        started = time.perf_counter()
+        with self._lock:
+            partition = self._partitions.get(str(account_id))
+            hits = partition.search(terms, k, self.k1, self.b) if partition is not None else []
+        self.searches += 1
+        self.search_seconds += time.perf_counter() - started
+        return hits
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "accounts": len(self._partitions),
+                "documents": len(self._account_of),
+                "terms": sum(len(partition.postings) for partition in self._partitions.values()),
+                "synced_at": self.synced_at.isoformat() if self.synced_at else None,
+                "searches": self.searches,
+                "avg_search_ms": round(1000 * self.search_seconds / self.searches, 3) if self.searches else 0.0,
+            }
+
+    # ─────────────────────────────────────────────────────────────────────
+    #  Sync with Mongo
+    # ─────────────────────────────────────────────────────────────────────
+    def catch_up(self, collection) -> int:
+        """Index messages written or updated since the watermark (everything on first run)"""
+        query = {}
+        if self.synced_at is not None:
+            query = {"$or": [{"timestamp": {"$gte": self.synced_at}}, {"updated_at": {"$gte": self.synced_at}}]}
+        newest = self.synced_at
+        count = 0
+        cursor = collection.find(query, {"account_id": 1, "text": 1, "response": 1, "timestamp": 1, "updated_at": 1})
+        for doc in cursor.batch_size(1000):
+            count += self.add_docs([doc])
+            for field in ("timestamp", "updated_at"):
+                value = doc.get(field)
+                if isinstance(value, datetime) and (newest is None or value > newest):
+                    newest = value
+        self.synced_at = newest
+        self.ready = True
+        return count
+
+    def start_sync(self, collection, interval: Optional[float] = None, snapshot_interval: Optional[float] = None):
+        """Catch up in a background thread, then keep polling and snapshotting"""
+        interval = interval or float(os.getenv("BM25_SYNC_INTERVAL", 30))
+        snapshot_interval = snapshot_interval or float(os.getenv("BM25_SNAPSHOT_INTERVAL", 300))
+
+        def loop():
+            last_snapshot = time.monotonic()
+            while True:
+                try:
+                    count = self.catch_up(collection)
+                    if count:
+                        logger.info(f"BM25 index caught up on {count} messages")
+                    if time.monotonic() - last_snapshot >= snapshot_interval:
+                        self.save()
+                        last_snapshot = time.monotonic()
+                except Exception as e:
+                    logger.warning(f"BM25 sync failed: {e}")
+                if self._stop.wait(interval):
+                    break
+
+        self._syncer = threading.Thread(target=loop, name="bm25-sync", daemon=True)
+        self._syncer.start()
+
+    # ─────────────────────────────────────────────────────────────────────
+    #  Snapshots
+    # ─────────────────────────────────────────────────────────────────────
+    def save(self):
+        """Write the partitions changed since the last save, then the manifest"""
+        if not self.path:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            snapshots = {}
+            for account_id in dirty:
+                partition = self._partitions[account_id]
+                if partition.dead:
+                    partition.compact()
+                snapshots[account_id] = partition.to_arrays()
+            # Small back-off so a message stamped just before the save is caught up again
+            synced_at = self.synced_at - timedelta(seconds=1) if self.synced_at else None
+
+        for account_id, arrays in snapshots.items():
+            path = os.path.join(self.path, _partition_file(account_id))
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as fh:
+                np.savez(fh, account_id=np.frombuffer(account_id.encode("utf-8"), dtype=np.uint8), **arrays)
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmp_path, path)
+
+        manifest = os.path.join(self.path, "manifest.json")
+        with open(manifest + ".tmp", "w") as fh:
+            json.dump({"synced_at": synced_at.isoformat() if synced_at else None}, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(manifest + ".tmp", manifest)
+
+    def _load(self):
+        manifest = os.path.join(self.path, "manifest.json")
+        if not os.path.exists(manifest):
+            return
+        with open(manifest) as fh:
+            synced_at = json.load(fh).get("synced_at")
+        for name in os.listdir(self.path):
+            if not name.endswith(".npz"):
+                continue
+            with np.load(os.path.join(self.path, name)) as data:
+                account_id = bytes(data["account_id"]).decode("utf-8")
+                partition = _Partition.from_arrays(data)
+            self._partitions[account_id] = partition
+            for key in partition.keys:
+                self._account_of[key] = account_id
+        self.synced_at = datetime.fromisoformat(synced_at) if synced_at else None
+        logger.info(f"BM25 index loaded {len(self._account_of)} messages in {len(self._partitions)} accounts")
+
+    def close(self):
+        self._stop.set()
+        if self._syncer is not None:
+            self._syncer.join()
+        self.save()
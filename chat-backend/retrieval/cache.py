@@ -0,0 +1,111 @@
+"""
+LRU cache of retrieval results, invalidated by index generation.
+
+Users often re-ask or refine the same question. Each retry would otherwise
+re-embed the query, search FAISS and BM25, hydrate from Mongo and re-run
+selection. Entries are keyed by a hash of the normalized query, the scope
+(account) and the call's parameters. Each entry stores the generation of the
+indexes it was computed against, as a tuple of counters that the vector
+store and the BM25 index bump on every add/remove in that scope. A lookup
+whose generation no longer matches is a miss, and the entry is dropped.
+Nothing has to be invalidated explicitly.
+
+The cache is bounded by entry count and by an estimate of its memory.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+def query_hash(query: str) -> str:
+    """Hash of the whitespace/case-normalized query"""
+    return hashlib.sha1(" ".join(query.lower().split()).encode("utf-8")).hexdigest()
+
+
+def _size_of(value: Any) -> int:
+    # Rough: serialized size is close enough to bound memory
+    return len(json.dumps(value, default=str))
+
+
+class RetrievalCache:
+    """Generation-checked LRU with item and byte limits, plus hit-rate counters."""
+
+    def __init__(self, max_items: Optional[int] = None, max_mb: Optional[float] = None):
+        """
+        Args:
+            max_items: Entry limit ($RETRIEVAL_CACHE_ITEMS, default 2048; 0 disables the cache)
+            max_mb: Estimated memory limit ($RETRIEVAL_CACHE_MB, default 64)
+        """
+        self.max_items = max_items if max_items is not None else int(os.getenv("RETRIEVAL_CACHE_ITEMS", 2048))
+        self.max_bytes = int((max_mb or float(os.getenv("RETRIEVAL_CACHE_MB", 64))) * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[Tuple, Any, int]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(kind: str, query: str, scope: Hashable, *params) -> Tuple:
+        return (kind, query_hash(query), scope, params)
+
+    def get(self, key: Hashable, generation: Tuple) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] != generation:
+                # The indexes changed under this scope since the entry was stored
+                del self._entries[key]
+                self.bytes -= entry[2]
+                self.stale += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, generation: Tuple, value: Any):
+        if self.max_items <= 0:
+            return
+        size = _size_of(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[2]
+            self._entries[key] = (generation, value, size)
+            self.bytes += size
+            while len(self._entries) > self.max_items or self.bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "items": len(self._entries),
+                "bytes": self.bytes,
+                "max_items": self.max_items,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,181 @@
+"""
+Hybrid lexical + dense retrieval with reciprocal rank fusion.
+
+Each leg is a coroutine ``leg(query, account_id, limit) -> list[dict]``
+returning hits best-first. Both legs start together and share one deadline.
+Legs still running when it passes are cancelled, and the result is fused
+from whatever finished, so a slow Mongo query or a cold embedding model costs
+recall rather than latency.
+
+Fusion is weighted reciprocal rank fusion,
+``score(d) = sum(weight[leg] / (rrf_k + rank_leg(d)))``, which needs no
+calibration between BM25-style and cosine scores. Hits are matched across
+legs by faiss_id when they have one, otherwise by message _id.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+Leg = Callable[[str, str, int], Awaitable[List[dict]]]
+
+
+def hit_key(hit: dict):
+    """Identity used to merge the same message across legs.
+
+    faiss_ids are only unique within one store, so hits from a shard
+    coordinator are keyed by (shard, faiss_id).
+    """
+    if hit.get("faiss_id"):
+        return ("faiss", hit.get("shard"), int(hit["faiss_id"]))
+    return ("message", str(hit.get("_id", hit.get("id"))))
+
+
+def hit_text(hit: dict) -> str:
+    """Prompt text for a hit (vector metadata has `message`; chat messages have text + response)"""
+    if hit.get("message"):
+        return hit["message"]
+    return "\n".join(part for part in (hit.get("text"), hit.get("response")) if part)
+
+
+def reciprocal_rank_fusion(ranked: Dict[str, List[dict]], weights: Dict[str, float], rrf_k: int = 60) -> List[dict]:
+    """Fuse best-first hit lists; each returned hit carries `score` and the `sources` it came from"""
+    fused = {}
+    for leg, hits in ranked.items():
+        weight = weights.get(leg, 1.0)
+        for rank, hit in enumerate(hits, start=1):
+            key = hit_key(hit)
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = {**hit, "score": 0.0, "sources": []}
+            else:
+                # Keep every field either leg knows about (e.g. text from Mongo, timestamp from FAISS)
+                for field, value in hit.items():
+                    entry.setdefault(field, value)
+            if "score" in hit:
+                entry[f"{leg}_score"] = hit["score"]
+            entry["score"] += weight / (rrf_k + rank)
+            entry["sources"].append(leg)
+    return sorted(fused.values(), key=lambda hit: hit["score"], reverse=True)
+
+
+class HybridRetriever:
+    """Runs retrieval legs concurrently under a deadline and fuses their rankings."""
+
+    def __init__(self, legs: Dict[str, Leg], weights: Optional[Dict[str, float]] = None,
+                 rrf_k: Optional[int] = None, deadline_ms: Optional[float] = None, candidates: Optional[int] = None,
+                 selector=None, cache=None, generation: Optional[Callable[[str], tuple]] = None):
+        """
+        Args:
+            legs: name -> coroutine function (query, account_id, limit) returning best-first hits
+            weights: name -> fusion weight ($HYBRID_<NAME>_WEIGHT, default 1.0)
+            rrf_k: RRF rank offset ($HYBRID_RRF_K, default 60)
+            deadline_ms: Overall budget for all legs ($HYBRID_DEADLINE_MS, default 300)
+            candidates: Hits requested from each leg per result wanted ($HYBRID_CANDIDATES, default 3)
+            selector: Optional SelectionStage that picks context() references from a wider fused pool
+            cache: Optional RetrievalCache for complete (no leg timed out or failed) results
+            generation: account_id -> tuple of index change counters the cached results depend on
+        """
+        self.legs = legs
+        self.weights = {name: float(os.getenv(f"HYBRID_{name.upper()}_WEIGHT", 1.0)) for name in legs}
+        self.weights.update(weights or {})
+        self.rrf_k = rrf_k or int(os.getenv("HYBRID_RRF_K", 60))
+        self.deadline_ms = deadline_ms or float(os.getenv("HYBRID_DEADLINE_MS", 300))
+        self.candidates = candidates or int(os.getenv("HYBRID_CANDIDATES", 3))
+        self.selector = selector
+        self.cache = cache
+        self.generation = generation
+        self.timeouts = {name: 0 for name in legs}
+        self.errors = {name: 0 for name in legs}
+
+    async def search(self, query: str, account_id: str, k: int = 10, weights: Optional[Dict[str, float]] = None,
+                     deadline_ms: Optional[float] = None) -> List[dict]:
+        """Top-k fused hits from whichever legs finish within the deadline"""
+        if not query or not query.strip():
+            return []
+        weights = {**self.weights, **(weights or {})}
+        return await self._cached("search", query, account_id, (k, tuple(sorted(weights.items()))),
+                                  lambda: self._search(query, account_id, k, weights, deadline_ms))
+
+    async def _cached(self, kind, query, account_id, params, compute):
+        """compute() -> (result, complete); complete results are cached against the scope's generation"""
+        if self.cache is None or self.generation is None:
+            return (await compute())[0]
+        cache_key = self.cache.key(kind, query, account_id, *params)
+        generation = self.generation(account_id)
+        result = self.cache.get(cache_key, generation)
+        if result is not None:
+            return result
+        result, complete = await compute()
+        # A write that landed mid-search may or may not be in the result: don't cache it
+        if complete and self.generation(account_id) == generation:
+            self.cache.put(cache_key, generation, result)
+        return result
+
+    async def _search(self, query, account_id, k, weights, deadline_ms):
+        limit = max(k * self.candidates, k)
+        tasks = {
+            asyncio.ensure_future(leg(query, account_id, limit)): name
+            for name, leg in self.legs.items()
+        }
+        started = time.perf_counter()
+        done, pending = await asyncio.wait(tasks, timeout=(deadline_ms or self.deadline_ms) / 1000)
+        for task in pending:
+            task.cancel()
+            self.timeouts[tasks[task]] += 1
+        if pending:
+            logger.info(f"Hybrid search deadline hit after {time.perf_counter() - started:.3f}s; "
+                        f"dropped {sorted(tasks[task] for task in pending)}")
+
+        ranked = {}
+        for task in done:
+            name = tasks[task]
+            if task.exception() is not None:
+                self.errors[name] += 1
+                logger.warning(f"Hybrid search leg {name} failed: {task.exception()}")
+                continue
+            ranked[name] = task.result() or []
+
+        hits = reciprocal_rank_fusion(ranked, weights, self.rrf_k)[:k]
+        return hits, len(ranked) == len(tasks)
+
+    async def context(self, query: str, account_id: str, k: int = 5, exclude: Optional[List[str]] = None,
+                      deadline_ms: Optional[float] = None) -> List[str]:
+        """Texts of the top hits for prompt context, skipping any already in `exclude`"""
+        if not query or not query.strip():
+            return []
+        exclude = tuple(sorted({text.strip() for text in exclude or [] if text}))
+        return await self._cached("context", query, account_id, (k, exclude),
+                                  lambda: self._context(query, account_id, k, exclude, deadline_ms))
+
+    async def _context(self, query, account_id, k, exclude, deadline_ms):
+        seen = set(exclude)
+        pool = k * self.selector.candidates if self.selector is not None else k
+        hits = []
+        fused, complete = await self._search(query, account_id, pool + len(seen), self.weights, deadline_ms)
+        for hit in fused:
+            text = hit_text(hit).strip()
+            if text and text not in seen:
+                seen.add(text)
+                hits.append(hit)
+        if self.selector is not None and len(hits) > k:
+            try:
+                hits = await self.selector.aselect(query, hits, k)
+            except Exception as e:
+                # Fused order is still a fine answer (just not one worth caching)
+                logger.warning(f"Reference selection failed: {e}")
+                complete = False
+        return [hit_text(hit).strip() for hit in hits[:k]], complete
+
+    def stats(self) -> dict:
+        return {
+            "weights": self.weights,
+            "rrf_k": self.rrf_k,
+            "deadline_ms": self.deadline_ms,
+            "timeouts": dict(self.timeouts),
+            "errors": dict(self.errors),
+            "cache": self.cache.stats() if self.cache is not None else None,
+        }
@@ -0,0 +1,124 @@
+"""
+Post-retrieval selection: recency-weighted relevance, then MMR.
+
+Fused retrieval often surfaces several near-identical (and old) messages.
+Spending the prompt's reference budget on them buys nothing. This stage
+re-scores a wider candidate set against the query embedding:
+
+    relevance = (1 - recency_weight) * cos(query, doc) + recency_weight * 0.5 ** (age / half_life)
+
+Hits already in the vector index reuse their stored vectors, so only the
+query and the remaining hits are encoded. It then picks references greedily
+by Maximal Marginal Relevance,
+``lambda * relevance - (1 - lambda) * max_sim(doc, selected)``. The
+candidate-candidate similarity matrix is computed once. Each pick is an
+argmax plus an ``np.maximum`` against the chosen row, so choosing 10 of 200
+costs a handful of vector operations.
+"""
+import os
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .hybrid import hit_text
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _unix_time(value) -> float:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, (int, float)) and value > 0:
+        return float(value)
+    return np.nan
+
+
+def recency_decay(timestamps: Sequence, half_life_hours: float, now: Optional[float] = None) -> np.ndarray:
+    """0.5 ** (age / half_life) per timestamp (unix seconds or datetime); unknown ages get 0.5"""
+    now = time.time() if now is None else now
+    times = np.array([_unix_time(value) for value in timestamps], dtype=np.float64)
+    age_hours = np.maximum(now - times, 0.0) / 3600.0
+    decay = np.power(0.5, age_hours / half_life_hours)
+    decay[np.isnan(times)] = 0.5
+    return decay
+
+
+def mmr_select(candidates: np.ndarray, relevance: np.ndarray, k: int, lambda_: float = 0.5) -> np.ndarray:
+    """Indices of k candidates chosen by MMR (candidates must be L2-normalized rows)"""
+    n = len(candidates)
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    similarity = candidates @ candidates.T
+    max_similarity = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    chosen = np.empty(k, dtype=np.int64)
+    for i in range(k):
+        # Nothing chosen yet: pure relevance
+        penalty = np.where(np.isfinite(max_similarity), max_similarity, 0.0)
+        scores = np.where(available, lambda_ * relevance - (1 - lambda_) * penalty, -np.inf)
+        pick = int(np.argmax(scores))
+        chosen[i] = pick
+        available[pick] = False
+        max_similarity = np.maximum(max_similarity, similarity[pick])
+    return chosen
+
+
+class SelectionStage:
+    """Re-ranks retrieved hits by recency-weighted similarity and diversifies them with MMR."""
+
+    def __init__(self, embed: Callable[[List[str]], Awaitable[np.ndarray]], lambda_: Optional[float] = None,
+                 recency_weight: Optional[float] = None, half_life_hours: Optional[float] = None,
+                 candidates: Optional[int] = None,
+                 vectors: Optional[Callable[[List[int]], Awaitable[Tuple[np.ndarray, np.ndarray]]]] = None):
+        """
+        Args:
+            embed: Coroutine function mapping texts to an (n, dim) embedding matrix
+            lambda_: Relevance vs. diversity trade-off ($RETRIEVAL_MMR_LAMBDA, default 0.5)
+            recency_weight: Share of relevance from recency ($RETRIEVAL_RECENCY_WEIGHT, default 0.2)
+            half_life_hours: Age at which recency halves ($RETRIEVAL_HALF_LIFE_HOURS, default 168)
+            candidates: Hits considered per reference wanted ($RETRIEVAL_MMR_CANDIDATES, default 4)
+            vectors: Optional coroutine function mapping faiss_ids to (found ids, stored vectors);
+                     hits found there aren't embedded again
+        """
+        self.embed = embed
+        self.vectors = vectors
+        self.lambda_ = lambda_ if lambda_ is not None else float(os.getenv("RETRIEVAL_MMR_LAMBDA", 0.5))
+        self.recency_weight = recency_weight if recency_weight is not None else \
+            float(os.getenv("RETRIEVAL_RECENCY_WEIGHT", 0.2))
+        self.half_life_hours = half_life_hours or float(os.getenv("RETRIEVAL_HALF_LIFE_HOURS", 168))
+        self.candidates = candidates or int(os.getenv("RETRIEVAL_MMR_CANDIDATES", 4))
+
+    def select(self, query_vector: np.ndarray, hits: List[dict], vectors: np.ndarray, k: int,
+               now: Optional[float] = None) -> List[dict]:
+        """Pick k of the hits given their embeddings (rows aligned with hits)"""
+        if len(hits) <= 1:
+            return hits[:k]
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        query_vector = _normalize(np.asarray(query_vector, dtype=np.float32).reshape(-1))
+        similarity = vectors @ query_vector
+        decay = recency_decay([hit.get("timestamp") for hit in hits], self.half_life_hours, now)
+        relevance = (1 - self.recency_weight) * similarity + self.recency_weight * decay.astype(np.float32)
+        return [hits[i] for i in mmr_select(vectors, relevance, k, self.lambda_).tolist()]
+
+    async def aselect(self, query: str, hits: List[dict], k: int) -> List[dict]:
+        """Embed the query and the hits without a stored vector, then select"""
+        if len(hits) <= 1:
+            return hits[:k]
+        stored = {}
+        ids = [int(hit["faiss_id"]) for hit in hits if hit.get("faiss_id")]
+        if self.vectors is not None and ids:
+            found_ids, found = await self.vectors(ids)
+            stored = dict(zip(np.asarray(found_ids).tolist(), found))
+        rows = [stored.get(int(hit["faiss_id"])) if hit.get("faiss_id") else None for hit in hits]
+        missing = [i for i, row in enumerate(rows) if row is None]
+
+        encoded = await self.embed([query] + [hit_text(hits[i]) for i in missing])
+        for i, vector in zip(missing, encoded[1:]):
+            rows[i] = vector
+        return self.select(encoded[0], hits, np.vstack(rows), k)
@@ -0,0 +1,70 @@
+"""
+Shared fixtures. Mongo is mongomock (requirements-dev.txt); FAISS and NumPy are real.
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Background consistency repair races the assertions; tests call it explicitly
+os.environ.setdefault("FAISS_CONSISTENCY", "off")
+
+# Manual scripts that need llama.cpp and local models
+collect_ignore = ["benchmark_m3.py", "qwen_chatml_llamacpp.py"]
+
+DIM = 16
+
+
+def unit_vectors(n, dim=DIM, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    mongomock = pytest.importorskip("mongomock")
+    client = mongomock.MongoClient()
+    import vectorstore.store
+    monkeypatch.setattr(vectorstore.store, "MongoClient", lambda *args, **kwargs: client)
+    return client
+
+
+@pytest.fixture
+def mongo_db(monkeypatch):
+    """The db module over a fresh mongomock database"""
+    mongomock = pytest.importorskip("mongomock")
+    if "db" not in sys.modules:
+        # db connects and creates its indexes at import
+        import pymongo
+        monkeypatch.setattr(pymongo, "MongoClient", mongomock.MongoClient)
+    import db
+    database = mongomock.MongoClient().chatbot_db
+    monkeypatch.setattr(db, "db", database)
+    for name in ("accounts", "chats", "messages", "summaries"):
+        monkeypatch.setattr(db, f"{name}_col", database[name])
+    monkeypatch.setattr(db, "_async_db", None)
+    # Hooks registered by whatever imported the routes don't outlive the test
+    monkeypatch.setattr(db, "_vector_hooks", {"chat_deleted": None, "message_edited": None})
+    monkeypatch.setattr(db, "_text_hooks", {"stored": None, "removed": None})
+    return db
+
+
+@pytest.fixture
+def make_store(tmp_path, mongo):
+    """VectorStore factory over tmp_path; reopening the same name simulates a restart"""
+    from vectorstore import VectorStore
+    stores = []
+
+    def make(name="index", **kwargs):
+        kwargs.setdefault("checkpoint_interval", 3600)
+        store = VectorStore(dim=DIM, index_path=str(tmp_path / f"{name}.idx"), **kwargs)
+        stores.append(store)
+        return store
+
+    yield make
+    for store in stores:
+        store.close()
@@ -0,0 +1,52 @@
+"""
+A shard server for test_coordinator.py, run as a subprocess:
+
+    python shard_node.py INDEX_PATH [SEARCH_DELAY_SECONDS]
+
+Metadata goes to mongomock. The bound port is the only thing written to
+stdout (the store's own output goes to stderr), once the server is up.
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("FAISS_CONSISTENCY", "off")
+
+import mongomock
+
+import vectorstore.store
+from vectorstore import VectorStore
+from vectorstore.remote import make_server
+
+DIM = 16
+
+
+def main():
+    index_path = sys.argv[1]
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    stdout, sys.stdout = sys.stdout, sys.stderr
+    client = mongomock.MongoClient()
+    vectorstore.store.MongoClient = lambda *args, **kwargs: client
+    store = VectorStore(dim=DIM, index_path=index_path, checkpoint_interval=3600)
+    if delay:
+        search_many = store.search_many
+
+        def slow_search_many(*args, **kwargs):
+            time.sleep(delay)
+            return search_many(*args, **kwargs)
+
+        store.search_many = slow_search_many
+
+    server = make_server(store)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(server.server_address[1], file=stdout, flush=True)
+    # Exit with the test run: the parent closes our stdin
+    sys.stdin.read()
+    server.shutdown()
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
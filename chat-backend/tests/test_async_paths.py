@@ -0,0 +1,146 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from conftest import unit_vectors
+
+
+class MotorCursor:
+    """Motor-style cursor over a mongomock one: chainable sort/limit, awaitable to_list"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self.cursor = self.cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, n):
+        self.cursor = self.cursor.limit(n)
+        return self
+
+    async def to_list(self, length=None):
+        docs = list(self.cursor)
+        return docs if length is None else docs[:length]
+
+
+class MotorCollection:
+    def __init__(self, collection, calls):
+        self.collection = collection
+        self.calls = calls
+
+    def find(self, *args, **kwargs):
+        self.calls.append("find")
+        return MotorCursor(self.collection.find(*args, **kwargs))
+
+    async def find_one(self, *args, **kwargs):
+        self.calls.append("find_one")
+        return self.collection.find_one(*args, **kwargs)
+
+
+class MotorDatabase:
+    """What AsyncIOMotorClient(...).chatbot_db looks like to db.py, backed by mongomock"""
+
+    def __init__(self, database):
+        self.database = database
+        self.calls = []
+
+    def __getattr__(self, name):
+        return MotorCollection(self.database[name], self.calls)
+
+
+@pytest.fixture(params=["threads", "motor"])
+def adb(request, mongo_db, monkeypatch):
+    """db with its async functions on the thread-pool fallback or a Motor-style client"""
+    offloaded = []
+    offload = mongo_db._offload
+
+    async def counting_offload(fn, *args, **kwargs):
+        offloaded.append(fn.__name__)
+        return await offload(fn, *args, **kwargs)
+
+    monkeypatch.setattr(mongo_db, "_offload", counting_offload)
+    motor = None
+    if request.param == "motor":
+        motor = MotorDatabase(mongo_db.db)
+        monkeypatch.setattr(mongo_db, "_async_db", motor)
+    else:
+        monkeypatch.setattr(mongo_db, "AsyncIOMotorClient", None)
+    mongo_db.offloaded, mongo_db.motor = offloaded, motor
+    return mongo_db
+
+
+def seed(db):
+    account_id = db.create_account("user", "user@example.com", "hash")
+    chat_id = db.create_chat(account_id, "chat")
+    ids = [db.store_message(account_id, chat_id, f"text {i}", f"reply {i}", faiss_id=i + 1).inserted_id
+           for i in range(3)]
+    return account_id, chat_id, ids
+
+
+def test_reads(adb):
+    account_id, chat_id, ids = seed(adb)
+
+    async def run():
+        return await asyncio.gather(
+            adb.aget_account(str(account_id)),
+            adb.aget_chat(str(chat_id)),
+            adb.aget_recent_messages(str(chat_id), limit=2, as_dict=True),
+            adb.aget_by_ids([1, 3]),
+            adb.aget_messages([str(ids[0]), str(ids[2])]),
+            adb.aget_account_messages(str(account_id), [str(ids[0])], [2]),
+        )
+
+    account, chat, recent, by_faiss, by_id, by_either = asyncio.run(run())
+    assert account["username"] == "user" and chat["title"] == "chat"
+    assert recent == adb.get_recent_messages(str(chat_id), limit=2, as_dict=True)
+    assert len(recent) == 2 and recent[0]["role"] == "assistant"
+    assert sorted(doc["faiss_id"] for doc in by_faiss) == [1, 3]
+    assert sorted(doc["_id"] for doc in by_id) == sorted([ids[0], ids[2]])
+    assert sorted(doc["faiss_id"] for doc in by_either) == [1, 2]
+
+    if adb.motor is not None:
+        assert adb.offloaded == [] and adb.motor.calls
+    else:
+        assert sorted(adb.offloaded) == sorted(["get_account", "get_chat", "get_recent_messages", "get_by_ids",
+                                                "get_messages", "get_account_messages"])
+
+
+def test_writes_always_use_the_thread_pool(adb):
+    # Stores and updates run the statistics and hook logic of the sync functions
+    account_id, chat_id, _ = seed(adb)
+
+    async def run():
+        stored = await adb.astore_message(str(account_id), str(chat_id), "async text", None)
+        await adb.aupdate_message(str(stored.inserted_id), response="async reply")
+        return stored.inserted_id
+
+    message_id = asyncio.run(run())
+    doc = adb.messages_col.find_one({"_id": message_id})
+    assert doc["text"] == "async text" and doc["response"] == "async reply" and "updated_at" in doc
+    assert adb.accounts_col.find_one({"_id": account_id})["statistics"]["total_messages"] == 4
+    assert adb.offloaded == ["store_message", "update_message"]
+
+
+def test_vector_store_async_wrappers_match_the_sync_calls(make_store):
+    store = make_store()
+    vectors = unit_vectors(6, seed=5)
+
+    async def run():
+        first = await store.aadd(vectors[0], "m0", "conv", "acct")
+        rest = await store.aadd_many(vectors[1:], [f"m{i}" for i in range(1, 6)], ["conv"] * 5, ["acct"] * 5)
+        return [first] + rest, await asyncio.gather(
+            store.asearch(vectors[2], k=2, account_id="acct"),
+            store.asearch_many(vectors[:2], k=1),
+            store.avectors([first, rest[0]]),
+            store.asearch_in_conversation(vectors[3], "conv", k=1),
+        )
+
+    ids, (hits, many, found, in_conversation) = asyncio.run(run())
+    assert hits == store.search(vectors[2], k=2, account_id="acct") and hits[0]["faiss_id"] == ids[2]
+    assert [rows[0]["faiss_id"] for rows in many] == ids[:2]
+    found_ids, found_vectors = found
+    assert list(found_ids) == ids[:2]
+    np.testing.assert_allclose(found_vectors, vectors[:2], rtol=1e-6)
+    assert in_conversation[0]["faiss_id"] == ids[3]
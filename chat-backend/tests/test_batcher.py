@@ -0,0 +1,106 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from embeddings.batcher import EmbeddingBatcher
+
+
+def fake_encode(calls):
+    def encode(texts):
+        calls.append(list(texts))
+        return np.array([[len(text), i] for i, text in enumerate(texts)], dtype=np.float32)
+    return encode
+
+
+def test_concurrent_callers_share_a_batch():
+    calls = []
+    batcher = EmbeddingBatcher(fake_encode(calls), max_batch_size=8, max_wait_ms=200)
+    barrier = threading.Barrier(8)
+    results = {}
+
+    def caller(i):
+        barrier.wait()
+        results[i] = batcher.embed("x" * i, timeout=5)
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.close()
+
+    assert len(calls) <= 2 and sum(len(batch) for batch in calls) == 8
+    # Each caller gets its own row back
+    assert all(results[i][0] == i for i in range(8))
+    assert batcher.stats()["items"] == 8
+
+
+def test_batches_are_capped_at_max_batch_size():
+    calls = []
+    batcher = EmbeddingBatcher(fake_encode(calls), max_batch_size=3, max_wait_ms=100)
+    futures = [batcher.submit(f"t{i}") for i in range(7)]
+    for future in futures:
+        future.result(timeout=5)
+    batcher.close()
+    assert max(len(batch) for batch in calls) <= 3
+    assert [text for batch in calls for text in batch] == [f"t{i}" for i in range(7)]
+
+
+def test_encode_errors_reach_every_caller_in_the_batch():
+    def encode(texts):
+        raise RuntimeError("model unavailable")
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=4, max_wait_ms=50)
+    futures = [batcher.submit(str(i)) for i in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="model unavailable"):
+            future.result(timeout=5)
+    batcher.close()
+
+
+def test_short_encode_result_fails_the_whole_batch():
+    gate = threading.Event()
+
+    def encode(texts):
+        gate.wait(5)
+        return np.zeros((len(texts) - 1, 2), dtype=np.float32)
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=4, max_wait_ms=50)
+    futures = [batcher.submit(str(i)) for i in range(3)]
+    gate.set()
+    for future in futures:
+        with pytest.raises(ValueError, match="rows"):
+            future.result(timeout=5)
+    batcher.close()
+
+
+def test_cancelled_requests_are_not_encoded():
+    calls = []
+    gate = threading.Event()
+
+    def encode(texts):
+        gate.wait(5)
+        return fake_encode(calls)(texts)
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=1, max_wait_ms=0)
+    first = batcher.submit("first")      # occupies the worker
+    dropped = batcher.submit("dropped")
+    assert dropped.cancel()
+    gate.set()
+    first.result(timeout=5)
+    batcher.close()
+    assert calls == [["first"]]
+
+
+def test_async_api():
+    calls = []
+    batcher = EmbeddingBatcher(fake_encode(calls), max_batch_size=4, max_wait_ms=50)
+
+    async def run():
+        return await asyncio.gather(*(batcher.embed_async("y" * i) for i in range(4)))
+
+    vectors = asyncio.run(run())
+    batcher.close()
+    assert [vector[0] for vector in vectors] == [0, 1, 2, 3]
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from retrieval import BM25Index
+from retrieval.bm25 import _Postings, _Partition, tokenize
+
+
+def test_postings_round_trip_through_delta_encoding():
+    postings = _Postings()
+    for doc, tf in [(0, 1), (3, 2), (70000, 5)]:
+        postings.append(doc, tf)
+    docs, tfs = postings.decode()
+    assert docs.tolist() == [0, 3, 70000] and tfs.tolist() == [1, 2, 5]
+    again = _Postings.encode(docs, tfs)
+    assert again.docs == postings.docs and again.last == 70000
+
+
+def test_ranking_and_account_isolation():
+    index = BM25Index()
+    index.add("a", "m1", "the cat sat on the mat")
+    index.add("a", "m2", "dogs and cats", "a dog barked")
+    index.add("a", "m3", "nothing relevant here")
+    index.add("b", "m4", "dog dog dog")
+    hits = index.search("a", "dog")
+    assert [key for key, _ in hits] == ["m2"]
+    assert index.search("b", "dog")[0][0] == "m4"
+    assert index.search("c", "dog") == []
+    assert index.search("a", "!!!") == []
+
+
+def test_edits_and_removes_replace_postings():
+    index = BM25Index()
+    index.add("a", "m1", "apple pie")
+    index.add("a", "m1", "banana bread")
+    assert index.search("a", "apple") == []
+    assert [key for key, _ in index.search("a", "banana")] == ["m1"]
+    assert index.remove(["m1", "unknown"]) == 1
+    assert index.search("a", "banana") == []
+
+
+def test_compaction_keeps_scores():
+    partition = _Partition()
+    for i in range(200):
+        partition.add(f"m{i}", tokenize(f"word{i % 7} common filler {i}"))
+    for i in range(200):
+        if i % 7 != 3:
+            partition.remove(f"m{i}")
+    expected = partition.search(["word3", "common"], 5, 1.2, 0.75)
+    partition.compact()
+    assert partition.dead == 0 and len(partition.keys) == partition.live
+    assert partition.search(["word3", "common"], 5, 1.2, 0.75) == pytest.approx(expected)
+
+
+def test_snapshot_round_trip(tmp_path):
+    index = BM25Index(str(tmp_path))
+    index.add("acct/1", "m1", "snapshot me please")
+    index.add("acct/1", "m2", "and me")
+    index.synced_at = datetime(2024, 1, 1, 12, 0, 0)
+    index.save()
+
+    reopened = BM25Index(str(tmp_path))
+    assert len(reopened) == 2
+    assert reopened.search("acct/1", "snapshot") == index.search("acct/1", "snapshot")
+    # The manifest backs off a second so late writers stamped just before the save are re-read
+    assert reopened.synced_at == datetime(2024, 1, 1, 11, 59, 59)
+    # Re-reading the same text after a restart is still a no-op
+    assert reopened.add("acct/1", "m1", "snapshot me please") is False
+
+
+def test_catch_up_skips_unchanged_boundary_docs():
+    mongomock = pytest.importorskip("mongomock")
+    messages = mongomock.MongoClient().db.messages
+    now = datetime(2024, 1, 1, 12, 0, 0)
+    messages.insert_many([
+        {"account_id": "a", "text": "first message", "timestamp": now - timedelta(minutes=1)},
+        {"account_id": "a", "text": "second message", "timestamp": now},
+    ])
+    index = BM25Index()
+    assert index.catch_up(messages) == 2
+    generation = index.generation("a")
+
+    # Same watermark again ($gte): the newest doc comes back but nothing changes
+    assert index.catch_up(messages) == 0
+    assert index.generation("a") == generation
+    assert index._partitions["a"].dead == 0
+
+    messages.update_one({"text": "second message"},
+                        {"$set": {"text": "second message, edited", "updated_at": now + timedelta(seconds=5)}})
+    assert index.catch_up(messages) == 1
+    assert index.generation("a") == generation + 1
+    edited = messages.find_one({"updated_at": {"$exists": True}})
+    assert [key for key, _ in index.search("a", "edited")] == [str(edited["_id"])]
@@ -0,0 +1,74 @@
+import numpy as np
+
+from conftest import unit_vectors
+
+
+def seeded(make_store, name="index", **kwargs):
+    """A store with an orphaned vector (Mongo doc gone), a missing one (no vector) and a removed one"""
+    kwargs.setdefault("compact_threshold", 0.9)  # keep the removed id tombstoned
+    store = make_store(name, **kwargs)
+    vectors = unit_vectors(6, seed=3)
+    ids = store.add_many(vectors[:4], [f"m{i}" for i in range(4)], ["c"] * 4, ["acct"] * 4)
+    orphan, removed = ids[0], ids[1]
+    store.collection.delete_one({"faiss_id": orphan})
+    store.remove([removed])
+    missing = int(store.metadata.allocator.allocate(1)[0])
+    store.collection.insert_one({"faiss_id": missing, "message": "lost vector", "conversation_id": "c",
+                                 "account_id": "acct", "timestamp": 1.0, "embedding": vectors[5].tolist()})
+    return store, ids, orphan, missing, vectors[5]
+
+
+def test_report_only_changes_nothing(make_store):
+    store, ids, orphan, missing, _ = seeded(make_store)
+    report = store.check_consistency(repair=False)
+    assert report["missing_sample"] == [missing] and report["orphaned_sample"] == [orphan]
+    assert report["repaired"] is False and report["readded"] == report["removed"] == 0
+    # Tombstoned ids are neither indexed nor expected
+    assert report["indexed"] == 3 and report["mongo"] == 3
+    assert not store.tombstones.contains(np.array([orphan])).any()
+
+
+def test_repair_readds_missing_and_removes_orphans(make_store):
+    store, ids, orphan, missing, vector = seeded(make_store)
+    report = store.check_consistency(repair=True)
+    assert (report["readded"], report["reembedded"], report["removed"]) == (1, 0, 1)
+    assert store.search(vector, k=1, account_id="acct")[0]["faiss_id"] == missing
+    assert store.tombstones.contains(np.array([orphan])).all()
+    again = store.check_consistency(repair=True)
+    assert again["missing"] == again["orphaned"] == 0
+
+
+def test_tombstoned_ids_are_not_readded(make_store):
+    store, ids, *_ = seeded(make_store)
+    removed = ids[1]
+    # A late Mongo write for an id that was removed meanwhile
+    store.collection.insert_one({"faiss_id": removed, "message": "m1", "embedding": unit_vectors(1)[0].tolist()})
+    report = store.check_consistency(repair=True)
+    assert removed in report["missing_sample"]
+    assert store.tombstones.contains(np.array([removed])).all()
+    assert all(hit["faiss_id"] != removed for hit in store.search(unit_vectors(6, seed=3)[1], k=5))
+
+
+def test_default_mode_only_reports(make_store, monkeypatch):
+    monkeypatch.delenv("FAISS_CONSISTENCY")
+    store, _, orphan, _, _ = seeded(make_store)
+    store.close()
+    reopened = make_store()
+    reopened._consistency_thread.join(5)
+    assert reopened.consistency.last_report["orphaned_sample"] == [orphan]
+    assert reopened.consistency.last_report["repaired"] is False
+
+
+def test_check_does_not_load_closed_shards(make_store, tmp_path):
+    store = make_store("sharded", shard_dir=str(tmp_path / "shards"))
+    vectors = unit_vectors(4, seed=4)
+    store.add_many(vectors, ["a0", "a1", "b0", "b1"], ["ca", "ca", "cb", "cb"], ["a", "a", "b", "b"])
+    store.close()
+
+    reopened = make_store("sharded", shard_dir=str(tmp_path / "shards"))
+    report = reopened.check_consistency(repair=False)
+    assert report["indexed"] == report["mongo"] == 4 and report["missing"] == report["orphaned"] == 0
+    assert reopened.shards.loads == 0
+    # An open shard is read from its index
+    reopened.search(vectors[0], k=1, account_id="a")
+    assert reopened.check_consistency(repair=False)["indexed"] == 4 and reopened.shards.loads == 1
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from conftest import DIM, unit_vectors
+from vectorstore.index_manager import HNSW, IVF, IndexManager
+
+
+def test_conversation_matrix_comes_from_the_index(make_store, monkeypatch):
+    store = make_store()
+    vectors = unit_vectors(12, seed=1)
+    ids = store.add_many(vectors, [f"m{i}" for i in range(12)], ["a" if i % 2 else "b" for i in range(12)],
+                         ["acct"] * 12)
+
+    def no_encode(*args, **kwargs):
+        raise AssertionError("conversation vectors were re-embedded")
+
+    monkeypatch.setattr(store, "_embeddings_for", no_encode)
+    hits = store.search_in_conversation(vectors[3], "a", k=3, fields=("message", "conversation_id"))
+    assert hits[0]["faiss_id"] == ids[3]
+    assert {hit["conversation_id"] for hit in hits} == {"a"}
+    in_a = vectors[1::2]
+    assert [hit["score"] for hit in hits] == pytest.approx(sorted(in_a @ vectors[3], reverse=True)[:3], abs=1e-5)
+
+
+@pytest.mark.parametrize("kind,found", [(HNSW, True), (IVF, False)])
+def test_index_vectors_read_back(kind, found):
+    manager = IndexManager(DIM)
+    vectors = unit_vectors(300, seed=2)
+    ids = np.arange(1000, 1300, dtype=np.int64)
+    manager.replace(manager.build(ids, vectors, kind))
+
+    wanted = ids[[5, 17, 200]]
+    got_ids, got = manager.vectors(wanted)
+    if found:
+        assert sorted(got_ids.tolist()) == wanted.tolist()
+        order = np.argsort(got_ids)
+        np.testing.assert_allclose(got[order], vectors[[5, 17, 200]], rtol=1e-6)
+    else:
+        assert len(got_ids) == 0 and got.shape == (0, DIM)
@@ -0,0 +1,159 @@
+"""
+ShardCoordinator against real shard servers (tests/shard_node.py subprocesses):
+merging, account routing, and the deadline with a slow or a dead node.
+"""
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import unit_vectors
+
+pytest.importorskip("mongomock")
+
+from retrieval import hit_key
+from vectorstore import ShardCoordinator
+
+NODE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shard_node.py")
+
+
+@pytest.fixture(scope="module")
+def start_node(tmp_path_factory):
+    nodes = []
+
+    def start(delay=0.0):
+        index_path = tmp_path_factory.mktemp("node") / "node.idx"
+        node = subprocess.Popen([sys.executable, NODE, str(index_path), str(delay)],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        nodes.append(node)
+        port = node.stdout.readline().strip()
+        assert port, "shard node failed to start"
+        return f"http://127.0.0.1:{port}"
+
+    yield start
+    for node in nodes:
+        node.stdin.close()
+    for node in nodes:
+        try:
+            node.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            node.kill()
+
+
+@pytest.fixture(scope="module")
+def fast_nodes(start_node):
+    return [start_node(), start_node()]
+
+
+def dead_url():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def accounts_by_shard(coordinator, prefix="account", n=2):
+    """One account id that routes to each shard"""
+    found = {}
+    for i in range(1000):
+        found.setdefault(coordinator.shard_for(f"{prefix}-{i}"), f"{prefix}-{i}")
+        if len(found) == n:
+            return [found[shard] for shard in range(n)]
+    raise AssertionError("no account routes to every shard")
+
+
+def test_search_merges_both_nodes(fast_nodes):
+    coordinator = ShardCoordinator(fast_nodes, deadline_ms=2000)
+    try:
+        accounts = accounts_by_shard(coordinator)
+        vectors = unit_vectors(8, seed=1)
+        owners = [accounts[i % 2] for i in range(8)]
+        added = coordinator.add_many(vectors, [f"m{i}" for i in range(8)], ["c"] * 8, owners)
+        assert [shard for shard, _ in added] == [coordinator.shard_for(a) for a in owners]
+
+        hits = coordinator.search_many(vectors, k=8, fields=("message",))
+        for i, row in enumerate(hits):
+            assert row[0]["message"] == f"m{i}"
+            assert {hit["shard"] for hit in row} == {0, 1}
+            scores = [hit["score"] for hit in row]
+            assert scores == sorted(scores, reverse=True)
+        # Each node allocates its own ids, so the same faiss_id comes back from both;
+        # hit_key keeps them apart
+        assert {faiss_id for shard, faiss_id in added if shard == 0} == \
+            {faiss_id for shard, faiss_id in added if shard == 1}
+        assert len({hit_key(hit) for hit in hits[0]}) == len(hits[0]) == 8
+        assert coordinator.partial == 0
+    finally:
+        coordinator.close()
+
+
+def test_writes_route_to_the_account_node(fast_nodes):
+    coordinator = ShardCoordinator(fast_nodes, deadline_ms=2000)
+    try:
+        owner = accounts_by_shard(coordinator, "writer")[1]
+        vector = unit_vectors(1, seed=2)
+        shard, faiss_id = coordinator.add(vector[0], "before", "chat-x", owner)
+        assert shard == 1
+
+        new_id = coordinator.update(faiss_id, vector[0], "after", account_id=owner)
+        hits = coordinator.search(vector[0], k=1, account_id=owner, fields=("message",))
+        assert [(hit["faiss_id"], hit["message"], hit["shard"]) for hit in hits] == [(new_id, "after", 1)]
+
+        assert coordinator.store_for(owner).remove_conversation("chat-x") == 1
+        assert coordinator.search(vector[0], k=1, account_id=owner) == []
+    finally:
+        coordinator.close()
+
+
+def test_slow_node_is_dropped_at_the_deadline(start_node, fast_nodes):
+    coordinator = ShardCoordinator([fast_nodes[0], start_node(delay=2.0)], deadline_ms=300, connections=1)
+    try:
+        vector = unit_vectors(1, seed=3)
+        coordinator.add_many(vector, ["fast"], account_ids=[accounts_by_shard(coordinator)[0]])
+
+        started = time.perf_counter()
+        hits = coordinator.search(vector[0], k=3, fields=("message",))
+        assert time.perf_counter() - started < 1.5
+        assert hits and {hit["shard"] for hit in hits} == {0}
+        assert coordinator.clients[1].timeouts == 1
+
+        # The slow node's only worker is still busy: it's skipped without waiting for it
+        started = time.perf_counter()
+        coordinator.search(vector[0], k=3)
+        assert time.perf_counter() - started < 1.0
+        assert coordinator.clients[1].timeouts == 2
+        assert coordinator.clients[1].inflight == 1
+        assert coordinator.clients[0].timeouts == 0
+        assert coordinator.partial == 2
+    finally:
+        coordinator.close()
+
+
+def test_dead_node_is_an_error_not_a_stall(fast_nodes):
+    coordinator = ShardCoordinator([fast_nodes[0], dead_url()], deadline_ms=2000)
+    try:
+        vector = unit_vectors(1, seed=4)
+        coordinator.clients[0].add_many(vector, ["alive"])
+        hits = coordinator.search(vector[0], k=1, fields=("message",))
+        assert [(hit["message"], hit["shard"]) for hit in hits] == [("alive", 0)]
+        assert coordinator.clients[1].errors == 1
+        assert coordinator.partial == 1
+        assert [node["ok"] for node in coordinator.health()] == [True, False]
+    finally:
+        coordinator.close()
+
+
+def test_connections_are_reused(fast_nodes):
+    coordinator = ShardCoordinator(fast_nodes[:1], deadline_ms=2000)
+    try:
+        client = coordinator.clients[0]
+        query = unit_vectors(1, seed=5)[0]
+        coordinator.search(query, k=1)
+        conn = client._idle[0]
+        for _ in range(3):
+            coordinator.search(query, k=1)
+        assert client._idle == [conn]
+    finally:
+        coordinator.close()
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from conftest import unit_vectors
+from embeddings.cache import KEY_SIZE, EmbeddingCache
+
+DIM = 8
+
+
+def make(tmp_path, **kwargs):
+    kwargs.setdefault("model_name", "model-a")
+    return EmbeddingCache(str(tmp_path / "cache"), dim=DIM, **kwargs)
+
+
+def test_key_covers_model_instruction_and_normalized_text():
+    a = EmbeddingCache(None, DIM, "model-a")
+    b = EmbeddingCache(None, DIM, "model-b")
+    assert len(a.key("hello")) == KEY_SIZE
+    assert a.key("hello  world") == a.key(" hello world\n")
+    assert a.key("hello") != a.key("hello", "query: ")
+    assert a.key("hello") != b.key("hello")
+    # Length-prefixed parts: moving text between fields changes the key
+    assert a.key("b", "a") != a.key("ab", "")
+
+
+def test_memory_then_slab_hits(tmp_path):
+    vectors = unit_vectors(3, dim=DIM)
+    cache = make(tmp_path, max_memory_items=2)
+    assert cache.get("x") is None
+    cache.put_many(["a", "b", "c"], vectors)  # "a" falls out of the LRU
+    np.testing.assert_array_equal(cache.get("c"), vectors[2])
+    np.testing.assert_array_equal(cache.get("a"), vectors[0])
+    assert cache.stats()["memory_hits"] == 1 and cache.stats()["disk_hits"] == 1
+    assert cache.stats()["misses"] == 1
+    cache.close()
+
+
+def test_cached_vectors_are_read_only_copies(tmp_path):
+    cache = make(tmp_path)
+    vector = unit_vectors(1, dim=DIM)[0]
+    cache.put("a", vector)
+    vector[:] = 0  # the caller reusing its buffer doesn't change the cache
+    hit = cache.get("a")
+    assert hit.any() and not hit.flags.writeable
+    with pytest.raises(ValueError):
+        hit /= 2
+    np.testing.assert_array_equal(cache.get("a"), hit)
+    cache.close()
+
+
+def test_slab_grows_and_reopens_from_the_index_file(tmp_path):
+    vectors = unit_vectors(50, dim=DIM, seed=1)
+    texts = [f"text {i}" for i in range(50)]
+    cache = make(tmp_path, initial_capacity=4, max_memory_items=1)
+    cache.put_many(texts[:30], vectors[:30])
+    for text, vector in zip(texts[30:], vectors[30:]):
+        cache.put(text, vector)
+    assert cache._capacity >= 50
+    cache.close()
+
+    reopened = make(tmp_path, max_memory_items=1)
+    assert reopened.stats()["disk_items"] == 50
+    np.testing.assert_array_equal(np.vstack(reopened.get_many(texts)), vectors)
+    assert reopened.stats()["disk_hits"] == 50
+    # Another model never sees these vectors
+    assert make(tmp_path, model_name="model-b").get(texts[0]) is None
+
+
+def test_torn_index_tail_is_dropped(tmp_path):
+    cache = make(tmp_path)
+    cache.put_many(["a", "b"], unit_vectors(2, dim=DIM))
+    cache.close()
+    with open(tmp_path / "cache.idx", "ab") as fh:
+        fh.write(b"\x00" * (KEY_SIZE // 2))
+    reopened = make(tmp_path)
+    assert reopened.stats()["disk_items"] == 2 and reopened.get("b") is not None
+
+
+def test_memory_only_by_default(tmp_path, monkeypatch):
+    import embeddings
+    monkeypatch.delenv("EMBEDDING_CACHE_PATH", raising=False)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(embeddings, "_cache", None)
+    cache = embeddings.get_cache()
+    assert cache.slab_path is None
+    cache.put("a", np.ones(embeddings.EMBEDDING_DIM, dtype=np.float32))
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,111 @@
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+import pytest
+
+from embeddings.model import FAILED, LOADING, READY, UNLOADED, EmbeddingModelManager
+
+
+class FakeSentenceTransformer:
+    """Stands in for sentence_transformers.SentenceTransformer; loading takes a moment"""
+
+    loads = 0
+    fail = False
+    loading = None  # set while a load is in progress
+    release = None  # the load waits for this
+
+    def __init__(self, model_name, device=None):
+        type(self).loads += 1
+        if self.loading is not None:
+            self.loading.set()
+        if self.release is not None:
+            self.release.wait(5)
+        else:
+            time.sleep(0.05)
+        if self.fail:
+            raise OSError("weights not found")
+        self.model_name, self.device = model_name, device
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded.append(list(texts))
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    model = type("Fake", (FakeSentenceTransformer,), {})
+    monkeypatch.setitem(sys.modules, "sentence_transformers", types.SimpleNamespace(SentenceTransformer=model))
+    return model
+
+
+def test_concurrent_callers_load_the_model_once(fake_model):
+    manager = EmbeddingModelManager("some/model", backend="torch")
+    barrier = threading.Barrier(8)
+    models = []
+
+    def caller():
+        barrier.wait()
+        models.append(manager.get())
+
+    threads = [threading.Thread(target=caller) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert fake_model.loads == 1
+    assert len(models) == 8 and all(model is models[0] for model in models)
+    assert models[0].model_name == "some/model" and models[0].device == "cpu"
+
+
+def test_status_moves_through_loading_to_ready(fake_model):
+    fake_model.loading, fake_model.release = threading.Event(), threading.Event()
+    manager = EmbeddingModelManager("some/model", backend="torch")
+    assert manager.status()["state"] == UNLOADED and not manager.is_ready()
+
+    thread = manager.warmup_in_background()
+    assert fake_model.loading.wait(5)
+    assert manager.state == LOADING and not manager.wait_until_ready(0.01)
+    fake_model.release.set()
+    assert manager.wait_until_ready(5)
+    thread.join(5)
+
+    status = manager.status()
+    assert status["state"] == READY and status["ready"] and status["error"] is None
+    assert status["load_seconds"] is not None
+    # The warmup ran a dummy encode
+    assert manager.get().encoded == [["warmup"]]
+
+
+def test_failed_load_is_reported_and_retried(fake_model):
+    fake_model.fail = True
+    manager = EmbeddingModelManager("missing/model", backend="torch")
+    manager.warmup()  # swallowed: a later request retries
+    assert manager.state == FAILED and "weights not found" in manager.error and not manager.is_ready()
+    with pytest.raises(OSError):
+        manager.get()
+
+    fake_model.fail = False
+    assert manager.get() is not None
+    assert manager.state == READY and manager.error is None and fake_model.loads == 3
+
+
+def test_configuration_comes_from_the_environment(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_MODEL", "env/model")
+    monkeypatch.setenv("EMBEDDING_DEVICE", "cuda:1")
+    monkeypatch.setenv("EMBEDDING_THREADS", "3")
+    monkeypatch.setenv("EMBEDDING_BACKEND", "ONNX")
+    manager = EmbeddingModelManager()
+    assert (manager.model_name, manager.device, manager.num_threads, manager.backend) == \
+        ("env/model", "cuda:1", 3, "onnx")
+    # int8 vectors get their own cache keys
+    assert manager.cache_identity == "env/model#onnx-int8"
+
+    monkeypatch.setenv("EMBEDDING_BACKEND", "tensorrt")
+    monkeypatch.delenv("EMBEDDING_THREADS")
+    manager = EmbeddingModelManager(model_name="arg/model")
+    assert manager.backend == "torch" and manager.num_threads is None
+    assert manager.cache_identity == "arg/model"
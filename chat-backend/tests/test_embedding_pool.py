@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from embeddings.pool import EmbeddingPool
+
+
+def _worker_state():
+    """Runs in a pool worker: what the embeddings package would use there"""
+    import embeddings
+    opened_at_import = embeddings._cache is not None
+    cache = embeddings.get_cache()
+    return opened_at_import, cache.slab_path, embeddings.model_manager.num_threads, os.environ["OMP_NUM_THREADS"]
+
+
+def test_workers_use_a_memory_only_cache_and_the_thread_cap(tmp_path, monkeypatch):
+    # The parent's on-disk cache must stay the parent's
+    monkeypatch.setenv("EMBEDDING_CACHE_PATH", str(tmp_path / "embedding_cache"))
+    monkeypatch.delenv("EMBEDDING_THREADS", raising=False)
+    with EmbeddingPool(processes=1, threads_per_worker=2) as pool:
+        opened_at_import, slab_path, threads, omp = pool._pool.apply(_worker_state)
+    assert not opened_at_import
+    assert slab_path is None
+    assert threads == 2 and omp == "2"
+    assert not os.path.exists(tmp_path / "embedding_cache.f32")
+
+
+def test_cache_is_opened_on_first_use(tmp_path, monkeypatch):
+    import embeddings
+    monkeypatch.setattr(embeddings, "_cache", None)
+    monkeypatch.setenv("EMBEDDING_CACHE_PATH", "")
+    cache = embeddings.get_cache()
+    assert cache is embeddings.get_cache() and cache.slab_path is None
+
+
+@pytest.mark.parametrize("lengths,expected", [
+    ([5, 1, 3], [[1, 2, 0]]),
+    ([100, 1, 100, 1], [[1, 3], [0], [2]]),
+])
+def test_length_buckets_group_similar_lengths(lengths, expected):
+    from embeddings import length_buckets
+    assert length_buckets(lengths, batch_size=8, max_batch_tokens=150) == expected
+
+
+def test_physical_cores_prefers_psutil_then_affinity(monkeypatch):
+    import sys
+    import types
+    from embeddings import pool
+    monkeypatch.setattr(pool.os, "sched_getaffinity", lambda pid: {0, 1, 2, 3, 4, 5}, raising=False)
+    monkeypatch.setattr(pool.os, "cpu_count", lambda: 64)
+
+    monkeypatch.setitem(sys.modules, "psutil", types.SimpleNamespace(cpu_count=lambda logical: 16))
+    assert pool.physical_cores() == 6  # psutil counts the host, affinity limits the process
+    monkeypatch.setitem(sys.modules, "psutil", types.SimpleNamespace(cpu_count=lambda logical: 4))
+    assert pool.physical_cores() == 4
+
+    monkeypatch.setitem(sys.modules, "psutil", None)  # not installed
+    assert pool.physical_cores() == 6
+    monkeypatch.delattr(pool.os, "sched_getaffinity")
+    assert pool.physical_cores() == 32
+
+
+def test_close_pool_stops_a_started_pool(monkeypatch):
+    import embeddings
+
+    class FakePool:
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    started = FakePool()
+    monkeypatch.setattr(embeddings, "_pool", started)
+    embeddings.close_pool()
+    assert started.closed and embeddings._pool is None
+    embeddings.close_pool()  # nothing started: no-op
@@ -0,0 +1,50 @@
+import numpy as np
+
+import embeddings
+from embeddings import EMBEDDING_DIM, encode_many, length_buckets
+
+
+class FakeModel:
+    """Encodes "<n>:<padding>" as a vector whose first component is n; records each batch"""
+
+    max_seq_length = 512
+
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, batch_size=None, normalize_embeddings=False, show_progress_bar=False):
+        self.batches.append(list(texts))
+        out = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+        out[:, 0] = [int(text.split(":")[0]) for text in texts]
+        return out
+
+
+def test_mixed_lengths_come_back_in_input_order(monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr(embeddings.model_manager, "get", lambda: model)
+    rng = np.random.default_rng(0)
+    texts = [f"{i}:" + "x" * int(length) for i, length in enumerate(rng.integers(0, 1500, 70))]
+
+    vectors = encode_many(texts, instruction="", batch_size=8)
+    assert vectors.shape == (70, EMBEDDING_DIM) and vectors.dtype == np.float32
+    assert vectors[:, 0].tolist() == list(range(70))
+    # Several length buckets were encoded, none mixing short and very long texts
+    assert len(model.batches) > 70 // 8
+    for batch in model.batches:
+        lengths = [len(text) for text in batch]
+        assert len(batch) <= 8 and max(lengths) - min(lengths) < 1000
+
+
+def test_single_text_and_empty_input(monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr(embeddings.model_manager, "get", lambda: model)
+    assert encode_many(["7:abc"], instruction="")[:, 0].tolist() == [7]
+    assert encode_many([]).shape == (0, EMBEDDING_DIM)
+
+
+def test_length_buckets_cover_every_index_once():
+    lengths = np.array([5, 300, 5, 40, 300, 1, 512, 40])
+    buckets = length_buckets(lengths, batch_size=3, max_batch_tokens=700)
+    assert sorted(i for bucket in buckets for i in bucket) == list(range(len(lengths)))
+    for bucket in buckets:
+        assert len(bucket) <= 3 and len(bucket) * max(lengths[bucket]) <= 700 or len(bucket) == 1
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import pytest
+
+from retrieval import HybridRetriever, hit_key, reciprocal_rank_fusion
+
+
+def test_rrf_merges_the_same_message_across_legs():
+    lexical = [{"_id": "a", "faiss_id": 7, "text": "shared"}, {"_id": "b", "text": "lexical only"}]
+    dense = [{"faiss_id": 9, "message": "dense only", "score": 0.9},
+             {"faiss_id": 7, "message": "shared", "timestamp": 5, "score": 0.8}]
+    fused = reciprocal_rank_fusion({"lexical": lexical, "dense": dense}, {"lexical": 1.0, "dense": 1.0}, rrf_k=60)
+
+    assert [hit_key(hit) for hit in fused] == [("faiss", None, 7), ("faiss", None, 9), ("message", "b")]
+    shared = fused[0]
+    assert shared["score"] == pytest.approx(1 / 61 + 1 / 62)
+    assert shared["sources"] == ["lexical", "dense"]
+    # Fields either leg knows are kept
+    assert shared["text"] == "shared" and shared["timestamp"] == 5 and shared["dense_score"] == 0.8
+
+
+def test_rrf_weights_and_shard_keys():
+    dense = [{"faiss_id": 1, "shard": 0}, {"faiss_id": 1, "shard": 1}]
+    lexical = [{"_id": "x"}]
+    fused = reciprocal_rank_fusion({"dense": dense, "lexical": lexical}, {"dense": 1.0, "lexical": 3.0})
+    assert [hit_key(hit) for hit in fused] == [("message", "x"), ("faiss", 0, 1), ("faiss", 1, 1)]
+
+
+def legs(delays, hits=None, failing=()):
+    def make(name, delay):
+        async def leg(query, account_id, limit):
+            await asyncio.sleep(delay)
+            if name in failing:
+                raise RuntimeError(f"{name} is down")
+            return (hits or {}).get(name, [{"_id": f"{name}-{i}", "text": f"{name} {i}"} for i in range(limit)])
+        return leg
+    return {name: make(name, delay) for name, delay in delays.items()}
+
+
+def test_slow_leg_is_dropped_at_the_deadline():
+    retriever = HybridRetriever(legs({"fast": 0.0, "slow": 2.0}), deadline_ms=100)
+
+    started = time.perf_counter()
+    hits = asyncio.run(retriever.search("q", "acct", k=3))
+    assert time.perf_counter() - started < 1.0
+    assert [hit["_id"] for hit in hits] == ["fast-0", "fast-1", "fast-2"]
+    assert retriever.timeouts == {"fast": 0, "slow": 1}
+
+
+def test_failed_leg_is_counted_and_skipped():
+    retriever = HybridRetriever(legs({"lexical": 0.0, "dense": 0.0}, failing={"dense"}), deadline_ms=500)
+    hits = asyncio.run(retriever.search("q", "acct", k=2))
+    assert [hit["sources"] for hit in hits] == [["lexical"], ["lexical"]]
+    assert retriever.errors == {"lexical": 0, "dense": 1}
+
+
+def test_legs_run_concurrently():
+    retriever = HybridRetriever(legs({"a": 0.2, "b": 0.2, "c": 0.2}), deadline_ms=1000)
+    started = time.perf_counter()
+    asyncio.run(retriever.search("q", "acct", k=2))
+    assert time.perf_counter() - started < 0.5
+
+
+def test_context_skips_excluded_texts_and_falls_back_to_fused_order():
+    class BrokenSelector:
+        candidates = 2
+
+        async def aselect(self, query, hits, k):
+            raise RuntimeError("no embeddings")
+
+    hits = {"lexical": [{"_id": str(i), "text": f"t{i}"} for i in range(6)]}
+    retriever = HybridRetriever(legs({"lexical": 0.0}, hits), deadline_ms=500, selector=BrokenSelector())
+    texts = asyncio.run(retriever.context("q", "acct", k=2, exclude=["t0", " t1 "]))
+    assert texts == ["t2", "t3"]
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import faiss
+import numpy as np
+
+from conftest import DIM, unit_vectors
+from vectorstore.index_manager import IVF, FLAT, IndexManager, ReadWriteLock
+
+
+def slow_selector(seconds_per_id):
+    def is_member(faiss_id):
+        time.sleep(seconds_per_id)
+        return True
+    return faiss.PyCallbackIDSelector(is_member)
+
+
+def test_store_lock_is_free_while_a_search_runs(make_store, monkeypatch):
+    store = make_store()
+    vectors = unit_vectors(20, seed=1)
+    ids = store.add_many(vectors, [f"m{i}" for i in range(20)], ["c"] * 20, ["acct"] * 20)
+    monkeypatch.setattr(store.tombstones, "selector", lambda: slow_selector(0.02))
+
+    results = []
+    search = threading.Thread(target=lambda: results.append(store.search(vectors[0], k=3)))
+    search.start()
+    time.sleep(0.1)
+    started = time.perf_counter()
+    assert store.remove([ids[-1]]) == 1  # takes the store lock
+    assert time.perf_counter() - started < 0.15
+    assert search.is_alive()
+    search.join()
+    assert results[0][0]["faiss_id"] == ids[0]
+
+
+def test_add_waits_for_searches_in_flight():
+    manager = IndexManager(DIM, ann_threshold=0)
+    vectors = unit_vectors(20, seed=2)
+    manager.add(vectors[:10], np.arange(10, dtype=np.int64))
+
+    finished = []
+
+    def search():
+        manager.search(vectors[:1], 3, sel=slow_selector(0.02))
+        finished.append("search")
+
+    thread = threading.Thread(target=search)
+    thread.start()
+    time.sleep(0.05)
+    with manager.lock:
+        manager.add(vectors[10:], np.arange(10, 20, dtype=np.int64))
+    finished.append("add")
+    thread.join()
+    assert finished == ["search", "add"]
+    assert manager.index.ntotal == 20
+
+
+def test_read_write_lock_shares_readers_and_excludes_writers():
+    lock = ReadWriteLock()
+    events = []
+
+    def write():
+        with lock.write():
+            events.append("writing")
+
+    with lock.read():
+        with lock.read():  # a second reader doesn't wait
+            events.append("both reading")
+        writer = threading.Thread(target=write)
+        writer.start()
+        time.sleep(0.05)
+        events.append("still reading")
+    writer.join()
+    assert events == ["both reading", "still reading", "writing"]
+
+
+def test_search_parameters_follow_the_index_kind():
+    manager = IndexManager(DIM, ann_threshold=0, nprobe=4)
+    vectors = unit_vectors(400, seed=3)
+    ids = np.arange(400, dtype=np.int64)
+    assert manager.kind == FLAT
+    manager.replace(manager.build(ids, vectors, IVF))
+    assert manager.kind == IVF
+    _, found = manager.search(vectors[:5], 1, nprobe=64)
+    assert found[:, 0].tolist() == ids[:5].tolist()
@@ -0,0 +1,46 @@
+import pytest
+
+pytest.importorskip("fastapi")
+
+
+@pytest.fixture
+def client(mongo_db, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # importing the chat routes opens the default index files in cwd
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    try:
+        from api.routes import messages
+    except ImportError as error:  # the chat routes pull in llama.cpp and the LLM stack
+        pytest.skip(f"api.routes unavailable: {error}")
+    app = FastAPI()
+    app.include_router(messages.router)
+    return TestClient(app), messages
+
+
+def test_search_returns_messages_for_lexical_and_dense_hits(client, mongo_db, monkeypatch):
+    http, messages = client
+    account_id = mongo_db.create_account("searcher", "searcher@example.com", "hash")
+    other_id = mongo_db.create_account("other", "other@example.com", "hash")
+    chat_id = mongo_db.create_chat(account_id, "chat")
+    lexical = mongo_db.store_message(account_id, chat_id, "lexical hit", "reply", faiss_id=1).inserted_id
+    dense = mongo_db.store_message(account_id, chat_id, "dense hit", "reply", faiss_id=2).inserted_id
+    both = mongo_db.store_message(account_id, chat_id, "both legs", "reply", faiss_id=3).inserted_id
+    mongo_db.store_message(other_id, mongo_db.create_chat(other_id, "chat"), "not yours", None, faiss_id=4)
+
+    async def search(query, account_id, k, weights=None):
+        return [
+            {"_id": both, "faiss_id": 3, "text": "both legs", "score": 0.04, "sources": ["lexical", "dense"]},
+            {"faiss_id": 2, "message": "dense hit", "score": 0.03, "sources": ["dense"]},
+            {"faiss_id": 99, "message": "vector without a message", "score": 0.02, "sources": ["dense"]},
+            {"_id": lexical, "text": "lexical hit", "score": 0.01, "sources": ["lexical"]},
+            {"faiss_id": 4, "message": "not yours", "score": 0.005, "sources": ["dense"]},
+        ]
+
+    monkeypatch.setattr(messages.retriever, "search", search)
+    response = http.post("/messages/search", json={"account_id": str(account_id), "query": "hit", "limit": 5})
+    assert response.status_code == 200
+    body = response.json()
+    assert [message["id"] for message in body] == [str(both), str(dense), str(lexical)]
+    assert body[1]["text"] == "dense hit" and body[1]["response"] == "reply"
+    assert body[1]["chat_id"] == str(chat_id) and body[1]["account_id"] == str(account_id)
+    assert body[0]["sources"] == ["lexical", "dense"]
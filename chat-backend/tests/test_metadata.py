@@ -0,0 +1,136 @@
+import os
+
+import numpy as np
+
+from vectorstore.metadata import IdAllocator, MetadataTable, LEGACY_ID_FLOOR
+from conftest import unit_vectors
+
+
+def selected(table, **filters):
+    sel = table.selector(**filters)
+    if sel is None:
+        return []
+    return [i for i in range(len(table.conversation)) if sel.is_member(i)]
+
+
+def test_rows_round_trip(tmp_path):
+    table = MetadataTable(str(tmp_path / "meta"))
+    table.set([1, 2], ["hello", "wörld"], ["c1", "c2"], ["a1", None], [10.0, None])
+    table.close()
+
+    reopened = MetadataTable(str(tmp_path / "meta"))
+    rows = reopened.rows([1, 2, 3])
+    assert rows[1] == {"faiss_id": 1, "message": "hello", "conversation_id": "c1", "account_id": "a1",
+                       "timestamp": 10.0}
+    assert rows[2]["message"] == "wörld" and rows[2]["account_id"] is None and rows[2]["timestamp"] is None
+    assert 3 not in rows
+    assert reopened.allocator.allocate(1)[0] == 3
+
+
+def test_selector_filters_by_account_and_conversation():
+    table = MetadataTable(None)
+    table.set([1, 2, 3], ["x", "y", "z"], ["c1", "c1", "c2"], ["a1", None, "a1"])
+    assert selected(table, account_id="a1") == [1, 3]
+    assert selected(table, conversation_id="c1") == [1, 2]
+    assert selected(table, account_id="a1", conversation_id="c1") == [1]
+
+
+def test_selector_unknown_account_matches_nothing():
+    table = MetadataTable(None)
+    # Rows without an account must not match an account the table has never seen
+    table.set([1, 2], ["x", "y"], ["c1", "c1"], [None, None])
+    assert table.selector(account_id="nobody") is None
+    assert table.selector(conversation_id="nowhere") is None
+
+
+def test_selector_excludes_ids_beyond_the_table():
+    table = MetadataTable(None, initial_capacity=8)
+    table.set([1], ["x"], ["c1"], ["a1"])
+    sel = table.selector(account_id="a1")
+    assert [i for i in range(200_000) if sel.is_member(i)] == [1]
+
+
+def test_removed_rows_are_not_selected():
+    table = MetadataTable(None)
+    table.set([1, 2], ["x", "y"], ["c1", "c1"], ["a1", "a1"])
+    table.remove([1])
+    assert selected(table, account_id="a1") == [2]
+    assert table.account_of([1]) == ["a1"]
+
+
+def test_legacy_ids_are_skipped():
+    table = MetadataTable(None)
+    table.set([LEGACY_ID_FLOOR + 5], ["old"], ["c1"])
+    assert len(table) == 0
+    assert not table.has([LEGACY_ID_FLOOR + 5])[0]
+
+
+def test_allocator_reserves_blocks_across_restarts(tmp_path):
+    path = str(tmp_path / "nextid")
+    allocator = IdAllocator(reserve_path=path, block=10)
+    assert allocator.allocate(3).tolist() == [1, 2, 3]
+    # A crash before the table is saved must not reissue ids already handed out
+    restarted = IdAllocator(reserve_path=path, block=10)
+    assert restarted.allocate(1)[0] > 3
+
+
+def test_search_for_unknown_account_returns_no_hits(make_store):
+    store = make_store()
+    vectors = unit_vectors(4)
+    store.add_many(vectors, ["a", "b", "c", "d"], ["c1"] * 4, [None, None, "a1", "a1"])
+    assert store.search_many(vectors[:2], k=4, account_id="nobody") == [[], []]
+    hits = store.search(vectors[2], k=4, account_id="a1")
+    assert {hit["message"] for hit in hits} == {"c", "d"}
+
+
+def test_compact_text_keeps_only_live_rows(tmp_path):
+    path = str(tmp_path / "meta")
+    table = MetadataTable(path)
+    table.set([1, 2, 3], ["first " * 50, "second", "third " * 50], ["c"] * 3, ["a"] * 3)
+    table.set([2], ["second, edited"], ["c"], ["a"])  # the old text is dead too
+    table.remove([1])
+    size = os.path.getsize(path + ".text")
+    assert table.compact_text() == size - len("second, edited") - len("third " * 50)
+    assert table.compact_text() == 0
+    assert os.path.getsize(path + ".text") == len("second, edited") + len("third " * 50)
+    assert {i: row["message"] for i, row in table.rows([1, 2, 3]).items()} == {2: "second, edited", 3: "third " * 50}
+    table.set([4], ["after"], ["c"], ["a"])
+    table.close()
+
+    reopened = MetadataTable(path)
+    assert [row["message"] for row in reopened.rows([2, 3, 4]).values()] == ["second, edited", "third " * 50, "after"]
+
+
+def test_interrupted_text_compaction_is_resolved_on_open(tmp_path):
+    path = str(tmp_path / "meta")
+    table = MetadataTable(path)
+    table.set([1, 2], ["dead text", "live text"], ["c", "c"])
+    table.remove([1])
+    table.save()
+    old = {suffix: open(path + suffix, "rb").read() for suffix in (".text", ".npz")}
+    table.compact_text()
+    table.close()
+
+    # Crash between the renames: the new text is in place, its snapshot is not
+    os.replace(path + ".npz", path + ".npz.compact")
+    with open(path + ".npz", "wb") as fh:
+        fh.write(old[".npz"])
+    assert MetadataTable(path).rows([2])[2]["message"] == "live text"
+    assert not os.path.exists(path + ".npz.compact")
+
+    # Crash before the renames: the old pair is kept and the temp files dropped
+    for suffix, data in old.items():
+        os.replace(path + suffix, path + suffix + ".compact")
+        with open(path + suffix, "wb") as fh:
+            fh.write(data)
+    assert MetadataTable(path).rows([2])[2]["message"] == "live text"
+    assert not os.path.exists(path + ".text.compact") and not os.path.exists(path + ".npz.compact")
+
+
+def test_store_compaction_drops_removed_text(make_store):
+    store = make_store(compact_threshold=0.5)
+    ids = store.add_many(unit_vectors(4), ["x" * 1000, "y" * 1000, "z", "w"], ["c"] * 4, ["a"] * 4)
+    store.remove(ids[:2])  # half dead: compaction starts
+    store._compactor.join(5)
+    assert os.path.getsize(store.metadata.text_path) == 2
+    assert [hit["message"] for hit in store.search(unit_vectors(4)[2], k=4)][0] == "z"
@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("sentence_transformers")
+
+from embeddings import INSTRUCTION
+from embeddings.model import DEFAULT_EMBEDDING_MODEL
+from embeddings.onnx_backend import parity_check
+
+TEXTS = [
+    "How do I connect my MongoDB to my Python backend?",
+    "What is vector quantization?",
+    "Can I run BGE embeddings on CPU?",
+    "Why is summarization worse than precision memory retrieval?",
+    "a",
+    "A much longer message that goes on for a while so the batch has some padding in it, "
+    "which is where a broken attention mask or pooling step would show up first.",
+]
+
+
+def test_int8_onnx_vectors_match_the_torch_model(tmp_path):
+    try:
+        report = parity_check(TEXTS, DEFAULT_EMBEDDING_MODEL, export_dir=str(tmp_path),
+                              instruction=INSTRUCTION)
+    except OSError as error:  # weights not cached and no network
+        pytest.skip(f"{DEFAULT_EMBEDDING_MODEL} unavailable: {error}")
+    assert report["samples"] == len(TEXTS) and report["dim"] == 768
+    assert report["min_cosine"] >= 0.98
+    assert report["mean_cosine"] >= 0.99
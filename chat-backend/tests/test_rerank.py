@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+import embeddings
+import rerankers
+from rerankers import first_stage_scores, is_decisive
+
+
+def test_is_decisive_compares_the_scores_around_the_cut():
+    scores = np.array([0.9, 0.85, 0.5, 0.45], dtype=np.float32)
+    assert is_decisive(scores, top_k=2, margin=0.3)
+    assert not is_decisive(scores, top_k=2, margin=0.4)
+    assert not is_decisive(scores, top_k=1, margin=0.1)  # 0.9 vs 0.85
+    # Nothing is cut at or below top_k candidates, one candidate is trivially settled
+    assert not is_decisive(scores, top_k=4, margin=0.0)
+    assert is_decisive(np.array([0.1]), top_k=3, margin=1.0)
+    assert not is_decisive(None, top_k=2, margin=0.1)
+    assert not is_decisive(np.zeros(0), top_k=2, margin=0.1)
+
+
+def test_first_stage_scores_are_inner_products():
+    rng = np.random.default_rng(0)
+    matrix = rng.standard_normal((5, 8)).astype(np.float32)
+    query = rng.standard_normal(8).astype(np.float32)
+    np.testing.assert_allclose(first_stage_scores(query, matrix), matrix @ query, rtol=1e-6)
+    np.testing.assert_allclose(first_stage_scores(query, list(matrix)), matrix @ query, rtol=1e-6)
+    assert first_stage_scores(None, matrix) is None
+    assert first_stage_scores(query, []) is None
+
+
+class FixedReranker:
+    """Scores from a text -> score table, on a scale unrelated to cosine"""
+
+    def __init__(self, table):
+        self.table = table
+        self.calls = 0
+
+    def score(self, query_text, candidates, candidate_embeddings=None, query_embedding=None):
+        self.calls += 1
+        return np.array([self.table[c] for c in candidates], dtype=np.float32)
+
+
+@pytest.fixture
+def reranker(monkeypatch):
+    fixed = FixedReranker({})
+    monkeypatch.setattr(rerankers, "get_reranker", lambda name=None: fixed)
+    return fixed
+
+
+def test_decisive_first_stage_skips_the_reranker(reranker):
+    candidates = ["a", "b", "c"]
+    kept = embeddings.rerank("q", candidates, top_k=1, similarity_threshold=0.5,
+                             first_stage=[0.2, 0.9, 0.3], decisive_margin=0.2)
+    assert kept == ["b"] and reranker.calls == 0
+
+
+def test_threshold_uses_first_stage_scores_on_the_rerank_path(reranker):
+    # The cross-encoder loves "off topic", which FAISS found dissimilar; rerank order, cosine threshold
+    reranker.table.update({"close": 0.2, "closer": 0.3, "off topic": 0.99})
+    kept = embeddings.rerank("q", ["close", "closer", "off topic"], top_k=3, similarity_threshold=0.6,
+                             first_stage=[0.8, 0.7, 0.1], decisive_margin=0.5)
+    assert kept == ["closer", "close"] and reranker.calls == 1
+
+
+def test_first_stage_scores_are_computed_when_not_given(reranker, monkeypatch):
+    vectors = {"q": np.array([1, 0], dtype=np.float32), "near": np.array([0.9, 0.1], dtype=np.float32),
+               "far": np.array([0, 1], dtype=np.float32)}
+    monkeypatch.setattr(embeddings, "get_embedding", lambda text: vectors[text])
+    monkeypatch.setattr(embeddings, "get_embeddings", lambda texts: np.vstack([vectors[t] for t in texts]))
+    reranker.table.update({"near": 0.1, "far": 0.9})
+    assert embeddings.rerank("q", ["far", "near", 3], top_k=2, similarity_threshold=0.5, decisive_margin=1.0) == ["near"]
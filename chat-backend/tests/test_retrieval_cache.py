@@ -0,0 +1,114 @@
+import asyncio
+
+from retrieval import HybridRetriever, RetrievalCache
+from conftest import unit_vectors
+
+
+def test_lookup_misses_once_the_generation_moves():
+    cache = RetrievalCache(max_items=10)
+    key = cache.key("search", "Hello  World", "a1", 5)
+    cache.put(key, (1,), ["hit"])
+    assert cache.get(cache.key("search", "hello world", "a1", 5), (1,)) == ["hit"]
+    assert cache.get(key, (2,)) is None
+    assert cache.get(key, (1,)) is None  # the stale entry was dropped
+    assert cache.stats()["stale"] == 1
+
+
+def test_lru_evicts_by_count_and_size():
+    cache = RetrievalCache(max_items=2)
+    for i in range(3):
+        cache.put(i, (0,), [i])
+    assert cache.get(0, (0,)) is None and cache.get(2, (0,)) == [2]
+
+    small = RetrievalCache(max_items=100, max_mb=100 / (1024 * 1024))
+    small.put("a", (0,), "x" * 40)
+    small.put("b", (0,), "y" * 40)
+    small.put("c", (0,), "z" * 40)
+    assert len(small) == 2 and small.bytes <= 100
+
+
+def make_retriever(leg, state):
+    return HybridRetriever({"dense": leg}, cache=RetrievalCache(), deadline_ms=1000,
+                           generation=lambda account_id: (state["generation"],))
+
+
+def test_results_are_served_from_cache_until_a_write():
+    state = {"generation": 0, "calls": 0}
+
+    async def leg(query, account_id, limit):
+        state["calls"] += 1
+        return [{"faiss_id": 1, "message": "m"}]
+
+    retriever = make_retriever(leg, state)
+
+    async def run():
+        await retriever.search("q", "a1")
+        await retriever.search("q", "a1")
+        assert state["calls"] == 1
+        state["generation"] += 1
+        await retriever.search("q", "a1")
+        assert state["calls"] == 2
+
+    asyncio.run(run())
+
+
+def test_result_computed_across_a_write_is_not_cached():
+    state = {"generation": 0, "calls": 0}
+
+    async def leg(query, account_id, limit):
+        state["calls"] += 1
+        if state["calls"] == 1:
+            # A write lands while this search runs; its result may miss it
+            state["generation"] += 1
+        return [{"faiss_id": state["calls"], "message": "m"}]
+
+    retriever = make_retriever(leg, state)
+
+    async def run():
+        await retriever.search("q", "a1")
+        hits = await retriever.search("q", "a1")
+        assert state["calls"] == 2 and hits[0]["faiss_id"] == 2
+
+    asyncio.run(run())
+
+
+def test_incomplete_results_are_not_cached():
+    state = {"generation": 0, "calls": 0}
+
+    async def slow(query, account_id, limit):
+        state["calls"] += 1
+        await asyncio.sleep(1)
+        return []
+
+    async def fast(query, account_id, limit):
+        return [{"faiss_id": 1, "message": "m"}]
+
+    retriever = HybridRetriever({"dense": fast, "lexical": slow}, cache=RetrievalCache(), deadline_ms=20,
+                                generation=lambda account_id: (state["generation"],))
+
+    async def run():
+        assert (await retriever.search("q", "a1"))[0]["faiss_id"] == 1
+        await retriever.search("q", "a1")
+        assert state["calls"] == 2
+
+    asyncio.run(run())
+
+
+def test_store_generation_moves_only_after_the_write_is_visible(make_store, monkeypatch):
+    store = make_store()
+    vectors = unit_vectors(2)
+    seen = []
+    original = store.metadata.set
+
+    def observe(*args, **kwargs):
+        seen.append(store.generation("a1"))
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(store.metadata, "set", observe)
+    faiss_id = store.add(vectors[0], "hello", "c1", "a1")
+    assert seen == [0] and store.generation("a1") == 1
+
+    before = store.generation("a1")
+    store.remove([faiss_id])
+    assert store.generation("a1") == before + 1
+    assert store.search(vectors[0], k=1, account_id="a1") == []
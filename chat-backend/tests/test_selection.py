@@ -0,0 +1,43 @@
+import asyncio
+
+import numpy as np
+
+from conftest import unit_vectors
+from retrieval import SelectionStage, mmr_select, recency_decay
+
+
+def test_mmr_skips_near_duplicates():
+    candidates = np.array([[1.0, 0.0], [0.999, 0.0447], [0.0, 1.0]], dtype=np.float32)
+    candidates /= np.linalg.norm(candidates, axis=1, keepdims=True)
+    relevance = np.array([0.9, 0.89, 0.5], dtype=np.float32)
+    assert mmr_select(candidates, relevance, 2, lambda_=0.5).tolist() == [0, 2]
+    assert mmr_select(candidates, relevance, 2, lambda_=1.0).tolist() == [0, 1]
+
+
+def test_recency_decay_halves_per_half_life():
+    now = 1_000_000.0
+    decay = recency_decay([now, now - 3600, None], half_life_hours=1.0, now=now)
+    np.testing.assert_allclose(decay, [1.0, 0.5, 0.5])
+
+
+def test_stored_vectors_are_reused_and_only_the_rest_encoded():
+    vectors = unit_vectors(7, seed=3)
+    query, stored_rows, new_rows = vectors[0], vectors[1:5], vectors[5:]
+    hits = [{"faiss_id": 10 + i, "message": f"s{i}"} for i in range(4)] + \
+           [{"_id": f"m{i}", "text": f"n{i}"} for i in range(2)]
+    by_text = {"q": query, **{f"n{i}": new_rows[i] for i in range(2)}}
+    encoded = []
+
+    async def embed(texts):
+        encoded.extend(texts)
+        return np.vstack([by_text[text] for text in texts])
+
+    async def lookup(ids):
+        # faiss_id 13 isn't in the index (e.g. it lives on a shard file): it gets encoded
+        by_text["s3"] = stored_rows[3]
+        return np.array([10, 11, 12]), stored_rows[:3]
+
+    stage = SelectionStage(embed, recency_weight=0.0, vectors=lookup)
+    picked = asyncio.run(stage.aselect("q", hits, 3))
+    assert encoded == ["q", "s3", "n0", "n1"]
+    assert picked == stage.select(query, hits, np.vstack([stored_rows, new_rows]), 3)
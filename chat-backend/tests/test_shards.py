@@ -0,0 +1,97 @@
+import os
+
+import numpy as np
+
+from conftest import DIM, unit_vectors
+from vectorstore.index_manager import index_ids
+from vectorstore.shards import ShardManager
+
+BYTES_PER_VECTOR = DIM * 4
+
+
+def budget(vectors):
+    """memory_budget_mb that fits this many vectors"""
+    return vectors * BYTES_PER_VECTOR / (1024 * 1024)
+
+
+def fill(manager, account_id, start, n, seed=0):
+    vectors = unit_vectors(n, seed=seed)
+    ids = np.arange(start, start + n, dtype=np.int64)
+    with manager.use(account_id, create=True) as shard:
+        shard.add(vectors, ids)
+    return ids, vectors
+
+
+def test_store_routes_adds_and_searches_to_account_shards(make_store, tmp_path):
+    store = make_store(shard_dir=str(tmp_path / "shards"))
+    vectors = unit_vectors(6, seed=1)
+    ids = store.add_many(vectors, [f"m{i}" for i in range(6)], ["c"] * 6, ["a", "a", "b", "b", None, None])
+
+    assert sorted(index_ids(store.index).tolist()) == ids[4:]
+    assert store.shards.accounts() == ["a", "b"]
+    with store.shards.use("a") as shard:
+        assert sorted(index_ids(shard.index).tolist()) == ids[:2]
+    # An account's search never sees another account's vectors, even the nearest ones
+    assert {hit["faiss_id"] for hit in store.search(vectors[2], k=5, account_id="a")} == set(ids[:2])
+    assert store.search(vectors[2], k=1, account_id="b")[0]["faiss_id"] == ids[2]
+    assert store.search(vectors[0], k=5, account_id="nobody") == []
+
+
+def test_lru_eviction_keeps_open_shards_within_budget(tmp_path):
+    manager = ShardManager(str(tmp_path), DIM, memory_budget_mb=budget(25))
+    for i, account_id in enumerate(["a", "b", "c"]):
+        fill(manager, account_id, i * 10, 10, seed=i)
+    # 30 vectors don't fit in 25: the least recently used shard was closed
+    assert [shard.account_id for shard in manager.resident()] == ["b", "c"]
+    assert manager.evictions == 1 and manager.loads == 3
+
+    with manager.use("b"):  # b becomes the most recent
+        pass
+    fill(manager, "d", 30, 10, seed=3)
+    assert [shard.account_id for shard in manager.resident()] == ["b", "d"]
+    assert manager.stats()["resident_bytes"] <= manager.memory_budget
+    manager.close()
+
+
+def test_pinned_shards_are_not_evicted(tmp_path):
+    manager = ShardManager(str(tmp_path), DIM, memory_budget_mb=budget(5))
+    fill(manager, "a", 0, 10)
+    with manager.use("a") as pinned:
+        fill(manager, "b", 10, 10, seed=1)
+        assert pinned in manager.resident()
+    manager.close()
+
+
+def test_evicted_shard_reloads_from_its_file(tmp_path):
+    manager = ShardManager(str(tmp_path), DIM, memory_budget_mb=budget(10))
+    ids, vectors = fill(manager, "a", 0, 10)
+    fill(manager, "b", 10, 10, seed=1)  # evicts a, which checkpoints it
+    assert "a" not in [shard.account_id for shard in manager.resident()]
+    assert os.path.exists(os.path.join(str(tmp_path), "a.idx"))
+
+    with manager.use("a") as shard:
+        assert shard.mapped
+        _, found = shard.index_manager.search(vectors[:3], 1)
+        assert found[:, 0].tolist() == ids[:3].tolist()
+        shard.add(unit_vectors(1, seed=9), np.array([99], dtype=np.int64))  # promoted to an owned copy
+        assert not shard.mapped and shard.index.ntotal == 11
+    assert manager.loads == 3
+    manager.close()
+
+
+def test_uncheckpointed_adds_replay_from_the_shard_wal(tmp_path):
+    manager = ShardManager(str(tmp_path), DIM)
+    ids, vectors = fill(manager, "a", 0, 8)
+    manager.checkpoint()
+    more, more_vectors = fill(manager, "a", 8, 4, seed=1)
+    # Crash: the WAL is durable but the shard file only has the first 8
+    for shard in manager.resident():
+        shard.wal.close()
+
+    reopened = ShardManager(str(tmp_path), DIM)
+    assert reopened.exists("a") and not reopened.exists("b")
+    with reopened.use("a") as shard:
+        assert sorted(index_ids(shard.index).tolist()) == list(range(12))
+        _, found = shard.index_manager.search(more_vectors, 1)
+        assert found[:, 0].tolist() == more.tolist()
+    reopened.close()
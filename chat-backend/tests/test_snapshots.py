@@ -0,0 +1,137 @@
+import os
+
+import faiss
+import numpy as np
+import pytest
+
+from vectorstore.snapshots import SnapshotManager, read_index_mapped
+from conftest import unit_vectors
+
+
+def flat_index(vectors):
+    index = faiss.IndexIDMap(faiss.IndexFlatIP(vectors.shape[1]))
+    index.add_with_ids(vectors, np.arange(1, len(vectors) + 1, dtype=np.int64))
+    return index
+
+
+def ivf_index(vectors, nlist=16):
+    ivf = faiss.IndexIVFFlat(faiss.IndexFlatIP(vectors.shape[1]), vectors.shape[1], nlist, faiss.METRIC_INNER_PRODUCT)
+    ivf.train(vectors)
+    index = faiss.IndexIDMap(ivf)
+    index.add_with_ids(vectors, np.arange(1, len(vectors) + 1, dtype=np.int64))
+    return index
+
+
+def write(manager, index):
+    return manager.write(faiss.serialize_index(index), index.ntotal, index.d)
+
+
+def resident_bytes():
+    with open("/proc/self/statm") as fh:
+        return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def test_versions_are_retained_and_pruned(tmp_path):
+    path = str(tmp_path / "index.idx")
+    manager = SnapshotManager(path, keep=2)
+    for n in (3, 4, 5):
+        write(manager, flat_index(unit_vectors(n)))
+    assert [entry["version"] for entry in manager.versions] == [2, 3]
+    assert not os.path.exists(path + ".v1")
+    assert faiss.read_index(path).ntotal == 5  # plain path links the latest
+
+    reopened = SnapshotManager(path, keep=2)
+    index, entry = reopened.open(mmap=False)
+    assert entry["version"] == 3 and index.ntotal == 5
+
+
+def test_open_falls_back_past_a_damaged_snapshot(tmp_path):
+    path = str(tmp_path / "index.idx")
+    manager = SnapshotManager(path, keep=3)
+    write(manager, flat_index(unit_vectors(3)))
+    write(manager, flat_index(unit_vectors(4)))
+    with open(path + ".v2", "r+b") as fh:
+        fh.truncate(10)
+    index, entry = SnapshotManager(path).open()
+    assert entry["version"] == 1 and index.ntotal == 3
+
+
+def test_verify_catches_bit_flips(tmp_path):
+    path = str(tmp_path / "index.idx")
+    manager = SnapshotManager(path, keep=3)
+    write(manager, flat_index(unit_vectors(3)))
+    entry = write(manager, flat_index(unit_vectors(4)))
+    with open(path + ".v2", "r+b") as fh:
+        fh.seek(entry["bytes"] - 8)
+        fh.write(b"\xff" * 8)
+    assert SnapshotManager(path, verify=False).open()[1]["version"] == 2
+    assert SnapshotManager(path, verify=True).open()[1]["version"] == 1
+
+
+@pytest.mark.parametrize("build", [flat_index, ivf_index])
+def test_mapped_read_searches_like_a_full_read(tmp_path, build):
+    vectors = unit_vectors(2000)
+    path = str(tmp_path / "index.idx")
+    faiss.write_index(build(vectors), path)
+    mapped = read_index_mapped(path)
+    full = faiss.read_index(path)
+    if hasattr(full, "index") and hasattr(faiss.downcast_index(full.index), "nprobe"):
+        faiss.downcast_index(mapped.index).nprobe = faiss.downcast_index(full.index).nprobe = 16
+    assert np.array_equal(mapped.search(vectors[:5], 3)[1], full.search(vectors[:5], 3)[1])
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="needs /proc to read RSS")
+def test_mapped_flat_index_is_not_read_into_memory(tmp_path):
+    path = str(tmp_path / "index.idx")
+    index = faiss.IndexIDMap(faiss.IndexFlatIP(256))
+    index.add_with_ids(np.ones((64_000, 256), dtype=np.float32), np.arange(64_000, dtype=np.int64))
+    faiss.write_index(index, path)
+    del index
+    size = os.path.getsize(path)  # ~65 MB
+
+    before = resident_bytes()
+    mapped = read_index_mapped(path)
+    grown = resident_bytes() - before
+    assert mapped.ntotal == 64_000
+    assert grown < size / 4, f"mapped load grew RSS by {grown} of {size} bytes"
+
+
+def test_pinned_version_survives_pruning_until_unpinned(tmp_path):
+    path = str(tmp_path / "index.idx")
+    manager = SnapshotManager(path, keep=1)
+    first = write(manager, flat_index(unit_vectors(3)))
+    manager.pin(first)
+    write(manager, flat_index(unit_vectors(4)))
+    assert os.path.exists(path + ".v1")
+    manager.unpin(first)
+    assert not os.path.exists(path + ".v1")
+
+
+def test_stray_versions_are_removed_at_startup(tmp_path):
+    path = str(tmp_path / "index.idx")
+    manager = SnapshotManager(path, keep=1)
+    first = write(manager, flat_index(unit_vectors(3)))
+    manager.pin(first)
+    write(manager, flat_index(unit_vectors(4)))
+    # Crash while v1 was pinned: the next start cleans it up
+    SnapshotManager(path, keep=1)
+    assert not os.path.exists(path + ".v1") and os.path.exists(path + ".v2")
+
+
+def test_mapped_store_accepts_writes_after_its_snapshot_is_retired(make_store, monkeypatch):
+    monkeypatch.setenv("FAISS_SNAPSHOT_KEEP", "1")
+    vectors = unit_vectors(6)
+    store = make_store()
+    ids = store.add_many(vectors[:4], ["a", "b", "c", "d"], ["c1"] * 4)
+    store.close()
+
+    store = make_store(compact_threshold=0.9)  # reopens the snapshot memory-mapped
+    assert store._mapped_path is not None
+    # Removal-only checkpoints (no compaction, which would promote) retire the mapped version
+    for faiss_id in ids[:2]:
+        store.remove([faiss_id])
+        store.checkpoint()
+    store.add(vectors[4], "e", "c1")
+    hits = store.search(vectors[4], k=3)
+    assert hits[0]["message"] == "e"
+    assert {hit["message"] for hit in hits} <= {"c", "d", "e"}
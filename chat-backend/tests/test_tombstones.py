@@ -0,0 +1,62 @@
+import numpy as np
+
+from vectorstore.tombstones import Tombstones
+from vectorstore.metadata import LEGACY_ID_FLOOR
+from conftest import unit_vectors
+
+
+def live(tombstones, ids):
+    sel = tombstones.selector()
+    return [i for i in ids if sel is None or sel.is_member(i)]
+
+
+def test_selector_hides_dead_ids_only():
+    tombstones = Tombstones()
+    assert tombstones.selector() is None
+    assert tombstones.add([3, 5, LEGACY_ID_FLOOR + 1]) == 3
+    assert tombstones.add([3]) == 0
+    assert live(tombstones, [1, 3, 5, 7, LEGACY_ID_FLOOR + 1, LEGACY_ID_FLOOR + 2]) == [1, 7, LEGACY_ID_FLOOR + 2]
+
+
+def test_ids_beyond_the_bitmap_are_live():
+    tombstones = Tombstones()
+    tombstones.add([1])
+    # Far past the 1024-bit bitmap; must not read memory after it
+    assert live(tombstones, range(1024, 200_000, 97)) == list(range(1024, 200_000, 97))
+
+
+def test_discard_and_persistence(tmp_path):
+    tombstones = Tombstones(str(tmp_path / "dead"))
+    tombstones.add([2, 4000])
+    tombstones.save()
+    reopened = Tombstones(str(tmp_path / "dead"))
+    assert reopened.ids().tolist() == [2, 4000] and len(reopened) == 2
+    reopened.discard([2])
+    assert reopened.contains(np.array([2, 4000])).tolist() == [False, True]
+    assert len(reopened) == 1
+
+
+def test_removing_unissued_ids_does_not_hide_later_adds(make_store):
+    store = make_store()
+    vectors = unit_vectors(3, seed=1)
+    first = store.add(vectors[0], "first", "c", "acct")
+    assert store.remove([first + 1, first + 2, -1]) == 0
+    assert len(store.tombstones) == 0
+
+    later = store.add_many(vectors[1:], ["second", "third"], ["c", "c"], ["acct", "acct"])
+    assert later == [first + 1, first + 2]
+    assert store.search(vectors[2], k=1)[0]["faiss_id"] == first + 2
+
+
+def test_compaction_drops_dead_ids_from_the_index(make_store):
+    store = make_store(compact_threshold=0.5)
+    vectors = unit_vectors(10, seed=2)
+    ids = store.add_many(vectors, [f"m{i}" for i in range(10)], ["c"] * 10, ["acct"] * 10)
+    store.remove(ids[:4])
+    assert store.index.ntotal == 10 and len(store.tombstones) == 4
+    assert {hit["faiss_id"] for hit in store.search(vectors[0], k=10)} == set(ids[4:])
+
+    store.remove(ids[4:5])  # 5 of 10 dead: compaction starts in the background
+    store._compactor.join()
+    assert store.index.ntotal == 5 and len(store.tombstones) == 0
+    assert {hit["faiss_id"] for hit in store.search(vectors[0], k=10)} == set(ids[5:])
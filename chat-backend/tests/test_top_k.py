@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import embeddings
+from embeddings import top_k_indices
+
+
+def reference(scores, k=None, threshold=None):
+    """The full stable sort top_k_indices replaces"""
+    ranked = sorted((i for i in range(len(scores)) if threshold is None or scores[i] >= threshold),
+                    key=lambda i: scores[i], reverse=True)
+    return ranked[:k] if k else ranked
+
+
+@pytest.mark.parametrize("k", [None, 0, 1, 3, 7, 10, 50])
+@pytest.mark.parametrize("threshold", [None, 0.0, 0.5])
+def test_matches_a_full_sort(k, threshold):
+    rng = np.random.default_rng(k or 0)
+    for scores in (rng.random(10), rng.integers(0, 3, 10) / 2.0, np.full(10, 0.5), np.zeros(0)):
+        assert top_k_indices(scores, k, threshold).tolist() == reference(scores, k, threshold)
+
+
+def test_ties_at_the_cut_keep_the_earliest():
+    scores = np.array([0.1, 0.9, 0.5, 0.5, 0.5, 0.5, 0.2])
+    assert top_k_indices(scores, 3).tolist() == [1, 2, 3]
+    assert top_k_indices(scores, 5, threshold=0.5).tolist() == [1, 2, 3, 4, 5]
+
+
+def test_k_at_or_above_n_returns_everything_sorted():
+    scores = np.array([0.3, 0.1, 0.2])
+    assert top_k_indices(scores, 3).tolist() == top_k_indices(scores, 100).tolist() == [0, 2, 1]
+    assert top_k_indices(np.zeros(0), 5).tolist() == []
+
+
+def test_trim_relevant_rags_matches_the_old_loop(monkeypatch):
+    rng = np.random.default_rng(1)
+    chunks = [f"chunk {i}" for i in range(12)]
+    vectors = {text: v / np.linalg.norm(v) for text, v in
+               zip(["q"] + chunks, rng.standard_normal((13, 8)).astype(np.float32))}
+    vectors["chunk 11"] = vectors["chunk 3"]  # a tie
+    monkeypatch.setattr(embeddings, "get_embedding", lambda text: vectors[text])
+    monkeypatch.setattr(embeddings, "get_embeddings", lambda texts: np.vstack([vectors[t] for t in texts]))
+
+    sims = [float(vectors[c] @ vectors["q"]) for c in chunks]
+    for threshold, k in [(-1.0, None), (0.0, None), (0.0, 2), (-1.0, 12), (2.0, 3)]:
+        expected = [chunks[i] for i in reference(sims, k, threshold)]
+        assert embeddings.trim_relevant_rags("q", chunks, threshold, k) == expected
+    assert embeddings.trim_relevant_rags("q", []) == []
@@ -0,0 +1,94 @@
+import threading
+
+import numpy as np
+
+import vectorstore.wal as wal_module
+from conftest import DIM, unit_vectors
+from vectorstore.wal import OP_ADD, OP_REMOVE, WriteAheadLog
+
+
+def test_replay_returns_records_in_order(tmp_path):
+    vectors = unit_vectors(3)
+    wal = WriteAheadLog(str(tmp_path / "index.wal"), DIM)
+    wal.append(OP_ADD, 1, vectors[0])
+    wal.commit(wal.append_many(OP_ADD, [2, 3], vectors[1:]))
+    wal.commit(wal.append(OP_REMOVE, 2))
+    wal.close()
+
+    records = list(WriteAheadLog(str(tmp_path / "index.wal"), DIM).replay())
+    assert [(op, faiss_id) for op, faiss_id, _ in records] == [(OP_ADD, 1), (OP_ADD, 2), (OP_ADD, 3), (OP_REMOVE, 2)]
+    np.testing.assert_array_equal(np.vstack([v for _, _, v in records[:3]]), vectors)
+    assert records[3][2] is None
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    base = str(tmp_path / "index.wal")
+    wal = WriteAheadLog(base, DIM)
+    wal.commit(wal.append_many(OP_ADD, [1, 2], unit_vectors(2)))
+    wal.close()
+    path = f"{base}.{wal.segment}"
+    with open(path, "r+b") as fh:
+        size = fh.seek(0, 2)
+        fh.truncate(size - 5)  # crash halfway through the second record
+
+    reopened = WriteAheadLog(base, DIM)
+    assert [faiss_id for _, faiss_id, _ in reopened.replay()] == [1]
+    assert [faiss_id for _, faiss_id, _ in reopened.replay()] == [1]
+    reopened.close()
+
+
+def test_rotate_and_drop_through(tmp_path):
+    wal = WriteAheadLog(str(tmp_path / "index.wal"), DIM)
+    wal.commit(wal.append(OP_ADD, 1, unit_vectors(1)[0]))
+    closed = wal.rotate()
+    wal.commit(wal.append(OP_REMOVE, 1))
+    assert wal.segments() == [closed, closed + 1] and wal.records_since_checkpoint == 1
+    wal.drop_through(closed)
+    assert [(op, faiss_id) for op, faiss_id, _ in wal.replay()] == [(OP_REMOVE, 1)]
+    wal.close()
+
+
+def test_concurrent_commits_share_fsyncs(tmp_path, monkeypatch):
+    fsyncs = []
+    real_fsync = wal_module.os.fsync
+    entered = threading.Event()
+    release = threading.Event()
+
+    def slow_fsync(fd):
+        fsyncs.append(fd)
+        entered.set()
+        release.wait(5)
+        real_fsync(fd)
+
+    wal = WriteAheadLog(str(tmp_path / "index.wal"), DIM)
+    monkeypatch.setattr(wal_module.os, "fsync", slow_fsync)
+
+    # The first writer becomes the leader and blocks in fsync...
+    leader = threading.Thread(target=lambda: wal.commit(wal.append(OP_REMOVE, 0)))
+    leader.start()
+    entered.wait(5)
+    # ...while 20 more append; they all ride on one follow-up fsync
+    followers = [threading.Thread(target=lambda i=i: wal.commit(wal.append(OP_REMOVE, i + 1))) for i in range(20)]
+    for thread in followers:
+        thread.start()
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+    assert len(fsyncs) <= 2
+    monkeypatch.undo()
+    wal.close()
+    assert len(list(wal.replay())) == 21
+
+
+def test_store_recovers_uncheckpointed_adds(make_store):
+    store = make_store()
+    vectors = unit_vectors(5, seed=1)
+    ids = store.add_many(vectors, [f"m{i}" for i in range(5)], ["c"] * 5, ["acct"] * 5)
+    # Crash: the WAL is durable but the index was never checkpointed
+    store.checkpoint = lambda force=False: None
+    store.close()
+
+    reopened = make_store()
+    assert reopened.index.ntotal == 5
+    assert [reopened.search(vector, k=1)[0]["faiss_id"] for vector in vectors] == ids
+    assert reopened.add(vectors[0], "after restart", "c", "acct") > max(ids)
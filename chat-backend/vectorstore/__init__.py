@@ -0,0 +1,27 @@
+"""
+FAISS-backed vector store with MongoDB metadata.
+"""
+from .store import VectorStore
+from .wal import WriteAheadLog
+from .sidecar import VectorSidecar
+from .metadata import MetadataTable, IdAllocator
+from .tombstones import Tombstones
+from .shards import ShardManager, AccountShard
+from .consistency import ConsistencyChecker
+from .snapshots import SnapshotManager
+from .coordinator import ShardCoordinator, ShardError
+
+__all__ = [
+    'VectorStore',
+    'WriteAheadLog',
+    'VectorSidecar',
+    'MetadataTable',
+    'IdAllocator',
+    'Tombstones',
+    'ShardManager',
+    'AccountShard',
+    'ConsistencyChecker',
+    'SnapshotManager',
+    'ShardCoordinator',
+    'ShardError'
+]
@@ -0,0 +1,150 @@
+"""
+FAISS / MongoDB consistency check and incremental repair.
+
+Both sides are reduced to sorted, unique int64 arrays of faiss_ids: Mongo is
+streamed with a ``faiss_id``-only projection, and the index side is the main
+index plus every account shard, minus tombstones. Shards that aren't open
+are taken from the metadata table's rows rather than loaded, so a check
+doesn't page in (and replay) every account's shard. Two ``np.setdiff1d`` calls
+then give
+
+* missing: ids with a Mongo doc but no live vector. These are re-added from
+  the stored embedding, or re-embedded from the message when no embedding was
+  stored. Only the missing docs are touched.
+* orphaned: live vectors with no Mongo doc. These are removed through the
+  normal tombstone path.
+
+Adds write the index before Mongo, so Mongo is read first. An in-flight add
+can therefore never look missing. A candidate orphan could still be an add
+whose Mongo insert hasn't landed yet, so orphans are looked up in Mongo again
+right before they are removed.
+"""
+import os
+import time
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from .index_manager import index_ids
+
+REPAIR_BATCH = int(os.getenv("FAISS_CONSISTENCY_BATCH", 1024))
+
+
+def sorted_ids(ids: Iterable) -> np.ndarray:
+    """Sorted unique int64 array of the integer ids in an iterable (None and non-ints are skipped)"""
+    values = np.fromiter((faiss_id for faiss_id in ids if isinstance(faiss_id, (int, np.integer))
+                          and not isinstance(faiss_id, bool)), dtype=np.int64)
+    return np.unique(values)
+
+
+def diff_ids(mongo_ids: np.ndarray, indexed_ids: np.ndarray):
+    """(missing, orphaned) between two sorted unique id arrays"""
+    missing = np.setdiff1d(mongo_ids, indexed_ids, assume_unique=True)
+    orphaned = np.setdiff1d(indexed_ids, mongo_ids, assume_unique=True)
+    return missing, orphaned
+
+
+class ConsistencyChecker:
+    """Compares a VectorStore's indexes with its Mongo collection and repairs the difference."""
+
+    def __init__(self, store, batch_size: Optional[int] = None):
+        self.store = store
+        self.batch_size = batch_size or REPAIR_BATCH
+        self.last_report: Optional[Dict] = None
+
+    def mongo_ids(self) -> np.ndarray:
+        cursor = self.store.collection.find({}, {"faiss_id": 1, "_id": 0}).batch_size(10000)
+        return sorted_ids(doc.get("faiss_id") for doc in cursor)
+
+    def indexed_ids(self) -> np.ndarray:
+        """Live ids across the main index and every shard"""
+        store = self.store
+        with store._lock:
+            parts = [index_ids(store.index)]
+        if store.shards is not None:
+            resident = store.shards.resident()
+            for shard in resident:
+                with shard.lock:
+                    parts.append(index_ids(shard.index))
+            parts.append(store.metadata.account_rows(skip_accounts=[shard.account_id for shard in resident]))
+        ids = np.unique(np.concatenate(parts).astype(np.int64))
+        return ids[~store.tombstones.contains(ids)]
+
+    def check(self, repair: bool = True) -> Dict:
+        """Diff both sides and, if repair, fix them; returns (and keeps) a report dict"""
+        started = time.perf_counter()
+        mongo = self.mongo_ids()
+        indexed = self.indexed_ids()
+        missing, orphaned = diff_ids(mongo, indexed)
+
+        report = {
+            "mongo": int(len(mongo)),
+            "indexed": int(len(indexed)),
+            "missing": int(len(missing)),
+            "orphaned": int(len(orphaned)),
+            "missing_sample": missing[:20].tolist(),
+            "orphaned_sample": orphaned[:20].tolist(),
+            "readded": 0,
+            "reembedded": 0,
+            "removed": 0,
+            "repaired": False,
+        }
+        if repair and (len(missing) or len(orphaned)):
+            for start in range(0, len(missing), self.batch_size):
+                readded, reembedded = self._readd(missing[start:start + self.batch_size])
+                report["readded"] += readded
+                report["reembedded"] += reembedded
+            if len(orphaned):
+                report["removed"] = self._remove_orphans(orphaned)
+            report["repaired"] = True
+
+        report["seconds"] = round(time.perf_counter() - started, 3)
+        report["checked_at"] = time.time()
+        self.last_report = report
+        return report
+
+    def _readd(self, ids: np.ndarray):
+        """Put the vectors for missing ids back; returns (re-added, re-embedded) counts"""
+        store = self.store
+        # Removed (tombstoned) since the diff was taken: leave them gone
+        ids = ids[~store.tombstones.contains(ids)]
+        if len(ids) == 0:
+            return 0, 0
+        docs = list(store.collection.find({"faiss_id": {"$in": ids.tolist()}}, {"_id": 0}))
+        reembedded = sum(1 for doc in docs if not doc.get("embedding") and doc.get("message"))
+        vectors, faiss_ids = store._embeddings_for(docs)
+        if not faiss_ids:
+            return 0, 0
+        by_id = {doc["faiss_id"]: doc for doc in docs}
+        store.metadata.allocator.observe(faiss_ids)
+
+        by_account = {}
+        for vector, faiss_id in zip(vectors, faiss_ids):
+            by_account.setdefault(by_id[faiss_id].get("account_id"), []).append((faiss_id, vector))
+        for account_id, items in by_account.items():
+            group_ids = np.array([faiss_id for faiss_id, _ in items], dtype=np.int64)
+            store._index_add(np.vstack([vector for _, vector in items]).astype(np.float32), group_ids, account_id)
+
+        restored = [by_id[faiss_id] for faiss_id in faiss_ids]
+        store.metadata.set(
+            [doc["faiss_id"] for doc in restored],
+            [doc.get("message") for doc in restored],
+            [doc.get("conversation_id") for doc in restored],
+            [doc.get("account_id") for doc in restored],
+            [doc.get("timestamp") for doc in restored],
+        )
+        store._bump_generation(by_account)
+        return len(faiss_ids), reembedded
+
+    def _remove_orphans(self, ids: np.ndarray) -> int:
+        store = self.store
+        removed = 0
+        for start in range(0, len(ids), self.batch_size):
+            batch = ids[start:start + self.batch_size]
+            # Adds whose Mongo insert landed after the snapshot aren't orphans
+            landed = sorted_ids(doc["faiss_id"] for doc in store.collection.find(
+                {"faiss_id": {"$in": batch.tolist()}}, {"faiss_id": 1, "_id": 0}))
+            batch = np.setdiff1d(batch, landed, assume_unique=True)
+            if len(batch):
+                removed += store.remove(batch)
+        return removed
@@ -0,0 +1,100 @@
+"""
+In-memory conversation_id -> faiss_id map for conversation-scoped search.
+
+Keeps search_in_conversation off Mongo: the id arrays feed a FAISS
+IDSelector on the main index, and small conversations get a cached
+(ids, vectors) matrix for brute-force dot products.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class ConversationIdMap:
+    """conversation_id -> faiss_id arrays plus an LRU of per-conversation vector matrices."""
+
+    def __init__(self, max_cached_matrices: int = 256):
+        self.max_cached_matrices = max_cached_matrices
+        self._lock = threading.Lock()
+        self._ids: Dict[str, List[int]] = {}
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._matrices: "OrderedDict[str, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+
+    def load(self, docs: Iterable[dict]):
+        """Populate from metadata docs with faiss_id / conversation_id fields"""
+        with self._lock:
+            for doc in docs:
+                conversation_id = doc.get("conversation_id")
+                if conversation_id is not None and doc.get("faiss_id") is not None:
+                    self._ids.setdefault(conversation_id, []).append(int(doc["faiss_id"]))
+            self._arrays.clear()
+            self._matrices.clear()
+
+    def add(self, conversation_id: str, faiss_ids, vectors: Optional[np.ndarray] = None):
+        """Record new ids; a cached matrix for the conversation is extended in place"""
+        faiss_ids = [int(i) for i in np.atleast_1d(faiss_ids)]
+        with self._lock:
+            self._ids.setdefault(conversation_id, []).extend(faiss_ids)
+            self._arrays.pop(conversation_id, None)
+
+            cached = self._matrices.get(conversation_id)
+            if cached is not None:
+                if vectors is None:
+                    del self._matrices[conversation_id]
+                else:
+                    ids, matrix = cached
+                    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(faiss_ids), -1)
+                    self._matrices[conversation_id] = (
+                        np.concatenate([ids, np.array(faiss_ids, dtype=np.int64)]),
+                        np.vstack([matrix, vectors]),
+                    )
+
+    def remove(self, conversation_id: str, faiss_ids):
+        """Forget ids; the cached matrix for the conversation drops the same rows"""
+        dead = np.asarray(faiss_ids, dtype=np.int64).reshape(-1)
+        dead_set = set(dead.tolist())
+        with self._lock:
+            current = self._ids.get(conversation_id)
+            if current is None:
+                return
+            remaining = [i for i in current if i not in dead_set]
+            if remaining:
+                self._ids[conversation_id] = remaining
+            else:
+                del self._ids[conversation_id]
+            self._arrays.pop(conversation_id, None)
+
+            cached = self._matrices.get(conversation_id)
+            if cached is not None:
+                ids, matrix = cached
+                keep = ~np.isin(ids, dead)
+                self._matrices[conversation_id] = (ids[keep], matrix[keep])
+
+    def ids(self, conversation_id: str) -> np.ndarray:
+        """faiss_ids for the conversation as a contiguous int64 array"""
+        with self._lock:
+            array = self._arrays.get(conversation_id)
+            if array is None:
+                array = np.array(self._ids.get(conversation_id, []), dtype=np.int64)
+                self._arrays[conversation_id] = array
+            return array
+
+    def get_matrix(self, conversation_id: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        with self._lock:
+            cached = self._matrices.get(conversation_id)
+            if cached is not None:
+                self._matrices.move_to_end(conversation_id)
+            return cached
+
+    def put_matrix(self, conversation_id: str, ids: np.ndarray, matrix: np.ndarray):
+        with self._lock:
+            self._matrices[conversation_id] = (np.asarray(ids, dtype=np.int64),
+                                               np.asarray(matrix, dtype=np.float32))
+            self._matrices.move_to_end(conversation_id)
+            while len(self._matrices) > self.max_cached_matrices:
+                self._matrices.popitem(last=False)
+
+    def __len__(self):
+        return len(self._ids)
@@ -0,0 +1,399 @@
+"""
+Scatter-gather search over shard servers (see remote.py).
+
+Each node holds a disjoint part of the corpus. A query goes to every node
+at once. Each node returns its own top-k, and the per-node lists are merged
+by score into the global top-k with the same merge_topk used for per-account
+shards. One slow or dead node must not stall every chat request. So the
+fan-out waits at most $FAISS_SHARD_DEADLINE_MS. Whatever has arrived by
+then is merged and the stragglers are counted as timeouts. Results are then
+partial, never late. Hits carry the URL index of the node they came from
+in "shard", because faiss_ids are only unique within a node.
+
+Every node gets its own ShardClient: a small worker pool
+($FAISS_SHARD_CONNECTIONS per node) and a set of keep-alive connections.
+A hung node can only tie up its own workers. Once they're all busy, further
+searches skip that node at once (counted as timeouts) instead of queueing
+behind it, and the other nodes are unaffected.
+
+Writes are routed by account (crc32(account_id) % nodes), so one account's
+vectors live on one node and its generation counter stays meaningful.
+store_for(account_id) returns that node's client, which takes the same
+add_many / remove / remove_conversation / update calls as a VectorStore.
+"""
+import asyncio
+import http.client
+import logging
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from .index_manager import merge_topk
+from .remote import JSON, MSGPACK, default_content_type, encode_array, pack, unpack
+
+logger = logging.getLogger(__name__)
+
+# A keep-alive connection the server already closed fails like this on reuse
+_STALE_CONNECTION = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+class ShardError(RuntimeError):
+    """A shard server answered with an error status"""
+
+
+class ShardClient:
+    """One shard server: a bounded worker pool plus reusable keep-alive connections."""
+
+    def __init__(self, url: str, content_type: str, workers: int, write_timeout: float):
+        self.url = url.rstrip("/")
+        self.target = urlsplit(self.url)
+        self.content_type = content_type
+        self.workers = workers
+        self.write_timeout = write_timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard")
+        self._lock = threading.Lock()
+        self._idle: List[http.client.HTTPConnection] = []
+        self.inflight = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.last_seconds = 0.0
+
+    # ─────────────────────────────────────────────────────────────────────
+    #  Transport
+    # ─────────────────────────────────────────────────────────────────────
+    def _connection(self, timeout: float) -> Tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn_cls = http.client.HTTPSConnection if self.target.scheme == "https" else http.client.HTTPConnection
+            return conn_cls(self.target.hostname, self.target.port, timeout=timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def _release(self, conn: http.client.HTTPConnection):
+        with self._lock:
+            if len(self._idle) < self.workers:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, method: str, path: str, payload=None, timeout: Optional[float] = None,
+                idempotent: bool = True):
+        """One request/response; raises ShardError on a non-200 answer"""
+        body = pack(payload, self.content_type) if payload is not None else None
+        headers = {"Content-Type": self.content_type, "Accept": self.content_type} if body is not None else {}
+        for attempt in (0, 1):
+            conn, reused = self._connection(timeout or self.write_timeout)
+            try:
+                conn.request(method, self.target.path + path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except _STALE_CONNECTION:
+                conn.close()
+                if reused and idempotent and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            content_type = response.getheader("Content-Type", JSON)
+            result = unpack(data, MSGPACK if content_type.startswith(MSGPACK) else JSON)
+            if response.status != 200:
+                raise ShardError(f"{self.url}{path}: {response.status} {result.get('error', '')}")
+            return result
+
+    def submit(self, fn, *args) -> Optional[Future]:
+        """Run fn on this node's workers, or None when they're all busy (never queues)"""
+        with self._lock:
+            if self.inflight >= self.workers:
+                return None
+            self.inflight += 1
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        with self._lock:
+            self.inflight -= 1
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    # ─────────────────────────────────────────────────────────────────────
+    #  VectorStore-shaped calls
+    # ─────────────────────────────────────────────────────────────────────
+    def search(self, payload: dict, timeout: float) -> dict:
+        started = time.perf_counter()
+        result = self.request("POST", "/search", payload, timeout=timeout)
+        self.last_seconds = time.perf_counter() - started
+        return result
+
+    def add_many(self, vectors, messages, conversation_ids=None, account_ids=None, timestamps=None) -> List[int]:
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(messages), -1)
+        payload = {"vectors": encode_array(vectors, self.content_type), "messages": list(messages),
+                   "conversation_ids": list(conversation_ids) if conversation_ids is not None else None,
+                   "account_ids": [str(a) if a is not None else None for a in account_ids]
+                   if account_ids is not None else None,
+                   "timestamps": list(timestamps) if timestamps is not None else None}
+        # Writes aren't deadline-bound (a dropped add silently loses the vector) or retried
+        return self.request("POST", "/add", payload, idempotent=False)["ids"]
+
+    def remove(self, ids) -> int:
+        ids = [int(faiss_id) for faiss_id in np.asarray(ids, dtype=np.int64).reshape(-1)]
+        return self.request("POST", "/remove", {"ids": ids})["removed"]
+
+    def remove_conversation(self, conversation_id) -> int:
+        return self.request("POST", "/remove_conversation", {"conversation_id": str(conversation_id)})["removed"]
+
+    def update(self, faiss_id, vector, message=None) -> int:
+        payload = {"faiss_id": int(faiss_id), "message": message,
+                   "vector": encode_array(np.asarray(vector, dtype=np.float32).reshape(1, -1), self.content_type)}
+        return self.request("POST", "/update", payload, idempotent=False)["faiss_id"]
+
+    def stats(self) -> dict:
+        return {"url": self.url, "inflight": self.inflight, "timeouts": self.timeouts, "errors": self.errors,
+                "last_ms": round(self.last_seconds * 1000.0, 2)}
+
+
+class ShardCoordinator:
+    """Fans searches out to shard servers in parallel and merges their top-k under a deadline."""
+
+    def __init__(self, urls: Sequence[str], deadline_ms: Optional[float] = None,
+                 generation_ttl: Optional[float] = None, connections: Optional[int] = None):
+        """
+        Args:
+            urls: Base URLs of the shard servers, e.g. ["http://10.0.0.5:7701", ...]
+            deadline_ms: Fan-out budget per search ($FAISS_SHARD_DEADLINE_MS, default 200)
+            generation_ttl: Seconds a generation() value may be reused before it changes
+                regardless ($FAISS_SHARD_GENERATION_TTL, default 5), since remote writes
+                aren't visible to the coordinator until a search sees them
+            connections: Concurrent searches per node ($FAISS_SHARD_CONNECTIONS, default 4)
+        """
+        if not urls:
+            raise ValueError("ShardCoordinator needs at least one shard URL")
+        self.deadline = (deadline_ms or float(os.getenv("FAISS_SHARD_DEADLINE_MS", 200))) / 1000.0
+        self.generation_ttl = generation_ttl or float(os.getenv("FAISS_SHARD_GENERATION_TTL", 5))
+        self.content_type = default_content_type()
+        connections = connections or int(os.getenv("FAISS_SHARD_CONNECTIONS", 4))
+        write_timeout = float(os.getenv("FAISS_SHARD_WRITE_TIMEOUT", 30))
+        self.clients = [ShardClient(url, self.content_type, connections, write_timeout) for url in urls]
+        self.urls = [client.url for client in self.clients]
+        self._lock = threading.Lock()
+        self._seen_generations: Dict[Tuple[int, Optional[str]], int] = {}
+        self._local_generation = 0
+        self.searches = 0
+        self.partial = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["ShardCoordinator"]:
+        """A coordinator for $FAISS_SHARD_URLS (comma-separated), or None when unset"""
+        urls = [url.strip() for url in os.getenv("FAISS_SHARD_URLS", "").split(",") if url.strip()]
+        return cls(urls) if urls else None
+
+    def search_many(self, query_matrix, k=5, fields=None, nprobe=None, ef_search=None, account_id=None,
+                    deadline_ms: Optional[float] = None) -> List[List[dict]]:
+        """Same contract as VectorStore.search_many, over every shard; hits gain a "shard" field"""
+        query_matrix = np.asarray(query_matrix, dtype=np.float32)
+        if query_matrix.ndim == 1:
+            query_matrix = query_matrix.reshape(1, -1)
+        payload = {"queries": encode_array(query_matrix, self.content_type), "k": int(k),
+                   "account_id": str(account_id) if account_id is not None else None,
+                   "fields": list(fields) if fields else None, "nprobe": nprobe, "ef_search": ef_search}
+
+        deadline = deadline_ms / 1000.0 if deadline_ms is not None else self.deadline
+        futures = {}
+        for shard, client in enumerate(self.clients):
+            # The socket timeout is a backstop that frees the worker; wait() enforces the deadline
+            future = client.submit(client.search, payload, deadline + 1.0)
+            if future is None:
+                client.timeouts += 1  # every worker is still stuck on this node
+            else:
+                futures[future] = shard
+        done, pending = wait(futures, timeout=deadline) if futures else (set(), set())
+
+        rows = []
+        for future in done:
+            shard = futures[future]
+            client = self.clients[shard]
+            try:
+                result = future.result()
+            except TimeoutError:
+                client.timeouts += 1
+                continue
+            except Exception as e:
+                client.errors += 1
+                logger.warning(f"Shard {client.url} search failed: {e}")
+                continue
+            rows.append((shard, result["hits"]))
+            with self._lock:
+                self._seen_generations[(shard, payload["account_id"])] = int(result.get("generation", 0))
+        for future in pending:
+            # A running request finishes (or hits its socket timeout) in the background; its result is dropped
+            future.cancel()
+            self.clients[futures[future]].timeouts += 1
+        self.searches += 1
+        if len(rows) < len(self.clients):
+            self.partial += 1
+        return self._merge(rows, len(query_matrix), k)
+
+    @staticmethod
+    def _merge(rows: List[Tuple[int, List[List[dict]]]], n_queries: int, k: int) -> List[List[dict]]:
+        if not rows:
+            return [[] for _ in range(n_queries)]
+        # Per shard, an (n, k) score matrix whose "ids" are positions into that shard's
+        # hits (offset by shard slot); padding is -1, which merge_topk drops
+        results = []
+        for slot, (_, hits) in enumerate(rows):
+            distances = np.full((n_queries, k), -np.inf, dtype=np.float32)
+            positions = np.full((n_queries, k), -1, dtype=np.int64)
+            for qi, row in enumerate(hits):
+                row = row[:k]
+                distances[qi, :len(row)] = [hit["score"] for hit in row]
+                positions[qi, :len(row)] = slot * k + np.arange(len(row))
+            results.append((distances, positions))
+        _, merged = merge_topk(results, k)
+
+        out = []
+        for qi in range(n_queries):
+            row = []
+            for position in merged[qi].tolist():
+                if position < 0:
+                    continue
+                slot, col = divmod(position, k)
+                shard, hits = rows[slot]
+                row.append({**hits[qi][col], "shard": shard})
+            out.append(row)
+        return out
+
+    def search(self, query_vector: np.ndarray, k=5, fields=None, nprobe=None, ef_search=None, account_id=None,
+               deadline_ms: Optional[float] = None):
+        return self.search_many(np.asarray(query_vector).reshape(1, -1), k, fields, nprobe, ef_search, account_id,
+                                deadline_ms)[0]
+
+    def shard_for(self, account_id) -> int:
+        if account_id is None:
+            return 0
+        return zlib.crc32(str(account_id).encode("utf-8")) % len(self.clients)
+
+    def store_for(self, account_id) -> ShardClient:
+        """The node holding account_id's vectors (writes, removes and updates go here)"""
+        return self.clients[self.shard_for(account_id)]
+
+    def _wrote(self):
+        with self._lock:
+            self._local_generation += 1
+
+    def add_many(self, vectors, messages, conversation_ids=None, account_ids=None, timestamps=None) -> List[Tuple[int, int]]:
+        """Add on the shard owning each account; returns (shard, faiss_id) per vector"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(messages), -1)
+        n = len(messages)
+        conversation_ids = list(conversation_ids) if conversation_ids is not None else [None] * n
+        account_ids = list(account_ids) if account_ids is not None else [None] * n
+        timestamps = list(timestamps) if timestamps is not None else [None] * n
+
+        groups: Dict[int, List[int]] = {}
+        for i, account_id in enumerate(account_ids):
+            groups.setdefault(self.shard_for(account_id), []).append(i)
+        out: List[Optional[Tuple[int, int]]] = [None] * n
+        try:
+            for shard, rows in groups.items():
+                ids = self.clients[shard].add_many(vectors[rows], [messages[i] for i in rows],
+                                                   [conversation_ids[i] for i in rows],
+                                                   [account_ids[i] for i in rows], [timestamps[i] for i in rows])
+                for i, faiss_id in zip(rows, ids):
+                    out[i] = (shard, faiss_id)
+        finally:
+            self._wrote()
+        return out
+
+    def add(self, vector: np.ndarray, message: str, conversation_id: str = None, account_id: str = None,
+            timestamp: float = None) -> Tuple[int, int]:
+        return self.add_many(np.asarray(vector).reshape(1, -1), [message], [conversation_id], [account_id],
+                             [timestamp])[0]
+
+    def remove(self, ids, account_id=None) -> int:
+        """Remove ids from the node owning account_id (faiss_ids alone don't name a node)"""
+        try:
+            return self.store_for(account_id).remove(ids)
+        finally:
+            self._wrote()
+
+    def remove_conversation(self, conversation_id, account_id=None) -> int:
+        try:
+            return self.store_for(account_id).remove_conversation(conversation_id)
+        finally:
+            self._wrote()
+
+    def update(self, faiss_id, vector, message=None, account_id=None) -> int:
+        try:
+            return self.store_for(account_id).update(faiss_id, vector, message)
+        finally:
+            self._wrote()
+
+    def generation(self, account_id=None):
+        """Best-effort change marker for result caches.
+
+        Built from the shard generations seen by the latest searches plus this
+        coordinator's own writes. A time bucket is included, so writes made through
+        other coordinators still invalidate cached results within generation_ttl.
+        """
+        scope = str(account_id) if account_id is not None else None
+        with self._lock:
+            seen = sum(generation for (_, account), generation in self._seen_generations.items() if account == scope)
+            return (int(time.monotonic() // self.generation_ttl), self._local_generation, seen)
+
+    def health(self, timeout: Optional[float] = None) -> List[dict]:
+        """GET /health from every shard in parallel ({"url", "ok", ...} per shard)"""
+        timeout = timeout or max(self.deadline, 1.0)
+
+        def probe(client):
+            try:
+                return {"url": client.url, "ok": True, **client.request("GET", "/health", timeout=timeout)}
+            except Exception as e:
+                return {"url": client.url, "ok": False, "error": str(e)}
+
+        # Its own threads: a node whose workers are stuck should still get probed
+        with ThreadPoolExecutor(max_workers=len(self.clients)) as probes:
+            return list(probes.map(probe, self.clients))
+
+    def stats(self) -> dict:
+        return {
+            "deadline_ms": self.deadline * 1000.0,
+            "encoding": self.content_type,
+            "searches": self.searches,
+            "partial": self.partial,
+            "shards": [client.stats() for client in self.clients],
+        }
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+
+    async def _offload(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: fn(*args, **kwargs))
+
+    async def asearch(self, query_vector, k=5, fields=None, nprobe=None, ef_search=None, account_id=None):
+        return await self._offload(self.search, query_vector, k, fields, nprobe, ef_search, account_id)
+
+    async def asearch_many(self, query_matrix, k=5, fields=None, nprobe=None, ef_search=None, account_id=None):
+        return await self._offload(self.search_many, query_matrix, k, fields, nprobe, ef_search, account_id)
+
+    async def aadd_many(self, vectors, messages, conversation_ids=None, account_ids=None, timestamps=None):
+        return await self._offload(self.add_many, vectors, messages, conversation_ids, account_ids, timestamps)
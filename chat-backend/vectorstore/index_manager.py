@@ -0,0 +1,415 @@
+"""
+Size-adaptive FAISS index management.
+
+The store starts on an exact IndexFlatIP (wrapped in IndexIDMap). Once the
+corpus crosses FAISS_ANN_THRESHOLD vectors it migrates to an approximate index
+(FAISS_ANN_KIND = "ivf" for IVF-Flat or "hnsw"). The new index is trained and
+filled on a snapshot in a background thread. Adds and removes that happen
+meanwhile are queued and applied just before the new index is swapped in under
+the store lock.
+
+Compaction physically drops tombstoned ids: in place for flat and IVF
+indexes, and by rebuilding in the background (same catch-up and swap as a
+migration) for HNSW, which can't remove entries.
+
+`nprobe` (IVF) and `ef_search` (HNSW) can be set per query to trade recall for
+latency. Searches only hold the store lock to pick up the current index; the
+FAISS search itself runs outside it, so adds, checkpoints and other searches
+aren't queued behind a slow query. FAISS indexes aren't safe to mutate while
+searched, so the in-place mutations (add, compaction) wait on a ReadWriteLock
+for the searches in flight. Swapping in a new index needs no wait: a search
+keeps its reference to the old one.
+
+"ivfpq" stores PQ codes instead of vectors (optionally OPQ-rotated first,
+FAISS_OPQ). Searches over-fetch `rescore_factor` x k candidates and re-score
+them exactly against the float32 copies in a VectorSidecar.
+"""
+import logging
+import math
+import os
+import threading
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FLAT = "flat"
+IVF = "ivf"
+HNSW = "hnsw"
+IVFPQ = "ivfpq"
+
+
+def new_flat_index(dim: int):
+    return faiss.IndexIDMap(faiss.IndexFlatIP(dim))
+
+
+def index_kind(index) -> str:
+    """Classify an index (possibly IndexIDMap- or OPQ-wrapped) as flat / ivf / ivfpq / hnsw"""
+    if isinstance(index, faiss.IndexIDMap):
+        inner = faiss.downcast_index(index.index)
+    elif isinstance(index, faiss.IndexPreTransform):
+        inner = faiss.downcast_index(index.index)
+    else:
+        inner = index
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return IVFPQ
+    if isinstance(inner, faiss.IndexIVF):
+        return IVF
+    if isinstance(inner, faiss.IndexHNSW):
+        return HNSW
+    return FLAT
+
+
+def index_ids(index) -> np.ndarray:
+    """All ids stored in the index as an int64 array (no per-id Python loop)"""
+    if index.ntotal == 0:
+        return np.zeros(0, dtype=np.int64)
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.vector_to_array(index.id_map).astype(np.int64)
+
+    ivf = faiss.extract_index_ivf(index)
+    invlists = ivf.invlists
+    parts = []
+    for list_no in range(ivf.nlist):
+        size = invlists.list_size(list_no)
+        if size:
+            parts.append(np.array(faiss.rev_swig_ptr(invlists.get_ids(list_no), size), dtype=np.int64))
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+
+def and_selectors(*selectors):
+    """Intersection of the given IDSelectors (None entries are ignored)"""
+    selectors = [sel for sel in selectors if sel is not None]
+    if not selectors:
+        return None
+    combined = selectors[0]
+    for sel in selectors[1:]:
+        parts = [combined, sel]
+        combined = faiss.IDSelectorAnd(combined, sel)
+        combined.referenced_objects = parts
+    return combined
+
+
+def merge_topk(results, k: int):
+    """Merge several (distances, ids) search results row-wise into one top-k (higher score first)"""
+    results = [(d, i) for d, i in results if d is not None]
+    if len(results) == 1:
+        return results[0]
+    distances = np.concatenate([d for d, _ in results], axis=1)
+    ids = np.concatenate([i for _, i in results], axis=1)
+    distances = np.where(ids == -1, -np.inf, distances)
+    order = np.argsort(-distances, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(distances, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+def index_vectors(index) -> Tuple[np.ndarray, np.ndarray]:
+    """(ids, vectors) of an IndexIDMap-wrapped flat/HNSW index"""
+    ids = index_ids(index)
+    vectors = index.index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, index.d), dtype=np.float32)
+    return ids, vectors
+
+
+class ReadWriteLock:
+    """Shared for readers, exclusive for a writer; a waiting writer holds off new readers."""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+class IndexManager:
+    """Owns the live FAISS index and migrates it from flat to ANN as the corpus grows."""
+
+    def __init__(self, dim: int, index=None, lock: Optional[threading.RLock] = None,
+                 ann_kind: Optional[str] = None, ann_threshold: Optional[int] = None,
+                 nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                 hnsw_m: Optional[int] = None, on_swap=None, sidecar=None,
+                 rescore_factor: Optional[int] = None):
+        """
+        Args:
+            dim: Vector dimension
+            index: Existing index to manage (a new flat index if None)
+            lock: Lock shared with the owning store for index mutation/search
+            ann_kind: "ivf", "hnsw" or "ivfpq" ($FAISS_ANN_KIND, default ivf)
+            ann_threshold: Corpus size that triggers migration ($FAISS_ANN_THRESHOLD, default 50000; 0 disables)
+            nprobe: Default IVF probes ($FAISS_NPROBE, default 16)
+            ef_search: Default HNSW efSearch ($FAISS_EF_SEARCH, default 64)
+            hnsw_m: HNSW graph degree ($FAISS_HNSW_M, default 32)
+            on_swap: Callback run (under the lock) after a migrated index is swapped in
+            sidecar: VectorSidecar with exact vectors for re-scoring compressed (ivfpq) hits
+            rescore_factor: Candidates fetched per requested hit before re-scoring ($FAISS_RESCORE_FACTOR, default 4)
+        """
+        self.dim = dim
+        self.index = index if index is not None else new_flat_index(dim)
+        self.lock = lock or threading.RLock()
+        self.ann_kind = (ann_kind or os.getenv("FAISS_ANN_KIND", IVF)).lower()
+        self.ann_threshold = ann_threshold if ann_threshold is not None else int(os.getenv("FAISS_ANN_THRESHOLD", 50000))
+        self.nprobe = nprobe or int(os.getenv("FAISS_NPROBE", 16))
+        self.ef_search = ef_search or int(os.getenv("FAISS_EF_SEARCH", 64))
+        self.hnsw_m = hnsw_m or int(os.getenv("FAISS_HNSW_M", 32))
+        self.on_swap = on_swap
+        self.sidecar = sidecar
+        self.rescore_factor = rescore_factor or int(os.getenv("FAISS_RESCORE_FACTOR", 4))
+        self.pq_m = int(os.getenv("FAISS_PQ_M", 64))  # sub-quantizers (bytes per vector); must divide dim
+        self.opq = os.getenv("FAISS_OPQ", "false").lower() == "true"
+
+        self._migration: Optional[threading.Thread] = None
+        self._pending: Optional[List[tuple]] = None
+        # Searches read the live index outside self.lock; in-place mutations wait for them
+        self.searching = ReadWriteLock()
+        self._apply_defaults(self.index)
+
+    @property
+    def kind(self) -> str:
+        return index_kind(self.index)
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def migrating(self) -> bool:
+        """True while a background migration or compaction rebuild is running"""
+        return self._pending is not None
+
+    def _apply_defaults(self, index):
+        kind = index_kind(index)
+        if kind in (IVF, IVFPQ):
+            faiss.extract_index_ivf(index).nprobe = self.nprobe
+        elif kind == HNSW:
+            faiss.downcast_index(index.index).hnsw.efSearch = self.ef_search
+
+    # ─────────────────────────────────────────────────────────────────────
+    #  Mutation (callers hold self.lock)
+    # ─────────────────────────────────────────────────────────────────────
+    def add(self, vectors: np.ndarray, ids: np.ndarray):
+        with self.searching.write():
+            self.index.add_with_ids(vectors, ids)
+        if self.sidecar is not None:
+            self.sidecar.add(ids, vectors)
+        if self._pending is not None:
+            self._pending.append((vectors, ids))
+        self.maybe_migrate()
+
+    def replace(self, index, keep_migration: bool = False):
+        """Install a different index (e.g. a rebuild); cancels any in-flight migration.
+
+        keep_migration is for swapping in an equivalent copy of the same
+        vectors (a promoted memory-mapped index): the migration keeps going.
+        """
+        if not keep_migration:
+            self._pending = None
+        self.index = index
+        self._apply_defaults(index)
+
+    # ─────────────────────────────────────────────────────────────────────
+    #  Search
+    # ─────────────────────────────────────────────────────────────────────
+    def search(self, queries: np.ndarray, k: int, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None, sel=None):
+        """Search with optional per-query recall/latency knobs and id selector"""
+        with self.lock:
+            index = self.index
+            kind = self.kind
+            rescore = kind == IVFPQ and self.sidecar is not None
+            fetch = k * self.rescore_factor if rescore else k
+            params = None
+            if nprobe is not None or ef_search is not None or sel is not None:
+                if kind in (IVF, IVFPQ):
+                    params = faiss.SearchParametersIVF()
+                    params.nprobe = nprobe or faiss.extract_index_ivf(index).nprobe
+                elif kind == HNSW:
+                    params = faiss.SearchParametersHNSW()
+                    params.efSearch = ef_search or faiss.downcast_index(index.index).hnsw.efSearch
+                else:
+                    params = faiss.SearchParameters()
+                if sel is not None:
+                    params.sel = sel
+
+        with self.searching.read():
+            distances, ids = index.search(queries, fetch, params=params) if params is not None \
+                else index.search(queries, fetch)
+        return self._rescore(queries, distances, ids, k) if rescore else (distances, ids)
+
+    def vectors(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(found ids, exact vectors) for the ids whose vectors can be read back.
+
+        Flat and HNSW indexes hold the vectors themselves, and IVF-PQ holds only
+        codes, so with a sidecar the sidecar answers. Plain IVF has no id-to-slot
+        map, so nothing is found and the caller falls back to the metadata.
+        """
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        if self.sidecar is not None:
+            rows = self.sidecar.rows(ids)
+            return ids[rows >= 0], self.sidecar.get(ids[rows >= 0], rows[rows >= 0])
+        with self.lock:
+            index = self.index
+            if not isinstance(index, faiss.IndexIDMap) or index.ntotal == 0:
+                return np.zeros(0, dtype=np.int64), np.zeros((0, self.dim), dtype=np.float32)
+            id_map = faiss.vector_to_array(index.id_map)
+            positions = np.flatnonzero(np.isin(id_map, ids))
+            return id_map[positions].astype(np.int64), index.index.reconstruct_batch(positions)
+
+    def _rescore(self, queries: np.ndarray, distances: np.ndarray, ids: np.ndarray, k: int):
+        """Exact inner products for the PQ candidates, best k per query row"""
+        rows = self.sidecar.rows(ids)
+        vectors = self.sidecar.get(ids, rows)                # (nq, fetch, dim), memory-mapped rows
+        scores = np.einsum("qfd,qd->qf", vectors, queries)
+        # Ids missing from the sidecar keep their approximate score
+        scores = np.where(rows >= 0, scores, distances)
+        scores[ids == -1] = -np.inf
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        distances = np.take_along_axis(scores, order, axis=1)
+        ids = np.take_along_axis(ids, order, axis=1)
+        ids[np.isneginf(distances)] = -1
+        return distances.astype(np.float32), ids
+
+    # ─────────────────────────────────────────────────────────────────────
+    #  Migration
+    # ─────────────────────────────────────────────────────────────────────
+    def maybe_migrate(self):
+        if (self.ann_threshold and self.kind == FLAT and self._migration is None
+                and self.index.ntotal >= self.ann_threshold and self.ann_kind in (IVF, HNSW, IVFPQ)):
+            self.start_migration()
+
+    def start_migration(self) -> threading.Thread:
+        """Snapshot the flat index and build the ANN index from it in the background"""
+        return self._start_rebuild(self.ann_kind)
+
+    def compact(self, dead: np.ndarray, on_done=None) -> Optional[threading.Thread]:
+        """Physically remove dead ids.
+
+        Flat/IVF indexes drop them in place and on_done(dead) runs right away.
+        HNSW can't remove entries, so it is rebuilt without them in the
+        background and on_done runs (under the lock) once the rebuilt index is live.
+        Returns the rebuild thread, or None if nothing was left running.
+        """
+        dead = np.asarray(dead, dtype=np.int64)
+        with self.lock:
+            if self._migration is not None:
+                return None  # retried after the running rebuild finishes
+            if self.kind != HNSW:
+                with self.searching.write():
+                    self.index.remove_ids(dead)
+                if self.sidecar is not None:
+                    self.sidecar.remove(dead)
+                    self.sidecar.compact()
+                if on_done:
+                    on_done(dead)
+                return None
+            return self._start_rebuild(HNSW, exclude=dead, on_done=on_done)
+
+    def _start_rebuild(self, kind: str, exclude: Optional[np.ndarray] = None, on_done=None) -> threading.Thread:
+        with self.lock:
+            if self._migration is not None:
+                return self._migration
+            ids, vectors = index_vectors(self.index)
+            if exclude is not None:
+                keep = ~np.isin(ids, exclude)
+                ids, vectors = ids[keep], vectors[keep]
+            self._pending = []
+            self._migration = threading.Thread(
+                target=self._migrate, args=(ids, vectors, kind, exclude, on_done),
+                name="faiss-migrate", daemon=True
+            )
+            self._migration.start()
+            return self._migration
+
+    def build(self, ids: np.ndarray, vectors: np.ndarray, kind: Optional[str] = None):
+        """Train (if needed) and fill a new index of `kind` (default ann_kind) with the given vectors"""
+        n = len(ids)
+        kind = kind or self.ann_kind
+        if kind == HNSW:
+            index = faiss.IndexIDMap(faiss.IndexHNSWFlat(self.dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT))
+            faiss.downcast_index(index.index).hnsw.efConstruction = int(os.getenv("FAISS_EF_CONSTRUCTION", 200))
+        elif kind == IVFPQ:
+            nlist = max(1, int(4 * math.sqrt(n)))
+            prefix = f"OPQ{self.pq_m}," if self.opq else ""
+            index = faiss.index_factory(self.dim, f"{prefix}IVF{nlist},PQ{self.pq_m}", faiss.METRIC_INNER_PRODUCT)
+            # Polysemous codes only help Hamming-filtered search, which isn't used; their
+            # training dominates build time
+            faiss.downcast_index(faiss.extract_index_ivf(index)).do_polysemous_training = False
+            # Each sub-quantizer learns 256 centroids, so it needs more points than IVF alone
+            sample_size = min(n, max(nlist, 256) * 64)
+            sample = vectors[np.random.default_rng().choice(n, size=sample_size, replace=False)]
+            logger.info(f"Training IVF{nlist},PQ{self.pq_m}{' with OPQ' if self.opq else ''} on {sample_size} vectors …")
+            index.train(sample)
+        else:
+            nlist = max(1, int(4 * math.sqrt(n)))
+            quantizer = faiss.IndexFlatIP(self.dim)
+            index = faiss.IndexIVFFlat(quantizer, self.dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.own_fields = True
+            quantizer.this.disown()
+            # Centroids only need a sample (FAISS recommends ~30-256 points per list)
+            sample_size = min(n, nlist * 64)
+            sample = vectors[np.random.default_rng().choice(n, size=sample_size, replace=False)]
+            logger.info(f"Training IVF ({nlist} lists) on {sample_size} vectors …")
+            index.train(sample)
+
+        index.add_with_ids(vectors, ids)
+        self._apply_defaults(index)
+        return index
+
+    def _migrate(self, ids: np.ndarray, vectors: np.ndarray, kind: str,
+                 exclude: Optional[np.ndarray] = None, on_done=None):
+        try:
+            logger.info(f"Building {kind} index over {len(ids)} vectors …")
+            new_index = self.build(ids, vectors, kind)
+
+            with self.lock:
+                if self._pending is None:
+                    logger.info("Index rebuild cancelled")
+                    return
+                # Catch up on everything that was added while we were building
+                for op_vectors, op_ids in self._pending:
+                    new_index.add_with_ids(op_vectors, op_ids)
+                self.index = new_index
+                self._pending = None
+                if exclude is not None and self.sidecar is not None:
+                    self.sidecar.remove(exclude)
+                    self.sidecar.compact()
+                if on_done:
+                    on_done(exclude)
+                if self.on_swap:
+                    self.on_swap()
+            logger.info(f"Index rebuilt as {kind} ({new_index.ntotal} vectors)")
+        except Exception as e:
+            logger.exception(f"Index rebuild failed: {e}")
+            with self.lock:
+                self._pending = None
+        finally:
+            self._migration = None
@@ -0,0 +1,411 @@
+"""
+Sequential faiss_id allocation and an id-indexed metadata table.
+
+faiss_ids are handed out by a monotonic counter, so they are dense and can
+index NumPy arrays directly:
+
+* ``conversation`` / ``account`` - int32 ordinals into interned id strings
+* ``timestamp`` - float64 unix time
+* ``text_offset`` / ``text_length`` - slice of the message in an append-only UTF-8 text store
+
+Hydrating a search hit or filtering hits by account is then array indexing
+instead of a Mongo round trip. Files next to the index:
+
+* ``<path>.npz`` - arrays, interned ids and the allocator's next id (written at checkpoints)
+* ``<path>.text`` - append-only message text (rewritten without dead rows by compact_text)
+
+Ids issued before sequential allocation were random 63-bit numbers. They are
+at or above LEGACY_ID_FLOOR, never land in the table and are hydrated from Mongo.
+"""
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LEGACY_ID_FLOOR = 1 << 40
+
+# Fields the table can serve without Mongo
+TABLE_FIELDS = ("faiss_id", "message", "conversation_id", "account_id", "timestamp")
+
+
+class IdAllocator:
+    """Monotonic faiss_id counter.
+
+    With a reserve_path, ids are reserved in blocks: the end of the current
+    block is fsynced before any id in it is handed out, and a restart resumes
+    after it. Ids therefore stay unique across crashes even when they were
+    only logged to a WAL that is replayed lazily (account shards).
+    """
+
+    def __init__(self, next_id: int = 1, reserve_path: Optional[str] = None, block: Optional[int] = None):
+        self._lock = threading.Lock()
+        self.next_id = next_id
+        self.reserve_path = reserve_path
+        self.block = block or int(os.getenv("FAISS_ID_BLOCK", 4096))
+        self._reserved = 0
+        if reserve_path and os.path.exists(reserve_path):
+            with open(reserve_path, "r") as fh:
+                self._reserved = int(fh.read().strip() or 0)
+            self.next_id = max(self.next_id, self._reserved)
+
+    def _reserve(self, end: int):
+        self._reserved = end + self.block
+        tmp_path = self.reserve_path + ".tmp"
+        with open(tmp_path, "w") as fh:
+            fh.write(str(self._reserved))
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, self.reserve_path)
+
+    def allocate(self, n: int = 1) -> np.ndarray:
+        with self._lock:
+            ids = np.arange(self.next_id, self.next_id + n, dtype=np.int64)
+            self.next_id += n
+            if self.reserve_path and self.next_id > self._reserved:
+                self._reserve(self.next_id)
+            return ids
+
+    def issued(self, ids) -> np.ndarray:
+        """Mask of ids this counter has moved past (legacy ids count: they're never handed out)"""
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            return (ids >= 0) & ((ids < self.next_id) | (ids >= LEGACY_ID_FLOOR))
+
+    def observe(self, ids):
+        """Never hand out an id that already exists (e.g. replayed from the WAL)"""
+        ids = np.asarray(ids, dtype=np.int64)
+        ids = ids[ids < LEGACY_ID_FLOOR]
+        if len(ids):
+            with self._lock:
+                self.next_id = max(self.next_id, int(ids.max()) + 1)
+
+
+class _Interner:
+    """String id <-> int32 ordinal"""
+
+    def __init__(self, values: Sequence[str] = ()):
+        self.values: List[str] = list(values)
+        self.ordinals: Dict[str, int] = {value: i for i, value in enumerate(self.values)}
+
+    def get(self, value) -> int:
+        return self.ordinals.get(str(value), -1) if value is not None else -1
+
+    def intern(self, value) -> int:
+        if value is None:
+            return -1
+        value = str(value)
+        ordinal = self.ordinals.get(value)
+        if ordinal is None:
+            ordinal = self.ordinals[value] = len(self.values)
+            self.values.append(value)
+        return ordinal
+
+
+class MetadataTable:
+    """faiss_id -> (conversation, account, timestamp, message) in NumPy arrays."""
+
+    def __init__(self, path: Optional[str], initial_capacity: int = 1024):
+        """
+        Args:
+            path: Base path for the .npz snapshot and .text store, None for memory-only
+            initial_capacity: Rows allocated up front (grows by doubling)
+        """
+        self.path = path
+        self.npz_path = path + ".npz" if path else None
+        self.text_path = path + ".text" if path else None
+
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()  # orders snapshot writes with text compaction
+        self.allocator = IdAllocator(reserve_path=path + ".nextid" if path else None)
+        self.conversations = _Interner()
+        self.accounts = _Interner()
+        self._allocate(max(initial_capacity, 1))
+        self._text = bytearray()
+        self._text_fh = None
+
+        if path:
+            self._open()
+
+    def _allocate(self, capacity: int):
+        self.conversation = np.full(capacity, -1, dtype=np.int32)
+        self.account = np.full(capacity, -1, dtype=np.int32)
+        self.timestamp = np.full(capacity, np.nan, dtype=np.float64)
+        self.text_offset = np.full(capacity, -1, dtype=np.int64)
+        self.text_length = np.zeros(capacity, dtype=np.int32)
+
+    def _grow(self, needed: int):
+        capacity = len(self.conversation)
+        while capacity < needed:
+            capacity *= 2
+        old = (self.conversation, self.account, self.timestamp, self.text_offset, self.text_length)
+        self._allocate(capacity)
+        for new, previous in zip((self.conversation, self.account, self.timestamp,
+                                  self.text_offset, self.text_length), old):
+            new[:len(previous)] = previous
+
+    # ─────────────────────────────────────────────────────────────────────
+    #  Persistence
+    # ─────────────────────────────────────────────────────────────────────
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._finish_text_compaction()
+
+        self._text_fh = open(self.text_path, "a+b")
+        text_size = os.path.getsize(self.text_path)
+
+        if os.path.exists(self.npz_path):
+            with np.load(self.npz_path) as data:
+                size = len(data["conversation"])
+                self._allocate(max(size, len(self.conversation)))
+                self.conversation[:size] = data["conversation"]
+                self.account[:size] = data["account"]
+                self.timestamp[:size] = data["timestamp"]
+                self.text_offset[:size] = data["text_offset"]
+                self.text_length[:size] = data["text_length"]
+                header = json.loads(bytes(data["header"]).decode("utf-8"))
+            self.allocator.next_id = max(self.allocator.next_id, header["next_id"])
+            self.conversations = _Interner(header["conversations"])
+            self.accounts = _Interner(header["accounts"])
+
+            # Rows whose text didn't reach the disk before a crash are treated as unknown
+            torn = self.text_offset + self.text_length > text_size
+            self.text_offset[torn] = -1
+        logger.info(f"Metadata table opened with {int((self.text_offset >= 0).sum())} rows ({self.path})")
+
+    def save(self):
+        """Durably write the arrays (text first, so every saved offset is backed by data)"""
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                self._text_fh.flush()
+                os.fsync(self._text_fh.fileno())
+                arrays = self._arrays(self.text_offset)
+            self._write_npz(self.npz_path + ".tmp", arrays)
+            os.replace(self.npz_path + ".tmp", self.npz_path)
+
+    def _arrays(self, text_offset: np.ndarray) -> Dict[str, np.ndarray]:
+        """Copies of the used part of the arrays plus the header, for the .npz (caller holds the lock)"""
+        used = np.flatnonzero((text_offset >= 0) | (self.account >= 0))
+        size = int(used[-1] + 1) if len(used) else 0
+        header = json.dumps({
+            "next_id": self.allocator.next_id,
+            "conversations": self.conversations.values,
+            "accounts": self.accounts.values,
+        }).encode("utf-8")
+        return {
+            "conversation": self.conversation[:size].copy(),
+            "account": self.account[:size].copy(),
+            "timestamp": self.timestamp[:size].copy(),
+            "text_offset": text_offset[:size].copy(),
+            "text_length": self.text_length[:size].copy(),
+            "header": np.frombuffer(header, dtype=np.uint8),
+        }
+
+    @staticmethod
+    def _write_npz(path: str, arrays: Dict[str, np.ndarray]):
+        with open(path, "wb") as fh:
+            np.savez(fh, **arrays)
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    def compact_text(self) -> int:
+        """Rewrite the text store with only the live rows' text; returns the bytes reclaimed.
+
+        Removed rows and edited messages leave their old text behind in the
+        append-only store until this runs. The new text file and a snapshot
+        pointing into it are written and fsynced next to the old pair, then
+        renamed over it, text first. A crash before the text rename keeps
+        the old pair; one after it is finished on the next open.
+        """
+        with self._save_lock, self._lock:
+            live = np.flatnonzero(self.text_offset >= 0)
+            lengths = self.text_length[live].astype(np.int64)
+            size = len(self._text) if self._text_fh is None else os.fstat(self._text_fh.fileno()).st_size
+            reclaimed = size - int(lengths.sum())
+            if reclaimed <= 0:
+                return 0
+
+            data = b"".join(self._read_bytes(int(offset), int(length))
+                            for offset, length in zip(self.text_offset[live], lengths))
+            text_offset = self.text_offset.copy()
+            text_offset[live] = np.cumsum(lengths) - lengths
+
+            if self._text_fh is None:
+                self._text = bytearray(data)
+            else:
+                text_tmp, npz_tmp = self.text_path + ".compact", self.npz_path + ".compact"
+                with open(text_tmp, "wb") as fh:
+                    fh.write(data)
+                    fh.flush()
+                    os.fsync(fh.fileno())
+                self._write_npz(npz_tmp, self._arrays(text_offset))
+                self._text_fh.close()
+                os.replace(text_tmp, self.text_path)
+                os.replace(npz_tmp, self.npz_path)
+                self._text_fh = open(self.text_path, "a+b")
+            self.text_offset = text_offset
+        logger.info(f"Metadata text store compacted, {reclaimed} bytes reclaimed")
+        return reclaimed
+
+    def _finish_text_compaction(self):
+        """Complete or discard a text compaction interrupted by a crash (see compact_text)"""
+        text_tmp, npz_tmp = self.text_path + ".compact", self.npz_path + ".compact"
+        if os.path.exists(text_tmp):
+            # The new text never replaced the old one, so the old pair is intact
+            for path in (text_tmp, npz_tmp):
+                if os.path.exists(path):
+                    os.remove(path)
+        elif os.path.exists(npz_tmp):
+            # The new text is in place; the snapshot pointing into it must follow
+            os.replace(npz_tmp, self.npz_path)
+
+    def close(self):
+        if self._text_fh is not None and not self._text_fh.closed:
+            self.save()
+            self._text_fh.close()
+
+    # ─────────────────────────────────────────────────────────────────────
+    #  Rows
+    # ─────────────────────────────────────────────────────────────────────
+    def _append_text(self, data: bytes) -> int:
+        if self._text_fh is None:
+            offset = len(self._text)
+            self._text.extend(data)
+            return offset
+        self._text_fh.seek(0, os.SEEK_END)
+        offset = self._text_fh.tell()
+        self._text_fh.write(data)
+        return offset
+
+    def _read_bytes(self, offset: int, length: int) -> bytes:
+        if self._text_fh is None:
+            return bytes(self._text[offset:offset + length])
+        return os.pread(self._text_fh.fileno(), length, offset)
+
+    def _read_text(self, offset: int, length: int) -> str:
+        return self._read_bytes(offset, length).decode("utf-8")
+
+    def set(self, ids, messages: Sequence[str], conversation_ids: Sequence[Optional[str]],
+            account_ids: Optional[Sequence[Optional[str]]] = None,
+            timestamps: Optional[Sequence[float]] = None):
+        """Record metadata for sequential ids (legacy ids are skipped)"""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        n = len(ids)
+        account_ids = account_ids if account_ids is not None else [None] * n
+        timestamps = timestamps if timestamps is not None else [np.nan] * n
+        keep = np.flatnonzero(ids < LEGACY_ID_FLOOR)
+        if len(keep) == 0:
+            return
+
+        with self._lock:
+            top = int(ids[keep].max())
+            if top >= len(self.conversation):
+                self._grow(top + 1)
+            for i in keep.tolist():
+                faiss_id = int(ids[i])
+                data = (messages[i] or "").encode("utf-8")
+                self.text_offset[faiss_id] = self._append_text(data)
+                self.text_length[faiss_id] = len(data)
+                self.conversation[faiss_id] = self.conversations.intern(conversation_ids[i])
+                self.account[faiss_id] = self.accounts.intern(account_ids[i])
+                self.timestamp[faiss_id] = timestamps[i] if timestamps[i] is not None else np.nan
+            if self._text_fh is not None:
+                self._text_fh.flush()
+        self.allocator.observe(ids[keep])
+
+    def remove(self, ids):
+        """Drop rows from hydration/filtering (the account ordinal is kept to route compaction)"""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        with self._lock:
+            ids = ids[(ids >= 0) & (ids < len(self.conversation))]
+            self.text_offset[ids] = -1
+            self.conversation[ids] = -1
+
+    def account_of(self, ids) -> List[Optional[str]]:
+        """Account id per faiss_id (None for legacy/unknown ids)"""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        with self._lock:
+            inside = (ids >= 0) & (ids < len(self.account))
+            ordinals = np.full(len(ids), -1, dtype=np.int32)
+            ordinals[inside] = self.account[ids[inside]]
+            return [self.accounts.values[o] if o >= 0 else None for o in ordinals.tolist()]
+
+    def has(self, ids) -> np.ndarray:
+        """Boolean mask (same shape as ids) of ids the table can hydrate"""
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            inside = (ids >= 0) & (ids < len(self.text_offset))
+            known = np.zeros(ids.shape, dtype=bool)
+            known[inside] = self.text_offset[ids[inside]] >= 0
+            return known
+
+    def account_rows(self, skip_accounts: Iterable[str] = ()) -> np.ndarray:
+        """Ids with a live row that belongs to an account, except the accounts in skip_accounts"""
+        with self._lock:
+            mask = (self.text_offset >= 0) & (self.account >= 0)
+            skip = [self.accounts.get(account_id) for account_id in skip_accounts]
+            skip = [ordinal for ordinal in skip if ordinal >= 0]
+            if skip:
+                mask &= ~np.isin(self.account, skip)
+            return np.flatnonzero(mask).astype(np.int64)
+
+    def rows(self, ids, fields: Sequence[str] = TABLE_FIELDS) -> Dict[int, dict]:
+        """Metadata docs for the known ids, shaped like the Mongo vector docs"""
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        ids = ids[self.has(ids)]
+        docs = {}
+        with self._lock:
+            for faiss_id in ids.tolist():
+                doc = {"faiss_id": faiss_id}
+                if "message" in fields:
+                    doc["message"] = self._read_text(int(self.text_offset[faiss_id]),
+                                                     int(self.text_length[faiss_id]))
+                if "conversation_id" in fields:
+                    ordinal = self.conversation[faiss_id]
+                    doc["conversation_id"] = self.conversations.values[ordinal] if ordinal >= 0 else None
+                if "account_id" in fields:
+                    ordinal = self.account[faiss_id]
+                    doc["account_id"] = self.accounts.values[ordinal] if ordinal >= 0 else None
+                if "timestamp" in fields:
+                    ts = self.timestamp[faiss_id]
+                    doc["timestamp"] = None if np.isnan(ts) else float(ts)
+                docs[faiss_id] = doc
+        return docs
+
+    def selector(self, account_id: Optional[str] = None, conversation_id: Optional[str] = None):
+        """FAISS IDSelectorBitmap over ids matching the filters, or None if nothing matches.
+
+        The bitmap array is attached to the selector so it outlives the search.
+        """
+        with self._lock:
+            mask = self.text_offset >= 0
+            # An unknown id has ordinal -1, which would otherwise match every row without one
+            if account_id is not None:
+                ordinal = self.accounts.get(account_id)
+                if ordinal < 0:
+                    return None
+                mask &= self.account == ordinal
+            if conversation_id is not None:
+                ordinal = self.conversations.get(conversation_id)
+                if ordinal < 0:
+                    return None
+                mask &= self.conversation == ordinal
+        if not mask.any():
+            return None
+        bitmap = np.packbits(mask, bitorder="little")
+        # Size in bytes, so ids past the table aren't read from memory after the array
+        sel = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+        sel.referenced_objects = [bitmap]
+        return sel
+
+    def __len__(self):
+        return int((self.text_offset >= 0).sum())
@@ -0,0 +1,106 @@
+"""
+Measure what the compressed (IVF-PQ) storage mode costs in recall.
+
+Builds an exact flat index and an IVF-PQ index over the same vectors and
+reports recall@k of the PQ index against the flat ground truth, with and
+without exact re-scoring from the sidecar, for a range of nprobe values.
+
+    python -m vectorstore.recall faiss_index.idx            # vectors from the store's sidecar / index
+    python -m vectorstore.recall --synthetic 100000 --dim 768
+"""
+import argparse
+import logging
+import os
+import time
+from typing import Iterable, List, Optional
+
+import faiss
+import numpy as np
+
+from .index_manager import IVFPQ, IndexManager, index_vectors, new_flat_index
+from .sidecar import VectorSidecar
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray, k: int) -> float:
+    """Mean fraction of each query's true top-k ids that appear in its found top-k"""
+    hits = [len(np.intersect1d(t[:k][t[:k] != -1], f[:k])) for t, f in zip(truth, found)]
+    return float(np.mean(hits)) / k
+
+
+def measure_recall(vectors: np.ndarray, ids: Optional[np.ndarray] = None, k: int = 10,
+                   num_queries: int = 200, nprobes: Iterable[int] = (1, 4, 16, 64),
+                   rescore_factor: Optional[int] = None, seed: int = 0) -> List[dict]:
+    """recall@k of IVF-PQ vs flat, one row per (nprobe, rescored) setting.
+
+    Queries are corpus vectors with a little noise added, so they behave like
+    paraphrases of stored messages rather than exact duplicates.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    ids = np.arange(n, dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(n, size=min(num_queries, n), replace=False)]
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    flat = new_flat_index(dim)
+    flat.add_with_ids(vectors, ids)
+    _, truth = flat.search(queries, k)
+
+    sidecar = VectorSidecar(None, dim, initial_capacity=n)
+    sidecar.add(ids, vectors)
+    manager = IndexManager(dim, ann_kind=IVFPQ, ann_threshold=0, sidecar=sidecar,
+                           rescore_factor=rescore_factor)
+    manager.index = manager.build(ids, vectors)
+    pq_bytes = len(faiss.serialize_index(manager.index))
+
+    report = []
+    for nprobe in nprobes:
+        for rescored in (False, True):
+            manager.sidecar = sidecar if rescored else None
+            start = time.perf_counter()
+            _, found = manager.search(queries, k, nprobe=nprobe)
+            elapsed = time.perf_counter() - start
+            report.append({
+                "nprobe": nprobe,
+                "rescored": rescored,
+                f"recall@{k}": round(recall_at_k(truth, found, k), 4),
+                "ms_per_query": round(1000 * elapsed / len(queries), 3),
+            })
+    manager.sidecar = sidecar
+
+    print(f"{n} vectors x {dim} dims: flat {dim * 4} B/vector, "
+          f"IVF-PQ{manager.pq_m} {pq_bytes / n:.0f} B/vector")
+    return report
+
+
+def _load_vectors(index_path: str):
+    """(ids, vectors) from a store's pq sidecar if present, else from its flat/HNSW index"""
+    if os.path.exists(index_path + ".vectors.f32"):
+        return VectorSidecar(index_path + ".vectors", faiss.read_index(index_path).d).vectors()
+    return index_vectors(faiss.read_index(index_path))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="recall@k of IVF-PQ storage against the flat index")
+    parser.add_argument("index_path", nargs="?", default="faiss_index.idx")
+    parser.add_argument("--synthetic", type=int, help="Use N random unit vectors instead of an index")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--rescore-factor", type=int)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        ids = None
+        vectors = np.random.default_rng(0).standard_normal((args.synthetic, args.dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    else:
+        ids, vectors = _load_vectors(args.index_path)
+
+    for row in measure_recall(vectors, ids, k=args.k, num_queries=args.queries,
+                              nprobes=args.nprobe, rescore_factor=args.rescore_factor):
+        print("  ".join(f"{key}={value}" for key, value in row.items()))
@@ -0,0 +1,180 @@
+"""
+Shard-server mode: serve one VectorStore over HTTP so several machines can
+split a corpus (see coordinator.ShardCoordinator for the client side).
+
+    python -m vectorstore.remote --index-path node1.idx --mongo-db vectors_node1 --port 7701
+    python -m vectorstore.remote --index-path node2.idx --mongo-db vectors_node2 --port 7702
+
+Endpoints (request and response bodies use the same encoding):
+
+* ``POST /search``  {queries, k, account_id?, fields?, nprobe?, ef_search?} -> {hits: [[hit, ...], ...]}
+* ``POST /add``     {vectors, messages, conversation_ids?, account_ids?, timestamps?} -> {ids}
+* ``POST /remove``  {ids} -> {removed}
+* ``POST /remove_conversation``  {conversation_id} -> {removed}
+* ``POST /update``  {faiss_id, vector, message?} -> {faiss_id}
+* ``GET  /health``  -> {ntotal, dim, generation}
+
+Bodies are msgpack (``application/msgpack``) when msgpack is installed,
+otherwise JSON. Matrices travel as {dtype, shape, data}: raw bytes in
+msgpack, nested lists in JSON. The server is a stdlib ThreadingHTTPServer.
+The store is thread-safe and FAISS releases the GIL, so concurrent requests
+search in parallel without an extra web framework on the node.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Tuple
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+MSGPACK = "application/msgpack"
+JSON = "application/json"
+
+
+def default_content_type() -> str:
+    return MSGPACK if msgpack is not None else JSON
+
+
+def encode_array(array: np.ndarray, content_type: str) -> dict:
+    array = np.ascontiguousarray(array)
+    data = array.tobytes() if content_type == MSGPACK else array.tolist()
+    return {"dtype": str(array.dtype), "shape": list(array.shape), "data": data}
+
+
+def decode_array(obj: dict) -> np.ndarray:
+    if isinstance(obj["data"], (bytes, bytearray)):
+        return np.frombuffer(obj["data"], dtype=obj["dtype"]).reshape(obj["shape"])
+    return np.asarray(obj["data"], dtype=obj["dtype"]).reshape(obj["shape"])
+
+
+def pack(obj: Any, content_type: str) -> bytes:
+    if content_type == MSGPACK:
+        return msgpack.packb(obj, use_bin_type=True, default=str)
+    return json.dumps(obj, default=str).encode("utf-8")
+
+
+def unpack(body: bytes, content_type: str) -> Any:
+    if not body:
+        return {}
+    if content_type.startswith(MSGPACK):
+        if msgpack is None:
+            raise ValueError("msgpack body but msgpack is not installed")
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body.decode("utf-8"))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    store = None  # set on the subclass made by make_server
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _reply(self, status: int, obj: Any, content_type: str):
+        body = pack(obj, content_type)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _request(self) -> Tuple[dict, str]:
+        content_type = self.headers.get("Content-Type", JSON)
+        length = int(self.headers.get("Content-Length", 0))
+        return unpack(self.rfile.read(length), content_type), \
+            (MSGPACK if content_type.startswith(MSGPACK) else JSON)
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._reply(404, {"error": "not found"}, JSON)
+        store = self.store
+        self._reply(200, {"ntotal": int(store.index.ntotal), "dim": store.dim,
+                          "generation": store.generation()}, default_content_type())
+
+    def do_POST(self):
+        content_type = JSON
+        try:
+            request, content_type = self._request()
+            if self.path == "/search":
+                response = self._search(request)
+            elif self.path == "/add":
+                response = self._add(request)
+            elif self.path == "/remove":
+                response = {"removed": int(self.store.remove(request["ids"]))}
+            elif self.path == "/remove_conversation":
+                response = {"removed": int(self.store.remove_conversation(request["conversation_id"]))}
+            elif self.path == "/update":
+                response = self._update(request)
+            else:
+                return self._reply(404, {"error": "not found"}, content_type)
+        except Exception as e:
+            logger.exception(f"Shard request {self.path} failed: {e}")
+            return self._reply(500, {"error": str(e)}, content_type)
+        self._reply(200, response, content_type)
+
+    def _search(self, request: dict) -> dict:
+        started = time.perf_counter()
+        fields = tuple(request["fields"]) if request.get("fields") else None
+        hits = self.store.search_many(decode_array(request["queries"]), k=int(request.get("k", 5)), fields=fields,
+                                      nprobe=request.get("nprobe"), ef_search=request.get("ef_search"),
+                                      account_id=request.get("account_id"))
+        return {"hits": hits, "generation": self.store.generation(request.get("account_id")),
+                "seconds": time.perf_counter() - started}
+
+    def _add(self, request: dict) -> dict:
+        ids = self.store.add_many(decode_array(request["vectors"]), request["messages"],
+                                  request.get("conversation_ids"), request.get("account_ids"),
+                                  request.get("timestamps"))
+        return {"ids": [int(faiss_id) for faiss_id in ids]}
+
+    def _update(self, request: dict) -> dict:
+        faiss_id = self.store.update(int(request["faiss_id"]), decode_array(request["vector"])[0],
+                                     request.get("message"))
+        return {"faiss_id": int(faiss_id)}
+
+
+def make_server(store, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """HTTP server bound to host:port (0 = any free port) serving store; call serve_forever()"""
+    handler = type("ShardHandler", (_Handler,), {"store": store})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(store, host: str = "127.0.0.1", port: int = 7701):
+    server = make_server(store, host, port)
+    logger.info(f"Serving shard {store.index_path} on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        store.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Serve one VectorStore shard over HTTP")
+    parser.add_argument("--index-path", default=os.getenv("FAISS_INDEX_PATH", "faiss_index.idx"))
+    parser.add_argument("--dim", type=int, default=int(os.getenv("EMBEDDING_DIM", 768)))
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--mongo-db", default=os.getenv("FAISS_MONGO_DB", "chat_memory"),
+                        help="Database for this node's vector metadata (one per node on a shared Mongo)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7701)
+    args = parser.parse_args()
+
+    from .store import VectorStore
+    store = VectorStore(dim=args.dim, mongo_uri=args.mongo_uri, index_path=args.index_path, mongo_db=args.mongo_db)
+    serve(store, args.host, args.port)
@@ -0,0 +1,257 @@
+"""
+Per-account FAISS shards, opened on demand and memory-mapped.
+
+Each account's vectors live in their own index file under the shard
+directory (``<dir>/<account>.idx`` plus its own WAL), so account-scoped
+searches only touch that account's vectors. Startup loads nothing. A shard is
+opened on first use with FAISS's mmap flags, which lets the OS page vectors in
+lazily. The first write to a mapped shard reloads it as an owned, writable
+copy, because FAISS aborts when a memory-mapped index is resized.
+
+Open shards are kept in an LRU. Once their estimated size passes the memory
+budget ($FAISS_SHARD_MEMORY_MB), the least recently used are checkpointed and
+closed. Shards in use (see ShardManager.use) are never evicted.
+"""
+import glob
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+
+from .index_manager import IndexManager, index_ids, new_flat_index
+from .snapshots import read_index_mapped
+from .wal import OP_ADD, WriteAheadLog
+
+logger = logging.getLogger(__name__)
+
+def shard_name(account_id: str) -> str:
+    """File-system safe shard name for an account id"""
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(account_id))
+
+
+class AccountShard:
+    """One account's index, WAL and write state."""
+
+    def __init__(self, account_id: str, path: str, dim: int, **index_options):
+        self.account_id = account_id
+        self.path = path
+        self.dim = dim
+        self.lock = threading.RLock()
+        self.dirty = False
+        self.pins = 0  # in-flight users, guarded by the ShardManager lock
+
+        if os.path.exists(path):
+            index = read_index_mapped(path)
+            self.mapped = True
+        else:
+            index = new_flat_index(dim)
+            self.mapped = False
+        self.index_manager = IndexManager(dim, index, lock=self.lock, on_swap=self._mark_dirty, **index_options)
+
+        self.wal = WriteAheadLog(path + ".wal", dim)
+        self._recover()
+
+    def _mark_dirty(self):
+        self.dirty = True
+
+    def _recover(self):
+        records = [(faiss_id, vector) for op, faiss_id, vector in self.wal.replay() if op == OP_ADD]
+        if not records:
+            return
+        self.promote()
+        present = set(index_ids(self.index).tolist())
+        records = [(faiss_id, vector) for faiss_id, vector in records if faiss_id not in present]
+        if records:
+            ids = np.array([faiss_id for faiss_id, _ in records], dtype=np.int64)
+            self.index.add_with_ids(np.vstack([vector for _, vector in records]), ids)
+            self.dirty = True
+            logger.info(f"Shard {self.account_id}: replayed {len(records)} WAL records")
+
+    @property
+    def index(self):
+        return self.index_manager.index
+
+    @property
+    def nbytes(self) -> int:
+        """Rough resident size (raw vectors; graph/list overhead ignored)"""
+        return self.index.ntotal * self.dim * 4
+
+    def promote(self):
+        """Swap a memory-mapped (read-only) index for an owned copy before mutating it"""
+        with self.lock:
+            if self.mapped:
+                self.index_manager.replace(faiss.read_index(self.path))
+                self.mapped = False
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray):
+        with self.lock:
+            self.promote()
+            self.index_manager.add(vectors, ids)
+            seq = self.wal.append_many(OP_ADD, ids, vectors)
+            self.dirty = True
+        self.wal.commit(seq)
+
+    def compact(self, dead: np.ndarray) -> np.ndarray:
+        """Physically remove the dead ids this shard holds; returns them"""
+        with self.lock:
+            held = dead[np.isin(dead, index_ids(self.index))]
+            if len(held) == 0:
+                return held
+            self.promote()
+            # In place for flat/IVF; HNSW comes back as a background rebuild to wait for
+            thread = self.index_manager.compact(held)
+            self.dirty = True
+        if thread is not None:
+            thread.join()
+        return held
+
+    def checkpoint(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = faiss.serialize_index(self.index)
+            covered = self.wal.rotate()
+            self.dirty = False
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as fh:
+            fh.write(data.tobytes())
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, self.path)
+        self.wal.drop_through(covered)
+
+    def close(self):
+        self.checkpoint()
+        self.wal.close()
+
+
+class ShardManager:
+    """LRU of open AccountShards bounded by a memory budget."""
+
+    def __init__(self, directory: str, dim: int, memory_budget_mb: Optional[float] = None, **index_options):
+        """
+        Args:
+            directory: Where shard files live (created if missing)
+            dim: Vector dimension
+            memory_budget_mb: Estimated size of open shards before LRU eviction ($FAISS_SHARD_MEMORY_MB, default 1024)
+            index_options: Passed to each shard's IndexManager (ann_kind, ann_threshold, ...)
+        """
+        self.directory = directory
+        self.dim = dim
+        self.memory_budget = int((memory_budget_mb or float(os.getenv("FAISS_SHARD_MEMORY_MB", 1024))) * 1024 * 1024)
+        self.index_options = index_options
+        self._lock = threading.Lock()
+        self._open: "OrderedDict[str, AccountShard]" = OrderedDict()
+        self.loads = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, account_id: str) -> str:
+        return os.path.join(self.directory, shard_name(account_id) + ".idx")
+
+    def exists(self, account_id: str) -> bool:
+        with self._lock:
+            if str(account_id) in self._open:
+                return True
+        path = self._path(account_id)
+        # A shard that crashed before its first checkpoint only has WAL segments
+        return os.path.exists(path) or bool(glob.glob(glob.escape(path) + ".wal.*"))
+
+    @contextmanager
+    def use(self, account_id: str, create: bool = False):
+        """Open (or reuse) the account's shard and pin it for the duration of the block.
+
+        Yields None if the account has no shard and create is False.
+        """
+        account_id = str(account_id)
+        if not create and not self.exists(account_id):
+            yield None
+            return
+
+        with self._lock:
+            shard = self._open.get(account_id)
+            if shard is None:
+                shard = AccountShard(account_id, self._path(account_id), self.dim, **self.index_options)
+                self._open[account_id] = shard
+                self.loads += 1
+            self._open.move_to_end(account_id)
+            shard.pins += 1
+        self._evict()
+
+        try:
+            yield shard
+        finally:
+            with self._lock:
+                shard.pins -= 1
+            # Adds grow a shard while it's pinned, so the budget is checked again on release
+            self._evict()
+
+    def _evict(self):
+        with self._lock:
+            evicted = self._pick_evictions()
+        for victim in evicted:
+            with victim.lock:
+                victim.close()
+
+    def _pick_evictions(self) -> List[AccountShard]:
+        """Least recently used unpinned shards to close so the rest fit the budget"""
+        evicted = []
+        total = sum(shard.nbytes for shard in self._open.values())
+        for account_id, shard in list(self._open.items()):
+            if total <= self.memory_budget:
+                break
+            if shard.pins or shard.index_manager.migrating:
+                continue
+            del self._open[account_id]
+            total -= shard.nbytes
+            evicted.append(shard)
+            self.evictions += 1
+        return evicted
+
+    def resident(self) -> List[AccountShard]:
+        with self._lock:
+            return list(self._open.values())
+
+    def accounts(self) -> List[str]:
+        """Accounts with a shard file on disk or open"""
+        names = {name[:-4] for name in os.listdir(self.directory) if name.endswith(".idx")}
+        with self._lock:
+            return sorted(names | set(self._open))
+
+    def checkpoint(self):
+        for shard in self.resident():
+            shard.checkpoint()
+
+    def compact(self, dead_by_account: Dict[str, np.ndarray]) -> np.ndarray:
+        """Remove dead ids from their accounts' shards; returns the ids actually removed"""
+        removed = [np.zeros(0, dtype=np.int64)]
+        for account_id, ids in dead_by_account.items():
+            with self.use(account_id) as shard:
+                if shard is not None:
+                    removed.append(shard.compact(np.asarray(ids, dtype=np.int64)))
+        return np.concatenate(removed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "open": len(self._open),
+                "resident_bytes": sum(shard.nbytes for shard in self._open.values()),
+                "memory_budget": self.memory_budget,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+    def close(self):
+        with self._lock:
+            shards = list(self._open.values())
+            self._open.clear()
+        for shard in shards:
+            with shard.lock:
+                shard.close()
@@ -0,0 +1,219 @@
+"""
+Exact float32 copies of the vectors kept next to a compressed (IVF-PQ) index.
+
+PQ codes make the resident index ~50x smaller but their distances are
+approximate, so the top candidates are re-scored against the original vectors.
+Those live on disk and are only paged in for the rows actually touched:
+
+* ``<path>.f32`` - memory-mapped float32 slab, one row per vector
+* ``<path>.ids`` - int64 faiss_id per slab row, -1 once the id is removed
+
+Removed rows stay in the slab until compact() rewrites both files with only
+the live rows. With no path the sidecar is memory-only (used by the recall tool).
+"""
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+REMOVED = -1  # id file entry of a removed row
+
+
+class VectorSidecar:
+    """faiss_id -> exact float32 vector, backed by a memory-mapped slab."""
+
+    def __init__(self, path: Optional[str], dim: int, initial_capacity: int = 1024):
+        self.dim = dim
+        self.slab_path = path + ".f32" if path else None
+        self.ids_path = path + ".ids" if path else None
+
+        self._lock = threading.RLock()
+        self._rows: Dict[int, int] = {}
+        self._count = 0
+        self._ids_fh = None
+
+        if path:
+            self._open(initial_capacity)
+        else:
+            self._capacity = max(initial_capacity, 1)
+            self._slab = np.zeros((self._capacity, dim), dtype=np.float32)
+
+    def _open(self, initial_capacity: int):
+        directory = os.path.dirname(self.slab_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._finish_compaction()
+        row_bytes = self.dim * 4
+        slab_rows = os.path.getsize(self.slab_path) // row_bytes if os.path.exists(self.slab_path) else 0
+        capacity = max(slab_rows, initial_capacity, 1)
+        if slab_rows < capacity:
+            with open(self.slab_path, "ab") as fh:
+                fh.truncate(capacity * row_bytes)
+        self._capacity = capacity
+        self._slab = np.memmap(self.slab_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+        # Ids are written after their row, so a torn tail only loses unreferenced rows
+        ids = np.zeros(0, dtype=np.int64)
+        if os.path.exists(self.ids_path):
+            ids = np.fromfile(self.ids_path, dtype=np.uint8)
+            count = min(len(ids) // 8, capacity)
+            if count * 8 != len(ids):
+                logger.warning(f"Vector sidecar id file has a torn tail, keeping {count} rows")
+                with open(self.ids_path, "r+b") as fh:
+                    fh.truncate(count * 8)
+            ids = ids[:count * 8].view(np.int64)
+        self._rows = {int(faiss_id): row for row, faiss_id in enumerate(ids.tolist()) if faiss_id != REMOVED}
+        self._count = len(ids)
+        open(self.ids_path, "ab").close()
+        # Not append mode: removals overwrite their row's id in place
+        self._ids_fh = open(self.ids_path, "r+b")
+        logger.info(f"Vector sidecar opened with {self._count} vectors ({self.slab_path})")
+
+    def _finish_compaction(self):
+        """Complete or discard a compaction interrupted by a crash (see compact)"""
+        slab_tmp, ids_tmp = self.slab_path + ".tmp", self.ids_path + ".tmp"
+        if os.path.exists(slab_tmp):
+            # The new slab never replaced the old one, so the old pair is intact
+            for path in (slab_tmp, ids_tmp):
+                if os.path.exists(path):
+                    os.remove(path)
+        elif os.path.exists(ids_tmp):
+            # The new slab is in place; its (complete) id file must follow
+            os.replace(ids_tmp, self.ids_path)
+
+    def _grow(self, needed: int):
+        """Double the slab until it holds `needed` rows"""
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        if self.slab_path is None:
+            slab = np.zeros((capacity, self.dim), dtype=np.float32)
+            slab[:self._count] = self._slab[:self._count]
+            self._slab = slab
+        else:
+            self._slab.flush()
+            del self._slab
+            with open(self.slab_path, "r+b") as fh:
+                fh.truncate(capacity * self.dim * 4)
+            self._slab = np.memmap(self.slab_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._capacity = capacity
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, faiss_id) -> bool:
+        return int(faiss_id) in self._rows
+
+    def add(self, ids, vectors):
+        """Store vectors for ids that aren't present yet"""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim)
+        with self._lock:
+            new = [i for i, faiss_id in enumerate(ids.tolist()) if faiss_id not in self._rows]
+            if not new:
+                return
+            if self._count + len(new) > self._capacity:
+                self._grow(self._count + len(new))
+            rows = np.arange(self._count, self._count + len(new))
+            self._slab[rows] = vectors[new]
+            if self._ids_fh is not None:
+                self._ids_fh.seek(self._count * 8)
+                self._ids_fh.write(ids[new].tobytes())
+                self._ids_fh.flush()
+            for row, faiss_id in zip(rows.tolist(), ids[new].tolist()):
+                self._rows[faiss_id] = row
+            self._count += len(new)
+
+    def remove(self, ids):
+        """Forget ids; their rows are marked removed in the id file and reclaimed by compact()"""
+        with self._lock:
+            rows = [self._rows.pop(int(faiss_id), None) for faiss_id in np.atleast_1d(ids).tolist()]
+            if self._ids_fh is None:
+                return
+            marker = np.int64(REMOVED).tobytes()
+            for row in sorted(row for row in rows if row is not None):
+                self._ids_fh.seek(row * 8)
+                self._ids_fh.write(marker)
+            self._ids_fh.flush()
+
+    def compact(self) -> int:
+        """Rewrite the slab with only the live rows (in insertion order); returns the rows reclaimed.
+
+        The new slab and id file are written and fsynced next to the old ones
+        and then renamed over them, slab first. A crash before the slab rename
+        keeps the old pair; one after it is finished on the next open.
+        """
+        with self._lock:
+            dropped = self._count - len(self._rows)
+            if dropped == 0:
+                return 0
+            ids, vectors = self.vectors()
+            capacity = max(len(ids), 1)
+            slab = np.zeros((capacity, self.dim), dtype=np.float32)
+            slab[:len(ids)] = vectors
+            if self.slab_path is None:
+                self._slab = slab
+            else:
+                slab_tmp, ids_tmp = self.slab_path + ".tmp", self.ids_path + ".tmp"
+                for path, data in ((slab_tmp, slab), (ids_tmp, ids)):
+                    with open(path, "wb") as fh:
+                        fh.write(data.tobytes())
+                        fh.flush()
+                        os.fsync(fh.fileno())
+                self._ids_fh.close()
+                del self._slab
+                os.replace(slab_tmp, self.slab_path)
+                os.replace(ids_tmp, self.ids_path)
+                self._slab = np.memmap(self.slab_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+                self._ids_fh = open(self.ids_path, "r+b")
+            self._capacity = capacity
+            self._rows = {faiss_id: row for row, faiss_id in enumerate(ids.tolist())}
+            self._count = len(ids)
+        logger.info(f"Vector sidecar compacted, {dropped} removed rows reclaimed")
+        return dropped
+
+    def rows(self, ids) -> np.ndarray:
+        """Slab row per id (same shape as ids), -1 where unknown"""
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            rows = np.fromiter((self._rows.get(i, -1) for i in ids.ravel().tolist()),
+                               dtype=np.int64, count=ids.size)
+        return rows.reshape(ids.shape)
+
+    def get(self, ids, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Exact vectors for ids (zeros where unknown); pass rows from rows() to skip the lookup"""
+        if rows is None:
+            rows = self.rows(ids)
+        with self._lock:
+            vectors = self._slab[np.maximum(rows, 0)]
+        vectors[rows < 0] = 0.0
+        return vectors
+
+    def vectors(self):
+        """(ids, vectors) for everything stored, in insertion order"""
+        with self._lock:
+            ids = np.fromiter(self._rows.keys(), dtype=np.int64, count=len(self._rows))
+            rows = np.fromiter(self._rows.values(), dtype=np.int64, count=len(self._rows))
+            order = np.argsort(rows)
+            return ids[order], np.array(self._slab[rows[order]])
+
+    def flush(self):
+        """Force the slab and id file to disk"""
+        with self._lock:
+            if self._ids_fh is None:
+                return
+            self._slab.flush()
+            self._ids_fh.flush()
+            os.fsync(self._ids_fh.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._ids_fh is None or self._ids_fh.closed:
+                return
+            self.flush()
+            self._ids_fh.close()
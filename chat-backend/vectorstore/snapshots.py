@@ -0,0 +1,224 @@
+"""
+Atomic, versioned FAISS index snapshots.
+
+Every checkpoint writes a new file, ``<index>.v<N>``: write to a temp file,
+fsync, rename, then fsync the directory. The snapshot is then hard-linked
+over ``<index>`` for tools that expect the plain path. An existing snapshot
+file is never modified, so a crash mid-write leaves only a stray ``.tmp``.
+It also means a memory-mapped snapshot can stay in use after newer ones land.
+
+``<index>.manifest.json`` (replaced atomically as well) lists the retained
+versions with their vector count, dimension, size and sha256. Startup opens
+the newest version whose size matches. Set $FAISS_SNAPSHOT_VERIFY to also
+check the checksum, which costs a full read. The newest $FAISS_SNAPSHOT_KEEP
+versions are retained, plus any pinned version (the one the store has mapped
+and will re-read when it promotes to a writable copy). Version files left
+outside the manifest by a crash are removed at startup.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+import faiss
+
+logger = logging.getLogger(__name__)
+
+# Map the file instead of reading it: startup costs page-table setup, not a full read.
+# IO_FLAG_MMAP_IFC maps the vector storage of flat/HNSW indexes (and IVF lists);
+# IO_FLAG_MMAP alone only maps IVF inverted lists and reads everything else, and
+# the two combined reject IVF. Readers try them in this order.
+MMAP_FLAG_CHOICES = (
+    faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY,
+    faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY,
+)
+
+
+def read_index_mapped(path: str):
+    """faiss.read_index with the vector data memory-mapped where the index type allows it"""
+    error = None
+    for flags in MMAP_FLAG_CHOICES:
+        try:
+            return faiss.read_index(path, flags)
+        except RuntimeError as e:
+            error = e
+    logger.warning(f"Could not memory-map {path} ({error}); reading it fully")
+    return faiss.read_index(path)
+
+
+def fsync_dir(path: str):
+    """Make a rename in this directory durable"""
+    try:
+        fd = os.open(path or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class SnapshotManager:
+    """Writes, lists and opens the versioned snapshots of one index path."""
+
+    def __init__(self, index_path: str, keep: Optional[int] = None, verify: Optional[bool] = None):
+        """
+        Args:
+            index_path: Base path; versions are <index_path>.v<N>
+            keep: Versions retained ($FAISS_SNAPSHOT_KEEP, default 3)
+            verify: Check sha256 when opening ($FAISS_SNAPSHOT_VERIFY, default false)
+        """
+        self.index_path = index_path
+        self.directory = os.path.dirname(os.path.abspath(index_path))
+        self.manifest_path = index_path + ".manifest.json"
+        self.keep = max(1, keep or int(os.getenv("FAISS_SNAPSHOT_KEEP", 3)))
+        self.verify = verify if verify is not None else \
+            os.getenv("FAISS_SNAPSHOT_VERIFY", "false").lower() in ("true", "1", "t")
+        self.versions: List[dict] = []
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as fh:
+                self.versions = json.load(fh).get("versions", [])
+        self._lock = threading.Lock()
+        self._pins: Dict[str, int] = {}  # file -> users
+        self._remove_strays()
+
+    def _remove_strays(self):
+        """Delete version files the manifest doesn't list (retired while pinned, or a torn write)"""
+        if not self.versions:
+            return  # no manifest yet: a first write will replace its own leftovers
+        listed = {entry["file"] for entry in self.versions}
+        pattern = re.compile(re.escape(os.path.basename(self.index_path)) + r"\.v\d+(\.tmp)?$")
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if pattern.match(name) and name not in listed:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def pin(self, entry: dict):
+        """Keep a version's file on disk while it's in use, even after it's retired"""
+        with self._lock:
+            self._pins[entry["file"]] = self._pins.get(entry["file"], 0) + 1
+
+    def unpin(self, entry: dict):
+        with self._lock:
+            users = self._pins.get(entry["file"], 0) - 1
+            if users > 0:
+                self._pins[entry["file"]] = users
+                return
+            self._pins.pop(entry["file"], None)
+            retired = all(kept["file"] != entry["file"] for kept in self.versions)
+        if retired:
+            self._remove(entry)
+
+    def _remove(self, entry: dict):
+        try:
+            os.remove(os.path.join(self.directory, entry["file"]))
+        except FileNotFoundError:
+            pass
+
+    def _path(self, version: int) -> str:
+        return f"{self.index_path}.v{version}"
+
+    @property
+    def latest(self) -> Optional[dict]:
+        return self.versions[-1] if self.versions else None
+
+    def write(self, data, ntotal: int, dim: int) -> dict:
+        """Durably write serialized index bytes as the next version and retire old ones"""
+        version = (self.latest["version"] + 1) if self.versions else 1
+        path = self._path(version)
+        payload = memoryview(data).cast("B")
+        entry = {
+            "version": version,
+            "file": os.path.basename(path),
+            "ntotal": int(ntotal),
+            "dim": int(dim),
+            "bytes": len(payload),
+            "sha256": hashlib.sha256(payload).hexdigest(),
+            "created_at": time.time(),
+        }
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as fh:
+            fh.write(payload)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, path)
+
+        # Plain path for tools/older code: a hard link, so no second copy is written
+        link_tmp = self.index_path + ".tmp"
+        try:
+            if os.path.exists(link_tmp):
+                os.remove(link_tmp)
+            os.link(path, link_tmp)
+            os.replace(link_tmp, self.index_path)
+        except OSError as e:
+            logger.warning(f"Could not link {self.index_path} to snapshot v{version}: {e}")
+        fsync_dir(self.directory)
+
+        with self._lock:
+            self.versions.append(entry)
+            retired, self.versions = self.versions[:-self.keep], self.versions[-self.keep:]
+            self._write_manifest()
+            # A pinned file goes when its last user unpins it (or at the next startup)
+            retired = [old for old in retired if old["file"] not in self._pins]
+        for old in retired:
+            self._remove(old)
+        return entry
+
+    def _write_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as fh:
+            json.dump({"versions": self.versions}, fh, indent=1)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, self.manifest_path)
+        fsync_dir(self.directory)
+
+    def valid(self, entry: dict, verify: Optional[bool] = None) -> bool:
+        path = os.path.join(self.directory, entry["file"])
+        if not os.path.exists(path) or os.path.getsize(path) != entry["bytes"]:
+            return False
+        if self.verify if verify is None else verify:
+            return _sha256_file(path) == entry["sha256"]
+        return True
+
+    def open(self, mmap: bool = True):
+        """(index, entry) for the newest valid snapshot, or (None, None).
+
+        Falls back to older versions when the newest is missing or damaged;
+        vectors added after the version that loads are lost from the index
+        (the consistency check re-adds them from Mongo).
+        """
+        for entry in reversed(self.versions):
+            if not self.valid(entry):
+                logger.error(f"Snapshot v{entry['version']} ({entry['file']}) failed validation; trying older")
+                continue
+            path = os.path.join(self.directory, entry["file"])
+            try:
+                return (read_index_mapped(path) if mmap else faiss.read_index(path)), entry
+            except RuntimeError as e:
+                logger.error(f"Snapshot v{entry['version']} unreadable ({e}); trying older")
+        return None, None
+
+    def path_of(self, entry: dict) -> str:
+        return os.path.join(self.directory, entry["file"])
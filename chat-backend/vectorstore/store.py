@@ -0,0 +1,705 @@
+# vectorstore/store.py
+import os
+import asyncio
+import functools
+import threading
+import time
+import faiss
+import numpy as np
+import uuid
+from pymongo import MongoClient
+import json
+from concurrent.futures import ThreadPoolExecutor
+from .wal import WriteAheadLog, OP_ADD, OP_REMOVE
+from .conversations import ConversationIdMap
+from .index_manager import (
+    IndexManager, IVFPQ, FLAT, and_selectors, index_ids, index_vectors, merge_topk, new_flat_index
+)
+from .sidecar import VectorSidecar
+from .metadata import MetadataTable, TABLE_FIELDS, LEGACY_ID_FLOOR
+from .tombstones import Tombstones
+from .shards import ShardManager
+from .consistency import ConsistencyChecker
+from .snapshots import SnapshotManager, read_index_mapped
+
+# Metadata fields returned with search hits (the stored embedding is deliberately left out)
+HYDRATE_FIELDS = ("faiss_id", "message", "conversation_id")
+
+class VectorStore:
+    def __init__(self, dim, mongo_uri="mongodb://localhost:27017", index_path="faiss_index.idx",
+                 checkpoint_interval=None, checkpoint_records=None, brute_force_max=None,
+                 storage=None, compact_threshold=None, shard_dir=None, mongo_db=None):
+        self.dim = dim
+        self.index_path = index_path
+        # "flat" keeps float32 vectors in the index; "pq" compresses them to IVF-PQ codes
+        # and re-scores the top candidates from a memory-mapped float32 sidecar
+        self.storage = (storage or os.getenv("FAISS_STORAGE", "flat")).lower()
+        # Full index checkpoints happen in the background; adds only touch the WAL
+        self.checkpoint_interval = checkpoint_interval or float(os.getenv("FAISS_CHECKPOINT_INTERVAL", 60))
+        self.checkpoint_records = checkpoint_records or int(os.getenv("FAISS_CHECKPOINT_RECORDS", 10000))
+        # Conversations up to this size are searched by brute force on a cached matrix
+        self.brute_force_max = brute_force_max or int(os.getenv("FAISS_BRUTE_FORCE_MAX", 1024))
+        # Dead fraction of the index that triggers a background compaction
+        self.compact_threshold = compact_threshold or float(os.getenv("FAISS_COMPACT_THRESHOLD", 0.2))
+
+        # Setup MongoDB (shard servers sharing one Mongo each get their own database,
+        # since every node allocates faiss_ids from 0)
+        self.client = MongoClient(mongo_uri)
+        self.db = self.client[mongo_db or os.getenv("FAISS_MONGO_DB", "chat_memory")]
+        self.collection = self.db["vectors"]
+        # Hydration looks hits up by faiss_id with $in
+        self.collection.create_index("faiss_id")
+
+        # conversation_id -> faiss_ids, so scoped search never goes back to Mongo per query
+        self.conversations = ConversationIdMap()
+        self.conversations.load(self.collection.find({}, {"faiss_id": 1, "conversation_id": 1}))
+
+        # Guards index mutation/search; checkpoints are serialized separately
+        self._lock = threading.RLock()
+        self._checkpoint_lock = threading.Lock()
+        # The a* coroutines run FAISS/Mongo work here; bounded so a burst of
+        # requests queues instead of oversubscribing FAISS's own threads
+        self._executor = ThreadPoolExecutor(max_workers=int(os.getenv("FAISS_EXECUTOR_WORKERS", 4)),
+                                            thread_name_prefix="faiss")
+
+        # Setup FAISS index (with ID support): the newest snapshot, memory-mapped so a
+        # large index serves searches right away; it's swapped for an owned copy
+        # before the first write ($FAISS_MMAP=false reads it fully instead)
+        self.snapshots = SnapshotManager(index_path)
+        self._promote_lock = threading.Lock()
+        self._mapped_path = None
+        self._mapped_snapshot = None  # pinned so pruning can't delete it before _promote re-reads it
+        mmap = os.getenv("FAISS_MMAP", "true").lower() in ("true", "1", "t")
+        index, snapshot = self.snapshots.open(mmap=mmap)
+        if index is not None:
+            print(f"[FAISS] Opened snapshot v{snapshot['version']} ({snapshot['ntotal']} vectors)")
+            if mmap:
+                self._mapped_path = self.snapshots.path_of(snapshot)
+                self._mapped_snapshot = snapshot
+                self.snapshots.pin(snapshot)
+        elif os.path.exists(index_path):
+            # (The first checkpoint links a snapshot over this path; its contents are
+            # the same mapped index, so _promote can still re-read it)
+            print("[FAISS] Loading existing index...")
+            index = read_index_mapped(index_path) if mmap else faiss.read_index(index_path)
+            self._mapped_path = index_path if mmap else None
+        else:
+            print("[FAISS] Creating new index...")
+            index = new_flat_index(dim)
+        # Starts flat and migrates to IVF/HNSW (or IVF-PQ) in the background as the corpus grows
+        self.sidecar = VectorSidecar(index_path + ".vectors", dim) if self.storage == "pq" else None
+        self.index_manager = IndexManager(dim, index, lock=self._lock, on_swap=self._swapped,
+                                          ann_kind=IVFPQ if self.sidecar is not None else None, sidecar=self.sidecar)
+        if self.sidecar is not None and self.index_manager.kind == FLAT and len(self.sidecar) < index.ntotal:
+            # Switching an existing flat store to pq: keep the exact vectors before they're compressed away
+            self.sidecar.add(*index_vectors(index))
+
+        # Sequential ids + id-indexed metadata, so hydration and filtering skip Mongo
+        self.metadata = MetadataTable(index_path + ".meta")
+
+        # Removed ids stay in the index (hidden from searches) until compaction
+        self.tombstones = Tombstones(index_path + ".tombstones")
+        self._compactor = None
+
+        # Bumped on every add/remove (globally and per account) so result caches can tell
+        # whether what they hold is still current
+        self._generation = 0
+        self._account_generations = {}
+        self._wide_generation = 0  # changes that may touch any account (e.g. removing legacy ids)
+
+        # Replay whatever was logged after the last checkpoint
+        self.wal = WriteAheadLog(index_path + ".wal", dim)
+        self._recover()
+        self._backfill_metadata()
+
+        # Per-account shards: vectors with an account_id go to <shard_dir>/<account>.idx,
+        # opened (memory-mapped) on first use; the main index keeps everything else
+        shard_dir = shard_dir if shard_dir is not None else os.getenv("FAISS_SHARD_DIR", "")
+        self.shards = ShardManager(shard_dir, dim) if shard_dir else None
+        # Accounts that still have vectors in the main index (added before sharding)
+        self._unsharded_accounts = set()
+        if self.shards is not None:
+            self._unsharded_accounts = set(self.metadata.account_of(index_ids(self.index))) - {None}
+
+        self._stop = threading.Event()
+        self._checkpoint_due = threading.Event()
+        self._checkpointer = threading.Thread(target=self._checkpoint_loop, name="faiss-checkpoint", daemon=True)
+        self._checkpointer.start()
+
+        # Sync MongoDB IDs to match FAISS, off the startup path
+        # ($FAISS_CONSISTENCY: "report" (default), "repair" or "off")
+        self.consistency = ConsistencyChecker(self)
+        mode = os.getenv("FAISS_CONSISTENCY", "report").lower()
+        self._consistency_thread = None
+        if mode != "off":
+            self._consistency_thread = threading.Thread(target=self._run_consistency_check, args=(mode == "repair",),
+                                                        name="faiss-consistency", daemon=True)
+            self._consistency_thread.start()
+
+    def _recover(self):
+        """Apply the WAL tail to the loaded index (idempotent: ids already present are skipped)"""
+        index = self.index_manager.index
+        present = set(index_ids(index).tolist())
+        replayed = 0
+        for op, faiss_id, vector in self.wal.replay():
+            if op == OP_ADD and faiss_id not in present:
+                if self._mapped_path is not None:
+                    self._promote()
+                    index = self.index_manager.index
+                index.add_with_ids(vector.reshape(1, -1), np.array([faiss_id], dtype=np.int64))
+                present.add(faiss_id)
+            elif op == OP_REMOVE and faiss_id in present:
+                self.tombstones.add([faiss_id])
+            if op == OP_ADD and self.sidecar is not None:
+                # The sidecar is only fsynced at checkpoints, so it may trail the log too
+                self.sidecar.add([faiss_id], vector)
+            replayed += 1
+        if replayed:
+            print(f"[FAISS] Replayed {replayed} WAL records")
+        self.metadata.allocator.observe(index_ids(index))
+        self.metadata.allocator.observe(self.tombstones.ids())
+        self._dirty = replayed > 0
+        self.index_manager.maybe_migrate()
+
+    def _backfill_metadata(self):
+        """Fill table rows lost in a crash (written after the last checkpoint) from Mongo"""
+        ids = index_ids(self.index)
+        ids = ids[(ids < LEGACY_ID_FLOOR) & ~self.metadata.has(ids) & ~self.tombstones.contains(ids)]
+        if len(ids) == 0:
+            return
+        docs = list(self.collection.find({"faiss_id": {"$in": ids.tolist()}},
+                                         {field: 1 for field in TABLE_FIELDS}))
+        if not docs:
+            return
+        self.metadata.set(
+            [doc["faiss_id"] for doc in docs],
+            [doc.get("message") for doc in docs],
+            [doc.get("conversation_id") for doc in docs],
+            [doc.get("account_id") for doc in docs],
+            [doc.get("timestamp") for doc in docs],
+        )
+        print(f"[FAISS] Restored metadata for {len(docs)} vectors from MongoDB")
+
+    @property
+    def index(self):
+        """The live FAISS index (may be swapped by a migration; don't hold on to it)"""
+        return self.index_manager.index
+
+    def _swapped(self):
+        # A rebuilt index is owned memory, not the mapped snapshot
+        self._dirty = True
+        self._unmapped()
+
+    def _unmapped(self):
+        self._mapped_path = None
+        if self._mapped_snapshot is not None:
+            self.snapshots.unpin(self._mapped_snapshot)
+            self._mapped_snapshot = None
+
+    def _promote(self):
+        """Replace the memory-mapped snapshot with an owned, writable copy (FAISS aborts on
+        resizing a mapped index). The read happens outside the store lock, so searches
+        keep using the mapping meanwhile; snapshot files are never rewritten, so the
+        copy matches what's mapped."""
+        if self._mapped_path is None:
+            return
+        with self._promote_lock:
+            path = self._mapped_path
+            if path is None:
+                return
+            index = faiss.read_index(path)
+            with self._lock:
+                if self._mapped_path is not None:
+                    self.index_manager.replace(index, keep_migration=True)
+                    self._unmapped()
+
+    def _run_consistency_check(self, repair):
+        try:
+            report = self.check_consistency(repair=repair)
+        except Exception as e:
+            print(f"[FAISS] Consistency check failed: {e}")
+            return
+        if report["missing"] or report["orphaned"]:
+            print(f"[FAISS] Consistency: {report['missing']} missing, {report['orphaned']} orphaned "
+                  f"(re-added {report['readded']}, re-embedded {report['reembedded']}, removed {report['removed']})")
+
+    def check_consistency(self, repair=True):
+        """Diff the indexed ids with MongoDB's and (if repair) re-add missing / remove orphaned vectors"""
+        return self.consistency.check(repair=repair)
+
+    def add(self, vector: np.ndarray, message: str, conversation_id: str = None,
+            account_id: str = None, timestamp: float = None):
+        # Sequential ids double as row numbers in the metadata table
+        faiss_id = self.metadata.allocator.allocate(1)[0]
+        timestamp = timestamp or time.time()
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+
+        # Add vector to FAISS and log it; the full index is only written at checkpoints
+        self._index_add(vector, np.array([faiss_id]), account_id)
+
+        # Save metadata to MongoDB
+        conversation_id = conversation_id or str(uuid.uuid4())
+        self.collection.insert_one({
+            "faiss_id": int(faiss_id),
+            "message": message,
+            "conversation_id": conversation_id,
+            "account_id": account_id,
+            "timestamp": timestamp
+        })
+        self.conversations.add(conversation_id, faiss_id, vector)
+        self.metadata.set([faiss_id], [message], [conversation_id], [account_id], [timestamp])
+        # Only once the vector is searchable and hydratable (see _bump_generation)
+        self._bump_generation([account_id])
+
+        return int(faiss_id)
+
+    def add_many(self, vectors, messages, conversation_ids=None, account_ids=None, timestamps=None):
+        """Bulk add: one FAISS add_with_ids, one WAL group commit and one Mongo insert_many"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        n = len(vectors)
+        if n == 0:
+            return []
+        if len(messages) != n:
+            raise ValueError("add_many needs one message per vector")
+        conversation_ids = [cid or str(uuid.uuid4()) for cid in (conversation_ids or [None] * n)]
+        account_ids = list(account_ids or [None] * n)
+        now = time.time()
+        timestamps = [ts or now for ts in (timestamps or [None] * n)]
+
+        faiss_ids = self.metadata.allocator.allocate(n)
+
+        if self.shards is None:
+            self._index_add(vectors, faiss_ids)
+        else:
+            accounts = np.array([str(a) if a is not None else "" for a in account_ids])
+            for account_id in np.unique(accounts).tolist():
+                rows = accounts == account_id
+                self._index_add(vectors[rows], faiss_ids[rows], account_id or None)
+
+        self.collection.insert_many([
+            {
+                "faiss_id": int(faiss_id),
+                "message": message,
+                "conversation_id": conversation_id,
+                "account_id": account_id,
+                "timestamp": timestamp
+            }
+            for faiss_id, message, conversation_id, account_id, timestamp
+            in zip(faiss_ids, messages, conversation_ids, account_ids, timestamps)
+        ])
+        for i, (faiss_id, conversation_id) in enumerate(zip(faiss_ids, conversation_ids)):
+            self.conversations.add(conversation_id, faiss_id, vectors[i])
+        self.metadata.set(faiss_ids, messages, conversation_ids, account_ids, timestamps)
+        self._bump_generation(set(account_ids))
+
+        return [int(faiss_id) for faiss_id in faiss_ids]
+
+    def generation(self, account_id=None):
+        """Change counter for the whole store, or for one account's vectors"""
+        if account_id is None:
+            return self._generation
+        return self._account_generations.get(str(account_id), 0) + self._wide_generation
+
+    def _bump_generation(self, account_ids=(), wide=False):
+        """Called after a write is fully visible (index, metadata, Mongo). A cache that reads
+        the generation, computes, and sees the same generation afterwards then knows its
+        result didn't straddle a write."""
+        with self._lock:
+            self._generation += 1
+            if wide:
+                self._wide_generation += 1
+            for account_id in account_ids:
+                if account_id is not None:
+                    account_id = str(account_id)
+                    self._account_generations[account_id] = self._account_generations.get(account_id, 0) + 1
+
+    def _index_add(self, vectors, faiss_ids, account_id=None):
+        """Add to the account's shard (sharded stores) or the main index, logged and committed
+        (callers bump the generation once the metadata is written too)"""
+        if self.shards is not None and account_id is not None:
+            with self.shards.use(account_id, create=True) as shard:
+                shard.add(vectors, faiss_ids)
+            return
+
+        self._promote()
+        with self._lock:
+            self.index_manager.add(vectors, faiss_ids)
+            seq = self.wal.append_many(OP_ADD, faiss_ids, vectors)
+            self._dirty = True
+        self.wal.commit(seq)
+        self._maybe_checkpoint()
+
+    def add_texts(self, messages, conversation_ids=None, account_ids=None, timestamps=None):
+        """Bulk import: embed messages (multi-process for large batches) then add_many"""
+        from embeddings import get_embeddings
+        return self.add_many(get_embeddings(list(messages), bulk=True), messages, conversation_ids,
+                             account_ids, timestamps)
+
+    def _hydrate_many(self, ids, distances, fields=None):
+        """Attach metadata to FAISS hits for every query row.
+
+        Fields the metadata table holds are read from its arrays; anything else
+        (or legacy random ids) costs a single `$in` round trip for all rows.
+        Returns one list per row, ordered by score as FAISS returned them.
+        """
+        ids = np.asarray(ids)
+        wanted = np.unique(ids[ids != -1])
+        if len(wanted) == 0:
+            return [[] for _ in range(len(ids))]
+
+        fields = fields or HYDRATE_FIELDS
+        docs = {}
+        if all(field in TABLE_FIELDS for field in fields):
+            docs = self.metadata.rows(wanted, fields)
+            wanted = wanted[~np.isin(wanted, np.fromiter(docs.keys(), dtype=np.int64, count=len(docs)))]
+
+        if len(wanted):
+            projection = {field: 1 for field in fields}
+            projection["faiss_id"] = 1  # needed to match docs back to hits
+            projection["_id"] = 0
+            for doc in self.collection.find({"faiss_id": {"$in": wanted.tolist()}}, projection):
+                docs[doc["faiss_id"]] = doc
+
+        results = []
+        for row_ids, row_scores in zip(ids, distances):
+            row = []
+            for idx, score in zip(row_ids.tolist(), row_scores.tolist()):
+                doc = docs.get(idx) if idx != -1 else None
+                if doc:
+                    # Copy so a doc shared by several query rows keeps its own score
+                    row.append({**doc, "score": float(score)})
+            row.sort(key=lambda d: d["score"], reverse=True)
+            results.append(row)
+        return results
+
+    def search(self, query_vector: np.ndarray, k=5, fields=None, nprobe=None, ef_search=None, account_id=None):
+        # Run FAISS similarity search
+        return self.search_many(np.array([query_vector], dtype=np.float32), k, fields, nprobe, ef_search,
+                                account_id)[0]
+
+    def search_many(self, query_matrix, k=5, fields=None, nprobe=None, ef_search=None, account_id=None):
+        """Batched search: one FAISS call for all queries, returns one result list per query row.
+
+        nprobe (IVF) / ef_search (HNSW) override the recall/latency trade-off for this call.
+        account_id restricts hits to that account with a bitmap built from the metadata
+        table (vectors added before sequential ids aren't covered by it).
+        """
+        query_matrix = np.asarray(query_matrix, dtype=np.float32).reshape(-1, self.dim)
+        if len(query_matrix) == 0:
+            return []
+        if account_id is not None and self.shards is not None:
+            distances, ids = self._search_account(query_matrix, k, nprobe, ef_search, str(account_id))
+            return self._hydrate_many(ids, distances, fields)
+
+        account_sel = None
+        if account_id is not None:
+            account_sel = self.metadata.selector(account_id=account_id)
+            if account_sel is None:
+                return [[] for _ in range(len(query_matrix))]
+        sel = and_selectors(self.tombstones.selector(), account_sel)
+        distances, ids = self.index_manager.search(query_matrix, k, nprobe, ef_search, sel=sel)
+
+        return self._hydrate_many(ids, distances, fields)
+
+    def _search_account(self, query_matrix, k, nprobe=None, ef_search=None, account_id=None, sel=None):
+        """Search the account's shard, plus the main index if it still holds some of the account's vectors"""
+        dead = self.tombstones.selector()
+        results = []
+        with self.shards.use(account_id) as shard:
+            if shard is not None:
+                results.append(shard.index_manager.search(query_matrix, k, nprobe, ef_search,
+                                                          sel=and_selectors(dead, sel)))
+        if account_id in self._unsharded_accounts:
+            account_sel = self.metadata.selector(account_id=account_id)
+            if account_sel is not None:
+                results.append(self.index_manager.search(query_matrix, k, nprobe, ef_search,
+                                                         sel=and_selectors(dead, account_sel, sel)))
+        if not results:
+            empty = np.full((len(query_matrix), k), -1, dtype=np.int64)
+            return np.full((len(query_matrix), k), -np.inf, dtype=np.float32), empty
+        return merge_topk(results, k)
+
+    def remove(self, ids):
+        """Delete vectors and their metadata.
+
+        The ids are tombstoned (hidden from searches) immediately and dropped
+        from the index by a background compaction once enough are dead.
+        Returns the number of ids newly removed.
+        """
+        ids = np.unique(np.asarray(ids, dtype=np.int64).reshape(-1))
+        with self._lock:
+            # A tombstone on an id not handed out yet would hide the vector later given that id
+            ids = ids[self.metadata.allocator.issued(ids) & ~self.tombstones.contains(ids)]
+            if len(ids) == 0:
+                return 0
+            self.tombstones.add(ids)
+            accounts = set(self.metadata.account_of(ids))
+            seq = self.wal.append_many(OP_REMOVE, ids)
+            self._dirty = True
+        self.wal.commit(seq)
+        self._maybe_checkpoint()
+
+        docs = list(self.collection.find({"faiss_id": {"$in": ids.tolist()}}, {"faiss_id": 1, "conversation_id": 1}))
+        self.collection.delete_many({"faiss_id": {"$in": ids.tolist()}})
+        by_conversation = {}
+        for doc in docs:
+            by_conversation.setdefault(doc.get("conversation_id"), []).append(doc["faiss_id"])
+        for conversation_id, faiss_ids in by_conversation.items():
+            self.conversations.remove(conversation_id, faiss_ids)
+        self.metadata.remove(ids)
+        # Legacy ids have no account in the table, so every account's results may change
+        self._bump_generation(accounts, wide=None in accounts)
+
+        self._maybe_compact()
+        return len(ids)
+
+    def remove_conversation(self, conversation_id):
+        """Delete every vector stored for a conversation"""
+        return self.remove(self.conversations.ids(conversation_id))
+
+    def update(self, faiss_id, vector, message=None):
+        """Replace the vector (and optionally the text) stored for faiss_id.
+
+        ANN indexes can't overwrite an entry in place, so the new vector gets a
+        fresh id, keeping the old conversation/account/timestamp, and the old id
+        is removed. Returns the new faiss_id.
+        """
+        doc = self.collection.find_one({"faiss_id": int(faiss_id)}, {"_id": 0, "embedding": 0})
+        if doc is None:
+            raise KeyError(f"faiss_id {faiss_id} not found")
+        new_id = self.add(vector, doc.get("message") if message is None else message,
+                          doc.get("conversation_id"), doc.get("account_id"), doc.get("timestamp"))
+        self.remove([faiss_id])
+        return new_id
+
+    def _maybe_compact(self):
+        """Start a background compaction once the dead fraction passes compact_threshold"""
+        dead = len(self.tombstones)
+        # Shards aren't all open, so a sharded store sizes itself from the metadata table
+        total = self.index.ntotal if self.shards is None else len(self.metadata) + dead
+        if not dead or not total or dead / total < self.compact_threshold:
+            return
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self.compact, name="faiss-compact", daemon=True)
+        self._compactor.start()
+
+    def compact(self):
+        """Physically drop tombstoned ids from the index (HNSW is rebuilt in the background)
+        and their text from the metadata table"""
+        dead = self.tombstones.ids()
+        if len(dead) == 0:
+            return
+        print(f"[FAISS] Compacting {len(dead)} removed vectors...")
+        self._compact_index(dead)
+        # Removed rows left their text in the append-only store
+        self.metadata.compact_text()
+
+    def _compact_index(self, dead):
+        if self.shards is not None:
+            by_account = {}
+            for faiss_id, account_id in zip(dead.tolist(), self.metadata.account_of(dead)):
+                if account_id is not None:
+                    by_account.setdefault(account_id, []).append(faiss_id)
+            removed = self.shards.compact(by_account)
+            self.tombstones.discard(removed)
+            dead = dead[~np.isin(dead, removed)]
+            if len(dead) == 0:
+                return
+        self._promote()
+        thread = self.index_manager.compact(dead, on_done=self._compacted)
+        if thread is not None:
+            thread.join()
+
+    def _compacted(self, dead):
+        # Runs under the store lock once the dead ids are really gone
+        self.tombstones.discard(dead)
+        self._dirty = True
+
+    def _maybe_checkpoint(self):
+        if self.wal.records_since_checkpoint >= self.checkpoint_records:
+            self._checkpoint_due.set()
+
+    def _checkpoint_loop(self):
+        while not self._stop.is_set():
+            self._checkpoint_due.wait(self.checkpoint_interval)
+            self._checkpoint_due.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.checkpoint()
+            except Exception as e:
+                print(f"[FAISS] Checkpoint failed: {e}")
+
+    def checkpoint(self, force=False):
+        """Write the full index and drop the WAL segments it now covers"""
+        if self.shards is not None:
+            self.shards.checkpoint()
+        with self._checkpoint_lock:
+            with self._lock:
+                if not (force or self._dirty):
+                    return
+                # In-memory copy under the lock; the slow disk write happens outside it
+                data = faiss.serialize_index(self.index)
+                ntotal = self.index.ntotal
+                dead = self.tombstones.ids()
+                covered = self.wal.rotate()
+                self._dirty = False
+                if self.sidecar is not None:
+                    # The WAL segments about to be dropped are the sidecar's only other copy
+                    self.sidecar.flush()
+
+            # New version file (temp + fsync + rename); older versions stay intact
+            snapshot = self.snapshots.write(data, ntotal, self.dim)
+            # Removes in the dropped segments must survive in the tombstone file
+            self.tombstones.save(dead)
+            self.wal.drop_through(covered)
+            self.metadata.save()
+            print(f"[FAISS] Index checkpointed to disk (snapshot v{snapshot['version']}).")
+
+    def save(self):
+        self.checkpoint(force=True)
+
+    def close(self):
+        """Stop the checkpointer and write a final checkpoint"""
+        self._stop.set()
+        self._checkpoint_due.set()
+        self._checkpointer.join()
+        if self._consistency_thread is not None:
+            self._consistency_thread.join()
+        # Let in-flight async adds land before the final checkpoint
+        self._executor.shutdown(wait=True)
+        self.checkpoint()
+        self.wal.close()
+        if self.sidecar is not None:
+            self.sidecar.close()
+        if self.shards is not None:
+            self.shards.close()
+        self.metadata.close()
+
+    def _embeddings_for(self, docs, bulk=False):
+        """Vectors + faiss_ids for metadata docs; docs without a stored embedding are
+        embedded in one bucketed batch through the shared embedding cache"""
+        vectors, ids, to_embed = [], [], []
+        for doc in docs:
+            if doc.get("embedding"):
+                vectors.append(np.array(doc["embedding"], dtype=np.float32))
+                ids.append(doc["faiss_id"])
+            elif doc.get("message"):
+                to_embed.append(doc)
+
+        if to_embed:
+            # Imported lazily so the vector store doesn't pull in the model at import time
+            from embeddings import get_embeddings
+            vectors.extend(get_embeddings([doc["message"] for doc in to_embed], bulk=bulk))
+            ids.extend(doc["faiss_id"] for doc in to_embed)
+
+        return vectors, ids
+
+    def rebuild_index_from_mongo(self):
+        #utility if FAISS index becomes corrupted or lost
+        print("[FAISS] Rebuilding index from MongoDB...")
+        index = new_flat_index(self.dim)
+
+        # Bulk: large re-embeds are sharded across the embedding process pool
+        docs = self.collection.find()
+        if self.shards is not None:
+            # Sharded accounts keep their own index files
+            docs = [doc for doc in docs if not (doc.get("account_id") and self.shards.exists(doc["account_id"]))]
+        vectors, ids = self._embeddings_for(docs, bulk=True)
+
+        if vectors:
+            index.add_with_ids(np.array(vectors), np.array(ids, dtype=np.int64))
+            if self.sidecar is not None:
+                self.sidecar.add(np.array(ids, dtype=np.int64), np.array(vectors))
+
+        # Swap in the rebuilt index; the checkpoint retires the WAL of the old one
+        with self._lock:
+            self.index_manager.replace(index)
+            self._unmapped()
+            self.index_manager.maybe_migrate()
+        self._bump_generation(wide=True)
+        self.save()
+
+    def _conversation_matrix(self, conversation_id, ids):
+        """Cached (ids, vectors) for a small conversation.
+
+        On a miss the vectors are read back from the index (or the sidecar). Only ids
+        it can't return (plain IVF, per-account shard files) cost a Mongo query, and
+        an encode when the doc has no stored embedding.
+        """
+        cached = self.conversations.get_matrix(conversation_id)
+        if cached is not None:
+            return cached
+
+        matrix_ids, matrix = self.index_manager.vectors(ids)
+        missing = np.setdiff1d(ids, matrix_ids)
+        if len(missing):
+            docs = self.collection.find(
+                {"faiss_id": {"$in": missing.tolist()}},
+                {"faiss_id": 1, "embedding": 1, "message": 1}
+            )
+            vectors, more_ids = self._embeddings_for(docs)
+            if more_ids:
+                matrix = np.vstack([matrix, np.array(vectors, dtype=np.float32).reshape(-1, self.dim)])
+                matrix_ids = np.concatenate([matrix_ids, np.array(more_ids, dtype=np.int64)])
+        self.conversations.put_matrix(conversation_id, matrix_ids, matrix)
+        return matrix_ids, matrix
+
+    def vectors(self, ids):
+        """(found ids, stored vectors) for the ids the main index can return (see IndexManager.vectors)"""
+        return self.index_manager.vectors(ids)
+
+    def search_in_conversation(self, query_vector, conversation_id, k=5, fields=None, nprobe=None, ef_search=None):
+        """Search only this conversation's vectors without building a sub-index"""
+        ids = self.conversations.ids(conversation_id)
+        if len(ids) == 0:
+            return []
+
+        query_vector = np.array([query_vector], dtype=np.float32)
+
+        if len(ids) <= self.brute_force_max:
+            # Small conversation: dot products against its cached matrix
+            matrix_ids, matrix = self._conversation_matrix(conversation_id, ids)
+            if len(matrix_ids) == 0:
+                return []
+            scores = matrix @ query_vector[0]
+            top = np.arange(len(scores))
+            if k < len(scores):
+                top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            distances, hits = scores[top][None, :], matrix_ids[top][None, :]
+        else:
+            # Large conversation: filtered search on the index holding it
+            sel = faiss.IDSelectorBatch(ids)
+            account_id = self.metadata.account_of(ids[-1:])[0] if self.shards is not None else None
+            if account_id is not None:
+                distances, hits = self._search_account(query_vector, k, nprobe, ef_search, account_id, sel)
+            else:
+                distances, hits = self.index_manager.search(query_vector, k, nprobe, ef_search, sel=sel)
+
+        return self._hydrate_many(hits, distances, fields)[0]
+
+    # Async API: same calls, run on the store's bounded executor so the event loop never blocks
+    async def _offload(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def aadd(self, vector, message, conversation_id=None, account_id=None, timestamp=None):
+        return await self._offload(self.add, vector, message, conversation_id, account_id, timestamp)
+
+    async def aadd_many(self, vectors, messages, conversation_ids=None, account_ids=None, timestamps=None):
+        return await self._offload(self.add_many, vectors, messages, conversation_ids, account_ids, timestamps)
+
+    async def asearch(self, query_vector, k=5, fields=None, nprobe=None, ef_search=None, account_id=None):
+        return await self._offload(self.search, query_vector, k, fields, nprobe, ef_search, account_id)
+
+    async def asearch_many(self, query_matrix, k=5, fields=None, nprobe=None, ef_search=None, account_id=None):
+        return await self._offload(self.search_many, query_matrix, k, fields, nprobe, ef_search, account_id)
+
+    async def avectors(self, ids):
+        return await self._offload(self.vectors, ids)
+
+    async def asearch_in_conversation(self, query_vector, conversation_id, k=5, fields=None, nprobe=None, ef_search=None):
+        return await self._offload(self.search_in_conversation, query_vector, conversation_id, k, fields,
+                                   nprobe, ef_search)
@@ -0,0 +1,129 @@
+"""
+Deleted-id bookkeeping for the FAISS index.
+
+Removing a vector from FAISS is expensive (flat: shifts the whole array) or
+unsupported (HNSW), so deletes only mark the id dead here. Searches exclude
+dead ids with an IDSelector, and compaction later drops them from the index
+for real.
+
+Sequential ids live in a bitmap indexed by id. Legacy random ids (see
+metadata.LEGACY_ID_FLOOR) go in a small set. The dead ids are written to
+``<path>.npy`` at checkpoints, because once the WAL segments holding the
+removes are dropped that file is their only record.
+"""
+import os
+import threading
+from typing import Optional
+
+import faiss
+import numpy as np
+
+from .metadata import LEGACY_ID_FLOOR
+
+
+class Tombstones:
+    """Set of dead faiss_ids with a cached FAISS exclusion selector."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path + ".npy" if path else None
+        self._lock = threading.Lock()
+        self._bitmap = np.zeros(1024, dtype=bool)
+        self._legacy = set()
+        self._count = 0
+        self._selector = None
+
+        if self.path and os.path.exists(self.path):
+            self.add(np.load(self.path))
+
+    def __len__(self):
+        return self._count
+
+    def add(self, ids) -> int:
+        """Mark ids dead; returns how many weren't already"""
+        ids = np.unique(np.asarray(ids, dtype=np.int64).reshape(-1))
+        ids = ids[ids >= 0]
+        with self._lock:
+            small = ids[ids < LEGACY_ID_FLOOR]
+            if len(small) and small.max() >= len(self._bitmap):
+                size = len(self._bitmap)
+                while size <= small.max():
+                    size *= 2
+                self._bitmap = np.concatenate([self._bitmap, np.zeros(size - len(self._bitmap), dtype=bool)])
+            added = int((~self._bitmap[small]).sum())
+            self._bitmap[small] = True
+            for faiss_id in ids[ids >= LEGACY_ID_FLOOR].tolist():
+                if faiss_id not in self._legacy:
+                    self._legacy.add(faiss_id)
+                    added += 1
+            self._count += added
+            if added:
+                self._selector = None
+            return added
+
+    def discard(self, ids):
+        """Forget ids (after compaction removed them from the index)"""
+        ids = np.unique(np.asarray(ids, dtype=np.int64).reshape(-1))
+        with self._lock:
+            small = ids[(ids >= 0) & (ids < min(LEGACY_ID_FLOOR, len(self._bitmap)))]
+            removed = int(self._bitmap[small].sum())
+            self._bitmap[small] = False
+            for faiss_id in ids[ids >= LEGACY_ID_FLOOR].tolist():
+                if faiss_id in self._legacy:
+                    self._legacy.discard(faiss_id)
+                    removed += 1
+            self._count -= removed
+            if removed:
+                self._selector = None
+
+    def contains(self, ids) -> np.ndarray:
+        """Boolean mask (same shape as ids) of dead ids"""
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            dead = np.zeros(ids.shape, dtype=bool)
+            small = (ids >= 0) & (ids < len(self._bitmap))
+            dead[small] = self._bitmap[ids[small]]
+            if self._legacy:
+                dead |= np.isin(ids, np.fromiter(self._legacy, dtype=np.int64, count=len(self._legacy)))
+            return dead
+
+    def ids(self) -> np.ndarray:
+        """All dead ids, sorted"""
+        with self._lock:
+            legacy = np.fromiter(self._legacy, dtype=np.int64, count=len(self._legacy))
+            return np.sort(np.concatenate([np.flatnonzero(self._bitmap).astype(np.int64), legacy]))
+
+    def selector(self):
+        """IDSelector matching every live id, or None when nothing is dead.
+
+        Rebuilt only after the set changes; the Python objects backing it are
+        attached so they stay alive as long as the selector does.
+        """
+        with self._lock:
+            if self._count == 0:
+                return None
+            if self._selector is None:
+                bitmap = np.packbits(self._bitmap, bitorder="little")
+                # The size is in bytes: ids past the end are then "not dead" instead of
+                # whatever memory follows the array
+                dead = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+                parts = [bitmap, dead]
+                if self._legacy:
+                    legacy = faiss.IDSelectorBatch(np.fromiter(self._legacy, dtype=np.int64, count=len(self._legacy)))
+                    dead = faiss.IDSelectorOr(dead, legacy)
+                    parts += [legacy, dead]
+                selector = faiss.IDSelectorNot(dead)
+                selector.referenced_objects = parts
+                self._selector = selector
+            return self._selector
+
+    def save(self, ids: Optional[np.ndarray] = None):
+        """Durably write the dead ids (pass a snapshot taken under the store lock)"""
+        if not self.path:
+            return
+        ids = self.ids() if ids is None else ids
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as fh:
+            np.save(fh, ids)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,179 @@
+"""
+Append-only write-ahead log for the FAISS index.
+
+Every mutation is appended as a small record instead of rewriting the whole
+index, so an add costs O(1) disk I/O. Concurrent writers share fsyncs (group
+commit): whoever commits first syncs everything appended so far and the
+others just wait for it.
+
+The log is split into numbered segments (``<index>.wal.<n>``). A checkpoint
+rotates to a new segment, writes the full index, and then deletes the
+segments it covers. Recovery replays every remaining segment in order.
+
+Record layout: op (u8), faiss_id (i64), payload length (u32), crc32 (u32),
+followed by the payload (float32 vector for adds, empty for removes).
+"""
+import glob
+import logging
+import os
+import struct
+import threading
+import zlib
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+OP_ADD = 1
+OP_REMOVE = 2
+
+HEADER = struct.Struct("<BqII")
+
+
+def _crc(op: int, faiss_id: int, payload: bytes) -> int:
+    return zlib.crc32(payload, zlib.crc32(struct.pack("<Bq", op, faiss_id)))
+
+
+class WriteAheadLog:
+    """Segmented append-only log of (op, id, vector) records with group-commit fsync."""
+
+    def __init__(self, base_path: str, dim: int):
+        self.base_path = base_path
+        self.dim = dim
+        self._cond = threading.Condition()
+        self._seq = 0          # records appended
+        self._synced = 0       # records known to be on disk
+        self._syncing = False
+        self.records_since_checkpoint = 0
+
+        segments = self.segments()
+        self.segment = (segments[-1] if segments else 0) + 1
+        self._fh = open(self._segment_path(self.segment), "ab")
+
+    # ─────────────────────────────────────────────────────────────────────
+    #  Segments
+    # ─────────────────────────────────────────────────────────────────────
+    def _segment_path(self, n: int) -> str:
+        return f"{self.base_path}.{n}"
+
+    def segments(self) -> List[int]:
+        """Existing segment numbers, oldest first"""
+        numbers = []
+        for path in glob.glob(glob.escape(self.base_path) + ".*"):
+            suffix = path.rsplit(".", 1)[-1]
+            if suffix.isdigit():
+                numbers.append(int(suffix))
+        return sorted(numbers)
+
+    def rotate(self) -> int:
+        """Start a new segment and return the number of the one just closed"""
+        with self._cond:
+            # Don't pull the file out from under an in-flight group fsync
+            while self._syncing:
+                self._cond.wait()
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self._fh.close()
+            closed = self.segment
+            self.segment += 1
+            self._fh = open(self._segment_path(self.segment), "ab")
+            self._synced = self._seq
+            self.records_since_checkpoint = 0
+            return closed
+
+    def drop_through(self, segment: int):
+        """Delete segments <= segment once a checkpoint covers them"""
+        for n in self.segments():
+            if n <= segment:
+                os.remove(self._segment_path(n))
+
+    # ─────────────────────────────────────────────────────────────────────
+    #  Writing
+    # ─────────────────────────────────────────────────────────────────────
+    def append(self, op: int, faiss_id: int, vector: Optional[np.ndarray] = None) -> int:
+        """Append a record (buffered) and return its sequence number for commit()"""
+        payload = b"" if vector is None else np.asarray(vector, dtype=np.float32).tobytes()
+        record = HEADER.pack(op, int(faiss_id), len(payload), _crc(op, int(faiss_id), payload)) + payload
+        with self._cond:
+            self._fh.write(record)
+            self._seq += 1
+            self.records_since_checkpoint += 1
+            return self._seq
+
+    def append_many(self, op: int, faiss_ids, vectors=None) -> int:
+        """Append a batch of records in one write and return the last sequence number"""
+        parts = []
+        for i, faiss_id in enumerate(faiss_ids):
+            payload = b"" if vectors is None else np.asarray(vectors[i], dtype=np.float32).tobytes()
+            parts.append(HEADER.pack(op, int(faiss_id), len(payload), _crc(op, int(faiss_id), payload)))
+            parts.append(payload)
+        with self._cond:
+            self._fh.write(b"".join(parts))
+            self._seq += len(faiss_ids)
+            self.records_since_checkpoint += len(faiss_ids)
+            return self._seq
+
+    def commit(self, seq: int):
+        """Block until record `seq` is durable; one fsync covers every writer waiting"""
+        with self._cond:
+            while self._synced < seq:
+                if self._syncing:
+                    self._cond.wait()
+                    continue
+                # Become the leader for this group
+                self._syncing = True
+                target = self._seq
+                fh = self._fh
+                fh.flush()
+                break
+            else:
+                return
+
+        try:
+            os.fsync(fh.fileno())
+        finally:
+            with self._cond:
+                self._synced = max(self._synced, target)
+                self._syncing = False
+                self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            while self._syncing:
+                self._cond.wait()
+            if not self._fh.closed:
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+                self._fh.close()
+
+    # ─────────────────────────────────────────────────────────────────────
+    #  Recovery
+    # ─────────────────────────────────────────────────────────────────────
+    def replay(self) -> Iterator[Tuple[int, int, Optional[np.ndarray]]]:
+        """Yield (op, faiss_id, vector) for every intact record, oldest first.
+
+        A torn or corrupt tail (crash mid-append) ends the segment and is truncated away.
+        """
+        for n in self.segments():
+            path = self._segment_path(n)
+            with open(path, "rb") as fh:
+                data = fh.read()
+
+            offset = 0
+            while offset + HEADER.size <= len(data):
+                op, faiss_id, length, crc = HEADER.unpack_from(data, offset)
+                start = offset + HEADER.size
+                payload = data[start:start + length]
+                if len(payload) != length or _crc(op, faiss_id, payload) != crc:
+                    break
+                vector = np.frombuffer(payload, dtype=np.float32) if length else None
+                yield op, faiss_id, vector
+                offset = start + length
+
+            if offset != len(data):
+                logger.warning(f"WAL segment {path} has a torn tail at byte {offset}, truncating")
+                if n == self.segment:
+                    self._fh.flush()
+                with open(path, "r+b") as fh:
+                    fh.truncate(offset)